@@ -0,0 +1,122 @@
+from OpenGL.GL import GL_RGBA
+
+from numpy import ceil, floor, pad, uint8, zeros
+
+from textureCache import ImagePixels
+
+
+# Las texturas quedan alineadas a 2 ** maxLevel pixeles y se generan mipmaps
+# solo hasta maxLevel, para que ningun nivel mezcle texturas vecinas
+maxLevel = 2
+alignment = 2 ** maxLevel
+
+# Relleno minimo alrededor de cada textura, en pixeles del nivel 0; cubre el
+# filtrado bilineal hasta el ultimo nivel de mipmap
+margin = alignment
+
+# Cuanto puede salirse un triangulo de su repeticion [0, 1] de la textura
+# (en repeticiones) y seguir dibujandose desde el atlas
+maxOverhang = 1.0
+
+
+def TriangleShifts(texCoords):
+	"""Para cada triangulo (T, 3, 2) devuelve el desplazamiento entero que
+	lleva su centro a la repeticion [0, 1] de la textura, y cuanto se sale de
+	esa repeticion despues de desplazarlo (en repeticiones, por eje)"""
+	shifts = floor(texCoords.mean(axis = 1))
+	local = texCoords - shifts[:, None, :]
+	overhangs = zeros(shifts.shape, dtype = texCoords.dtype)
+	if len(local):
+		overhangs = (-local.min(axis = 1)).clip(0)
+		overhangs = overhangs.clip(local.max(axis = 1) - 1)
+	return shifts, overhangs
+
+
+class TextureAtlas(object):
+	"""Empaqueta varias texturas en una sola.
+
+	Cada textura se rodea de un borde que repite la textura (como GL_REPEAT),
+	de al menos margin pixeles mas lo que se salgan sus triangulos, asi que
+	las coordenadas que pasan de [0, 1] siguen viendo la textura correcta en
+	lugar de la vecina. Las texturas se ubican en estantes ordenados por alto."""
+
+	def __init__(self, sizes, overhangs, maxSize):
+		# sizes: (ancho, alto) de cada textura; overhangs: (u, v) en repeticiones
+		self.rects = []
+		for (width, height), (overhangU, overhangV) in zip(sizes, overhangs):
+			padX = int(ceil(overhangU * width)) + margin
+			padY = int(ceil(overhangV * height)) + margin
+			self.rects.append({'x': 0, 'y': 0,
+							   'width': width, 'height': height,
+							   'padX': padX, 'padY': padY,
+							   'outerWidth': self.Align(width + 2 * padX),
+							   'outerHeight': self.Align(height + 2 * padY)})
+
+		# Ancho de potencia de 2 para el area total, agrandado hasta que entren
+		area = sum(rect['outerWidth'] * rect['outerHeight'] for rect in self.rects)
+		self.width = max(max(rect['outerWidth'] for rect in self.rects), 1)
+		self.width = 1 << (self.width - 1).bit_length()
+		while self.width * self.width < area:
+			self.width *= 2
+
+		self.height = None
+		while self.width <= maxSize:
+			self.height = self.Pack()
+			if self.height <= maxSize:
+				break
+			self.width *= 2
+			self.height = None
+
+
+	def Align(self, size):
+		return (size + alignment - 1) // alignment * alignment
+
+
+	def Pack(self):
+		"""Ubica las texturas en estantes para el ancho actual; devuelve el alto"""
+		order = sorted(range(len(self.rects)), key = lambda i: -self.rects[i]['outerHeight'])
+		x = y = shelfHeight = 0
+		for i in order:
+			rect = self.rects[i]
+			if x + rect['outerWidth'] > self.width:
+				x = 0
+				y += shelfHeight
+				shelfHeight = 0
+			rect['x'], rect['y'] = x, y
+			x += rect['outerWidth']
+			shelfHeight = max(shelfHeight, rect['outerHeight'])
+		return y + shelfHeight
+
+
+	def IsValid(self):
+		return self.height is not None
+
+
+	def Compose(self, images):
+		"""Imagen RGBA del atlas (en el formato de DecodeTexture), con las
+		imagenes en el mismo orden que sizes"""
+		pixels = zeros((self.height, self.width, 4), dtype = uint8)
+
+		for rect, image in zip(self.rects, images):
+			texture = ImagePixels(image)
+			padRight = rect['outerWidth'] - rect['width'] - rect['padX']
+			padTop = rect['outerHeight'] - rect['height'] - rect['padY']
+
+			# Filas de abajo hacia arriba, como las deja DecodeTexture
+			tile = pad(texture, ((rect['padY'], padTop), (rect['padX'], padRight), (0, 0)), mode = 'wrap')
+			pixels[rect['y']:rect['y'] + rect['outerHeight'], rect['x']:rect['x'] + rect['outerWidth']] = tile
+
+		return {'data': pixels.tobytes(),
+				'width': self.width,
+				'height': self.height,
+				'format': GL_RGBA,
+				'maxLevel': maxLevel}
+
+
+	def Remap(self, texCoords, index):
+		"""Lleva coordenadas (ya desplazadas a su repeticion) de la textura
+		index a las coordenadas del atlas"""
+		rect = self.rects[index]
+		u = (rect['x'] + rect['padX'] + texCoords[:, 0] * rect['width']) / self.width
+		v = (rect['y'] + rect['padY'] + texCoords[:, 1] * rect['height']) / self.height
+		return u, v
@@ -1,36 +1,119 @@
 import glm # pip install PyGLM
 from OpenGL.GL import *
-from numpy import array, float32
+from numpy import array, ascontiguousarray, asarray, float32, ndarray
 
 
 class Buffer(object):
-	def __init__(self, data):
-		self.data = data
+	def __init__(self, data, usage = GL_STATIC_DRAW, target = GL_ARRAY_BUFFER):
+		# Vertex Buffer. Los arreglos de numpy (por ejemplo un arreglo
+		# estructurado con vertices intercalados, o un memmap del cache de
+		# mallas) se usan tal cual, sin copiarlos; las listas se convierten
+		# y no se guardan
+		if isinstance(data, ndarray):
+			self.vertexBuffer = data
+		else:
+			self.vertexBuffer = array(data, dtype = float32)
 
-		# Vertex Buffer 
-		self.vertexBuffer = array(self.data, dtype = float32)
+		# GL_STATIC_DRAW para mallas fijas, GL_DYNAMIC_DRAW / GL_STREAM_DRAW
+		# para mallas que se actualizan con Update() u Orphan()
+		self.usage = usage
+
+		# GL_ARRAY_BUFFER para vertices, GL_ELEMENT_ARRAY_BUFFER para indices.
+		# Un buffer de indices queda grabado en el VAO que este enlazado al
+		# crearlo o actualizarlo
+		self.target = target
 
 		# Vertex Buffer Object
 		self.VBO = glGenBuffers(1)
 
+		# Mandar la informacion de vertices una sola vez, al construir el buffer
+		self.Upload()
 
-	def Use(self, attribNumber, size):
 
-		glBindBuffer(GL_ARRAY_BUFFER, self.VBO)
+	def Upload(self):
+		glBindBuffer(self.target, self.VBO)
 
-		# Mandar la informacion de vertices
-		glBufferData(GL_ARRAY_BUFFER,               # Buffer ID
+		glBufferData(self.target,                 # Buffer ID
 					 self.vertexBuffer.nbytes,      # Buffer size in bytes
-					 self.vertexBuffer,             # Buffer data
-					 GL_STATIC_DRAW)                # Usage
+					 self.Pointer(),                # Buffer data
+					 self.usage)                    # Usage
+
+		# Capacidad reservada en la GPU, en bytes
+		self.capacity = self.vertexBuffer.nbytes
+
+
+	def Pointer(self):
+		"""Puntero a los datos del arreglo; asi PyOpenGL no hace copias de
+		arreglos estructurados o de solo lectura"""
+		if not self.vertexBuffer.flags.c_contiguous:
+			self.vertexBuffer = ascontiguousarray(self.vertexBuffer)
+		return ctypes.c_void_p(self.vertexBuffer.ctypes.data)
+
+
+	def Update(self, data, offset = 0):
+		"""Reemplaza parte del contenido del buffer con glBufferSubData.
+		offset se mide en elementos del buffer (floats, o vertices si el
+		buffer es intercalado). Si los datos no caben, se realoja el buffer."""
+		values = asarray(data, dtype = self.vertexBuffer.dtype).ravel()
+
+		end = offset + values.size
+		if end * values.itemsize > self.capacity:
+			# No cabe: ampliar la copia local y realojar con el nuevo tamaño
+			grown = self.vertexBuffer.copy()
+			grown.resize(end, refcheck = False)
+			grown[offset:end] = values
+			self.vertexBuffer = grown
+			self.Upload()
+			return
+
+		# Los arreglos mapeados desde el cache de mallas son de solo lectura
+		if not self.vertexBuffer.flags.writeable:
+			self.vertexBuffer = array(self.vertexBuffer)
+		self.vertexBuffer[offset:end] = values
+
+		glBindBuffer(self.target, self.VBO)
+		glBufferSubData(self.target,
+						offset * values.itemsize,
+						values.nbytes,
+						values)
+
+
+	def Orphan(self, data):
+		"""Reemplaza todo el contenido del buffer. Se le entrega al driver un
+		almacenamiento nuevo (orphaning) para no esperar a que la GPU termine
+		de usar el anterior; pensado para mallas que cambian cada frame."""
+		self.vertexBuffer = asarray(data, dtype = self.vertexBuffer.dtype).ravel()
+
+		glBindBuffer(self.target, self.VBO)
+
+		if self.vertexBuffer.nbytes != self.capacity:
+			glBufferData(self.target, self.vertexBuffer.nbytes, self.Pointer(), self.usage)
+			self.capacity = self.vertexBuffer.nbytes
+		else:
+			glBufferData(self.target, self.capacity, None, self.usage)
+			glBufferSubData(self.target, 0, self.vertexBuffer.nbytes, self.Pointer())
+
+
+	def Delete(self):
+		glDeleteBuffers(1, [self.VBO])
+		self.VBO = 0
+
+
+	def Use(self, attribNumber, size, stride = 0, offset = 0, divisor = 0):
+
+		# Los datos ya estan en la GPU, solo se enlaza el buffer
+		glBindBuffer(self.target, self.VBO)
 
 		# Atributo
 		glVertexAttribPointer(attribNumber,			# Attribute Number
 							  size,					# Size
 							  GL_FLOAT,				# Type
 							  GL_FALSE,				# Is it normalized?
-							  0,					# Stride
-							  ctypes.c_void_p(0))	# Offset
+							  stride,				# Stride
+							  ctypes.c_void_p(offset))	# Offset
 
 		glEnableVertexAttribArray(attribNumber)
-		
\ No newline at end of file
+
+		# divisor 1: el atributo avanza una vez por instancia, no por vertice
+		if divisor:
+			glVertexAttribDivisor(attribNumber, divisor)
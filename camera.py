@@ -13,6 +13,12 @@ class Camera(object):
 		self.rotation = glm.vec3(0,0,0)
 
 		self.viewMatrix = glm.mat4(1)
+		self.viewProjectionMatrix = glm.mat4(1)
+
+		# Parametros con los que se calcularon las matrices; si cambian, las
+		# matrices estan sucias y Update() las recalcula
+		self.viewKey = None
+		self.viewProjectionDirty = True
 
 		self.CreateProjectionMatrix(60, 0.1, 1000)
 		
@@ -37,35 +43,72 @@ class Camera(object):
 		self.zoomSensitivity = 1.0
 
 
-	def GetViewMatrix(self):
+	def ViewKey(self):
+		"""Todo lo que define la view matrix en el modo actual"""
+		if self.orbitalMode:
+			return (True, tuple(self.target), self.angleH, self.angleV, self.distance)
+		return (False, tuple(self.position), tuple(self.rotation))
+
+
+	def Update(self):
+		"""Recalcula view y view-projection solo si cambio la camara. El
+		Renderer lo llama una vez al empezar cada frame; despues viewMatrix,
+		projectionMatrix y viewProjectionMatrix se leen directamente"""
 		if self.orbitalMode:
-			# Modo orbital: calcular posición desde ángulos esféricos
-			return self.GetOrbitalViewMatrix()
-		else:
-			# Modo libre original
-			identity = glm.mat4(1)
+			self.ClampOrbit()
 
-			translateMat = glm.translate(identity, self.position)
+		key = self.ViewKey()
+		if key != self.viewKey:
+			self.viewKey = key
+			if self.orbitalMode:
+				self.viewMatrix = self.GetOrbitalViewMatrix()
+			else:
+				self.viewMatrix = self.GetFreeViewMatrix()
+			self.viewProjectionDirty = True
 
-			pitchMat = glm.rotate(identity, glm.radians(self.rotation.x), glm.vec3(1,0,0))
-			yawMat =   glm.rotate(identity, glm.radians(self.rotation.y), glm.vec3(0,1,0))
-			rollMat =  glm.rotate(identity, glm.radians(self.rotation.z), glm.vec3(0,0,1))
+		if self.viewProjectionDirty:
+			self.viewProjectionMatrix = self.projectionMatrix * self.viewMatrix
+			self.viewProjectionDirty = False
 
-			rotationMat = pitchMat * yawMat * rollMat
 
-			camMat = translateMat * rotationMat
+	def GetViewMatrix(self):
+		self.Update()
+		return self.viewMatrix
 
-			self.viewMatrix = glm.inverse(camMat)
 
-			return self.viewMatrix
+	def GetViewProjectionMatrix(self):
+		self.Update()
+		return self.viewProjectionMatrix
 
 
-	def GetOrbitalViewMatrix(self):
-		"""Calcula la view matrix en modo orbital"""
-		# Limitar valores
+	def GetFreeViewMatrix(self):
+		"""Calcula la view matrix en modo libre"""
+		identity = glm.mat4(1)
+
+		translateMat = glm.translate(identity, self.position)
+
+		pitchMat = glm.rotate(identity, glm.radians(self.rotation.x), glm.vec3(1,0,0))
+		yawMat =   glm.rotate(identity, glm.radians(self.rotation.y), glm.vec3(0,1,0))
+		rollMat =  glm.rotate(identity, glm.radians(self.rotation.z), glm.vec3(0,0,1))
+
+		rotationMat = pitchMat * yawMat * rollMat
+
+		camMat = translateMat * rotationMat
+
+		return glm.inverse(camMat)
+
+
+	def ClampOrbit(self):
+		"""Limita angulos y distancia del modo orbital"""
 		self.angleH = max(self.minAngleH, min(self.maxAngleH, self.angleH))
 		self.angleV = max(self.minAngleV, min(self.maxAngleV, self.angleV))
 		self.distance = max(self.minDistance, min(self.maxDistance, self.distance))
+
+
+	def GetOrbitalViewMatrix(self):
+		"""Calcula la view matrix en modo orbital y la guarda en viewMatrix"""
+		# Limitar valores
+		self.ClampOrbit()
 		
 		# Convertir ángulos a radianes
 		angleHRad = math.radians(self.angleH)
@@ -80,6 +123,7 @@ class Camera(object):
 		
 		# Usar lookAt para generar la view matrix
 		self.viewMatrix = glm.lookAt(cameraPos, self.target, glm.vec3(0, 1, 0))
+		self.viewProjectionDirty = True
 		
 		return self.viewMatrix
 
@@ -105,4 +149,5 @@ class Camera(object):
 
 
 	def CreateProjectionMatrix(self, fov, nearPlane, farPlane):
-		self.projectionMatrix = glm.perspective( glm.radians(fov), self.screenWidth / self.screenHeight, nearPlane, farPlane)
\ No newline at end of file
+		self.projectionMatrix = glm.perspective( glm.radians(fov), self.screenWidth / self.screenHeight, nearPlane, farPlane)
+		self.viewProjectionDirty = True
\ No newline at end of file
@@ -9,16 +9,22 @@ in vec4 fragPosition;
 
 out vec4 fragColor;
 
-uniform sampler2D tex0;
-uniform vec3 pointLight;
-uniform float ambientLight;
+#include "TextureSampler"
+
+#include "FrameUniforms"
+
+#include "InstancedFragment"
 
 void main()
 {
+#include "InstancedFragmentMain"
+
     vec3 lightDir = normalize(pointLight - fragPosition.xyz);
     float intensity = max( 0 , dot(fragNormal, lightDir)) + ambientLight;
 
-    fragColor = texture(tex0, fragTexCoords) * intensity;
+    fragColor = SampleTex0(fragTexCoords) * intensity;
+
+#include "InstancedFragmentTint"
 }
 
 '''
@@ -34,8 +40,11 @@ in vec4 fragPosition;
 
 out vec4 fragColor;
 
-uniform float time;
-uniform sampler2D tex0;
+#include "FrameUniforms"
+
+#include "InstancedFragment"
+
+#include "TextureSampler"
 
 // Función para convertir HSV a RGB
 vec3 hsv2rgb(vec3 c) {
@@ -46,24 +55,28 @@ vec3 hsv2rgb(vec3 c) {
 
 void main()
 {
+#include "InstancedFragmentMain"
+
     // Crear un gradiente basado en posición y tiempo
-    float hue = fract(fragPosition.x * 0.1 + fragPosition.y * 0.1 + fragPosition.z * 0.1 + time * 0.3);
+    float hue = fract(fragPosition.x * 0.1 + fragPosition.y * 0.1 + fragPosition.z * 0.1 + instanceTime * 0.3);
     
     // Añadir ondas para hacer el arcoíris más dinámico
-    hue += sin(fragPosition.y * 3.0 + time * 2.0) * 0.1;
-    hue += cos(fragPosition.x * 2.0 - time * 1.5) * 0.1;
+    hue += sin(fragPosition.y * 3.0 + instanceTime * 2.0) * 0.1;
+    hue += cos(fragPosition.x * 2.0 - instanceTime * 1.5) * 0.1;
     
     // Variar saturación y brillo con el tiempo para efecto pulsante
-    float saturation = 0.8 + sin(time * 3.0) * 0.2;
-    float value = 0.9 + cos(time * 2.5) * 0.1;
+    float saturation = 0.8 + sin(instanceTime * 3.0) * 0.2;
+    float value = 0.9 + cos(instanceTime * 2.5) * 0.1;
     
     vec3 rainbowColor = hsv2rgb(vec3(hue, saturation, value));
     
     // Mezclar con la textura original
-    vec3 texColor = texture(tex0, fragTexCoords).rgb;
+    vec3 texColor = SampleTex0(fragTexCoords).rgb;
     vec3 finalColor = mix(texColor, rainbowColor, 0.7);
     
     fragColor = vec4(finalColor, 1.0);
+
+#include "InstancedFragmentTint"
 }
 '''
 
@@ -78,8 +91,11 @@ in vec4 fragPosition;
 
 out vec4 fragColor;
 
-uniform float time;
-uniform sampler2D tex0;
+#include "FrameUniforms"
+
+#include "InstancedFragment"
+
+#include "TextureSampler"
 
 // Función de ruido hash
 float hash(vec3 p) {
@@ -118,17 +134,19 @@ float fbm(vec3 p) {
 }
 
 // Función para crear estrellas parpadeantes
-float stars(vec3 p, float threshold) {
+float stars(vec3 p, float threshold, float instanceTime) {
     float n = hash(floor(p));
-    float twinkle = sin(time * 3.0 + n * 6.28) * 0.5 + 0.5;
+    float twinkle = sin(instanceTime * 3.0 + n * 6.28) * 0.5 + 0.5;
     return (n > threshold) ? twinkle : 0.0;
 }
 
 void main()
 {
+#include "InstancedFragmentMain"
+
     // Coordenadas espaciales animadas
     vec3 pos = fragPosition.xyz * 2.0;
-    vec3 animatedPos = pos + vec3(time * 0.1, time * 0.05, time * 0.08);
+    vec3 animatedPos = pos + vec3(instanceTime * 0.1, instanceTime * 0.05, instanceTime * 0.08);
     
     // Crear nebulosas con FBM
     float nebula1 = fbm(animatedPos * 0.8);
@@ -148,9 +166,9 @@ void main()
     
     // Añadir variación temporal a los colores
     nebulaColor += vec3(
-        sin(time * 0.5 + nebula1 * 3.14) * 0.1,
-        cos(time * 0.3 + nebula2 * 3.14) * 0.1,
-        sin(time * 0.7 + nebula3 * 3.14) * 0.1
+        sin(instanceTime * 0.5 + nebula1 * 3.14) * 0.1,
+        cos(instanceTime * 0.3 + nebula2 * 3.14) * 0.1,
+        sin(instanceTime * 0.7 + nebula3 * 3.14) * 0.1
     );
     
     // Aumentar intensidad en zonas densas de nebulosa
@@ -162,15 +180,15 @@ void main()
     vec3 starPos2 = pos * 25.0 + vec3(100.0);
     vec3 starPos3 = pos * 40.0 + vec3(200.0);
     
-    float starField = stars(starPos1, 0.995) * 0.8;
-    starField += stars(starPos2, 0.997) * 0.6;
-    starField += stars(starPos3, 0.998) * 1.0;
+    float starField = stars(starPos1, 0.995, instanceTime) * 0.8;
+    starField += stars(starPos2, 0.997, instanceTime) * 0.6;
+    starField += stars(starPos3, 0.998, instanceTime) * 1.0;
     
     // Color de estrellas (blanco brillante con tinte azulado)
     vec3 starColor = vec3(1.0, 0.95, 0.9) * starField;
     
     // Añadir algunas estrellas de colores
-    float coloredStars = stars(pos * 20.0, 0.998);
+    float coloredStars = stars(pos * 20.0, 0.998, instanceTime);
     if(coloredStars > 0.5) {
         float starHue = hash(floor(pos * 20.0));
         if(starHue < 0.33)
@@ -189,14 +207,16 @@ void main()
     cosmicColor += vec3(0.6, 0.3, 0.8) * brightCore * 0.5;
     
     // Efecto de profundidad basado en la posición
-    float depth = sin(pos.x * 0.5 + time * 0.2) * cos(pos.z * 0.5 - time * 0.15);
+    float depth = sin(pos.x * 0.5 + instanceTime * 0.2) * cos(pos.z * 0.5 - instanceTime * 0.15);
     cosmicColor *= 0.8 + depth * 0.2;
     
     // Mezclar sutilmente con la textura original
-    vec3 texColor = texture(tex0, fragTexCoords).rgb;
+    vec3 texColor = SampleTex0(fragTexCoords).rgb;
     vec3 finalColor = mix(cosmicColor, texColor * cosmicColor, 0.2);
     
     fragColor = vec4(finalColor, 1.0);
+
+#include "InstancedFragmentTint"
 }
 '''
 
@@ -211,8 +231,11 @@ in vec4 fragPosition;
 
 out vec4 fragColor;
 
-uniform float time;
-uniform sampler2D tex0;
+#include "FrameUniforms"
+
+#include "InstancedFragment"
+
+#include "TextureSampler"
 
 // Función de ruido simplificado
 float noise(vec2 p) {
@@ -220,7 +243,7 @@ float noise(vec2 p) {
 }
 
 // Patrón de Voronoi simplificado
-float voronoi(vec2 p) {
+float voronoi(vec2 p, float instanceTime) {
     vec2 n = floor(p);
     vec2 f = fract(p);
     
@@ -229,8 +252,8 @@ float voronoi(vec2 p) {
         for(int i = -1; i <= 1; i++) {
             vec2 neighbor = vec2(float(i), float(j));
             vec2 point = noise(n + neighbor) * vec2(
-                sin(time + noise(n + neighbor) * 6.28),
-                cos(time + noise(n + neighbor) * 6.28)
+                sin(instanceTime + noise(n + neighbor) * 6.28),
+                cos(instanceTime + noise(n + neighbor) * 6.28)
             );
             vec2 diff = neighbor + point - f;
             float dist = length(diff);
@@ -251,17 +274,19 @@ float hexPattern(vec2 p) {
 
 void main()
 {
+#include "InstancedFragmentMain"
+
     // Coordenadas para los patrones
-    vec2 uv = fragPosition.xz * 2.0 + time * 0.1;
+    vec2 uv = fragPosition.xz * 2.0 + instanceTime * 0.1;
     
     // Combinar múltiples patrones
-    float pattern1 = voronoi(uv * 3.0);
-    float pattern2 = hexPattern(fragPosition.xy * 10.0 + time * 0.2);
-    float pattern3 = sin(fragPosition.x * 10.0 + time) * cos(fragPosition.y * 10.0 - time);
+    float pattern1 = voronoi(uv * 3.0, instanceTime);
+    float pattern2 = hexPattern(fragPosition.xy * 10.0 + instanceTime * 0.2);
+    float pattern3 = sin(fragPosition.x * 10.0 + instanceTime) * cos(fragPosition.y * 10.0 - instanceTime);
     
     // Crear ondas circulares
     float dist = length(fragPosition.xz);
-    float circles = sin(dist * 15.0 - time * 3.0) * 0.5 + 0.5;
+    float circles = sin(dist * 15.0 - instanceTime * 3.0) * 0.5 + 0.5;
     
     // Combinar patrones con pesos animados
     float combined = pattern1 * 0.3 + 
@@ -275,10 +300,10 @@ void main()
     vec3 color3 = vec3(0.3, 1.0, 0.5); // Verde
     
     vec3 patternColor = mix(color1, color2, combined);
-    patternColor = mix(patternColor, color3, sin(time + combined * 3.14) * 0.5 + 0.5);
+    patternColor = mix(patternColor, color3, sin(instanceTime + combined * 3.14) * 0.5 + 0.5);
     
     // Mezclar con textura base
-    vec3 texColor = texture(tex0, fragTexCoords).rgb;
+    vec3 texColor = SampleTex0(fragTexCoords).rgb;
     vec3 finalColor = mix(texColor * 0.3, patternColor, 0.8);
     
     // Añadir brillo en las líneas del patrón
@@ -286,6 +311,8 @@ void main()
     finalColor += vec3(1.0) * edge * 0.5;
     
     fragColor = vec4(finalColor, 1.0);
+
+#include "InstancedFragmentTint"
 }
 '''
 
@@ -0,0 +1,67 @@
+from OpenGL.GL import *
+
+from numpy import float32, frombuffer, zeros
+
+
+# Bloque de uniforms por frame y su punto de enlace, el mismo en todos los
+# shaders. Los shaders #version 330 no pueden fijar el binding en GLSL, asi
+# que Shader lo asigna con glUniformBlockBinding al enlazar
+frameBlock = "FrameUniforms"
+frameBinding = 0
+
+
+class FrameUniforms(object):
+	"""Uniform Buffer Object (std140) con los uniforms que son iguales para
+	todos los objetos de un frame. Los shaders lo incluyen desde shaderBlocks.py:
+
+		layout (std140) uniform FrameUniforms
+		{
+			mat4 viewMatrix;        // offset 0
+			mat4 projectionMatrix;  // offset 64
+			vec3 pointLight;        // offset 128
+			float ambientLight;     // offset 140 (ocupa el hueco del vec3)
+			float time;             // offset 144
+			float value;            // offset 148
+		};
+
+	Update() se llama una vez por frame; si nada cambio no se sube."""
+
+	size = 160
+
+	def __init__(self, binding = frameBinding):
+		self.binding = binding
+		self.data = None
+
+		self.uploads = 0
+
+		self.buffer = glGenBuffers(1)
+		glBindBuffer(GL_UNIFORM_BUFFER, self.buffer)
+		glBufferData(GL_UNIFORM_BUFFER, self.size, None, GL_DYNAMIC_DRAW)
+		glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+		glBindBufferBase(GL_UNIFORM_BUFFER, self.binding, self.buffer)
+
+
+	def Update(self, viewMatrix, projectionMatrix, pointLight, ambientLight, time, value):
+		data = zeros(self.size // 4, dtype = float32)
+
+		# Los bytes de glm van por columnas, igual que std140 (array() de una
+		# matriz glm en cambio la recorre por filas)
+		data[0:16] = frombuffer(viewMatrix.to_bytes(), dtype = float32)
+		data[16:32] = frombuffer(projectionMatrix.to_bytes(), dtype = float32)
+		data[32:35] = pointLight
+		data[35] = ambientLight
+		data[36] = time
+		data[37] = value
+
+		if self.data is not None and (data == self.data).all():
+			return
+
+		glBindBufferBase(GL_UNIFORM_BUFFER, self.binding, self.buffer)
+		glBufferSubData(GL_UNIFORM_BUFFER, 0, data.nbytes, data)
+		self.data = data
+		self.uploads += 1
+
+
+	def Delete(self):
+		glDeleteBuffers(1, [self.buffer])
@@ -0,0 +1,80 @@
+import glm
+
+from numpy import sqrt
+
+
+def Bounds(positions):
+	"""Caja alineada a los ejes y esfera que la envuelve para un arreglo de
+	posiciones (N, 3) en espacio de objeto; None si no hay posiciones"""
+	if len(positions) == 0:
+		return None
+
+	low = positions.min(axis = 0)
+	high = positions.max(axis = 0)
+	center = (low + high) * 0.5
+	radius = float(sqrt(((positions - center) ** 2).sum(axis = 1).max()))
+
+	return {'min': glm.vec3(*low.tolist()),
+			'max': glm.vec3(*high.tolist()),
+			'center': glm.vec3(*center.tolist()),
+			'radius': radius}
+
+
+class Frustum(object):
+	"""Los seis planos del volumen de vista, sacados de la matriz
+	view-projection (Gribb y Hartmann). Cada plano es un vec4 (normal, d)
+	normalizado, con la normal hacia adentro."""
+
+	def __init__(self):
+		self.planes = []
+
+
+	def Update(self, viewProjectionMatrix):
+		m = glm.transpose(viewProjectionMatrix)  # m[i] = fila i
+		self.planes = []
+		for plane in (m[3] + m[0], m[3] - m[0],   # izquierda, derecha
+					  m[3] + m[1], m[3] - m[1],   # abajo, arriba
+					  m[3] + m[2], m[3] - m[2]):  # cerca, lejos
+			self.planes.append(plane / glm.length(glm.vec3(plane)))
+
+
+	def IsVisible(self, bounds, modelMatrix, padding = 0.0):
+		"""False si bounds (en espacio de objeto), transformado por modelMatrix,
+		queda completamente fuera del volumen de vista. padding agranda los
+		volumenes en espacio de objeto, para shaders que mueven los vertices"""
+		if bounds is None or not self.planes:
+			return True
+
+		# Primero la esfera: el radio crece con la mayor escala de la matriz
+		center = glm.vec3(modelMatrix * glm.vec4(bounds['center'], 1.0))
+		scale = max(glm.length(glm.vec3(modelMatrix[0])),
+					glm.length(glm.vec3(modelMatrix[1])),
+					glm.length(glm.vec3(modelMatrix[2])))
+		radius = (bounds['radius'] + padding) * scale
+
+		inside = True
+		for plane in self.planes:
+			distance = glm.dot(glm.vec3(plane), center) + plane.w
+			if distance < -radius:
+				return False
+			if distance < radius:
+				inside = False
+		if inside:
+			return True
+
+		# La esfera corta algun plano: probar la caja, llevada a una caja
+		# alineada a los ejes del mundo (centro transformado y extension por
+		# el valor absoluto de la parte 3x3)
+		boxCenter = glm.vec3(modelMatrix * glm.vec4((bounds['min'] + bounds['max']) * 0.5, 1.0))
+		extent = (bounds['max'] - bounds['min']) * 0.5 + glm.vec3(padding)
+		axes = glm.mat3(modelMatrix)
+		boxExtent = (glm.abs(axes[0]) * extent.x +
+					 glm.abs(axes[1]) * extent.y +
+					 glm.abs(axes[2]) * extent.z)
+
+		for plane in self.planes:
+			normal = glm.vec3(plane)
+			reach = glm.dot(glm.abs(normal), boxExtent)
+			if glm.dot(normal, boxCenter) + plane.w < -reach:
+				return False
+		return True
@@ -3,25 +3,53 @@ from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram, compileShader
 
 from camera import Camera
+from frameUniforms import FrameUniforms
+from frustum import Frustum
+from glState import state
+from renderQueue import RenderQueue
+from sceneBatch import BatchedSource, BatchingSupported, SceneBatch
 from skybox import Skybox
+from programCache import ProgramCache
+from shaderBlocks import IncludeBlocks
+from shader import uniformCalls
+
+def AddDefines(source, defines):
+    """Agrega un #define por cada nombre despues de la linea #version"""
+    if not defines:
+        return source
+
+    version = source.find("#version")
+    end = source.find("\n", version) + 1 if version >= 0 else 0
+    return source[:end] + "".join("#define %s\n" % define for define in defines) + source[end:]
 
 class Renderer(object):
-    def __init__(self, screen):
+    # Programas compartidos por par de fuentes y guardados en disco
+    programCache = ProgramCache()
+
+    def __init__(self, screen, renderTarget=None):
         self.screen = screen
         _,_, self.width, self.height = screen.get_rect()
+
+        # Framebuffer fuera de pantalla (RenderTarget) donde dibujar en vez
+        # de la ventana, por ejemplo con un HeadlessContext
+        self.renderTarget = renderTarget
         
         glClearColor(0.2, 0.2, 0.2, 1.0)
 
-        glEnable(GL_DEPTH_TEST)
-        glDepthFunc(GL_LESS)
+        # Los cambios de estado pasan por state, que omite los que no cambian nada
+        state.Enable(GL_DEPTH_TEST)
+        state.DepthFunc(GL_LESS)
         glViewport(0,0, self.width, self.height)
         
         # Configuración adicional para evitar parpadeo
-        glFrontFace(GL_CCW)
+        state.FrontFace(GL_CCW)
         glPolygonOffset(1.0, 1.0)
 
         self.camera = Camera(self.width, self.height)
 
+        # Uniforms comunes a todos los objetos, subidos una vez por frame
+        self.frameUniforms = FrameUniforms()
+
         self.scene = []
         
         self.filledMode = True
@@ -39,6 +67,33 @@ class Renderer(object):
         self.value = 0.0
         self.elapsedTime = 0.0
 
+        # Llamadas a glUniform* y cambios de estado de GL del ultimo frame:
+        # {'issued', 'skipped'} y {'issued', 'elided'}
+        self.uniformCalls = dict(uniformCalls)
+        self.stateCalls = dict(state.calls)
+
+        # Descartar los objetos (y grupos de materiales) fuera de la vista
+        self.useCulling = True
+        self.frustum = Frustum()
+
+        # Objetos y grupos de materiales dibujados y descartados en el ultimo
+        # frame, y triangulos dibujados
+        self.cullStats = {'drawn': 0, 'culled': 0, 'culledDrawCalls': 0, 'triangles': 0}
+
+        # Elegir el nivel de detalle de cada modelo por su tamaño en pantalla
+        self.useLod = True
+
+        # Rangos a dibujar en el frame, ordenados por programa, textura y VAO;
+        # renderQueue.stats tiene los cambios de estado del ultimo frame
+        self.renderQueue = RenderQueue()
+
+        # Dibujo por lotes: los rangos opacos de los modelos comunes se
+        # dibujan desde una arena compartida con glMultiDrawElementsIndirect.
+        # Necesita GL 4.3 y GL_ARB_shader_draw_parameters
+        self.useBatching = False
+        self.sceneBatch = SceneBatch()
+        self.batchedShaders = {}  # programa -> variante BATCHED
+
     def CreateSkybox(self, textureList):
         self.skybox = Skybox(textureList)
         self.skybox.cameraRef = self.camera
@@ -47,12 +102,12 @@ class Renderer(object):
         self.filledMode = not self.filledMode
 
         if self.filledMode:
-            glEnable(GL_CULL_FACE)
-            glCullFace(GL_BACK)
-            glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+            state.Enable(GL_CULL_FACE)
+            state.CullFace(GL_BACK)
+            state.PolygonMode(GL_FILL)
         else:
-            glDisable(GL_CULL_FACE)
-            glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
+            state.Disable(GL_CULL_FACE)
+            state.PolygonMode(GL_LINE)
 
     # NUEVO: Alternar modo de shaders individuales
     def ToggleIndividualShaders(self):
@@ -62,73 +117,231 @@ class Renderer(object):
         else:
             print("✗ Modo shaders individuales desactivado")
 
-    def SetShaders(self, vertexShader, fragmentShader):
-        if vertexShader is not None and fragmentShader is not None:
-            self.activeShader = compileProgram( compileShader(vertexShader, GL_VERTEX_SHADER),
-                                                compileShader(fragmentShader, GL_FRAGMENT_SHADER) )
+    # Alternar los niveles de detalle
+    def ToggleLod(self):
+        self.useLod = not self.useLod
+        if self.useLod:
+            print("✓ Niveles de detalle activados")
+        else:
+            print("✗ Niveles de detalle desactivados (mallas completas)")
+
+    # Alternar el dibujo por lotes
+    def ToggleBatching(self):
+        if not self.useBatching and not BatchingSupported():
+            print("✗ Dibujo por lotes no disponible (requiere GL 4.3 y GL_ARB_shader_draw_parameters)")
+            return
+
+        self.useBatching = not self.useBatching
+        if self.useBatching:
+            print("✓ Dibujo por lotes activado")
         else:
-            self.activeShader = None
+            print("✗ Dibujo por lotes desactivado")
+
+    def SetShaders(self, vertexShader, fragmentShader):
+        # Variantes del shader global por defines (por ejemplo TEXTURE_ARRAY),
+        # compiladas la primera vez que un modelo las pide
+        self.activeShaderSources = (vertexShader, fragmentShader)
+        self.activeShaderVariants = {}
+
+        self.activeShader = self.CompileShaderForObject(vertexShader, fragmentShader)
+        self.activeShaderVariants[()] = self.activeShader
+
+    def ActiveShaderFor(self, obj):
+        """Shader global compilado con los defines que necesita el objeto"""
+        defines = tuple(getattr(obj, 'shaderDefines', ()))
+        if self.activeShader is None or not defines:
+            return self.activeShader
+
+        if defines not in self.activeShaderVariants:
+            self.activeShaderVariants[defines] = self.CompileShaderForObject(*self.activeShaderSources, defines = defines)
+        return self.activeShaderVariants[defines]
 
     # NUEVO: Compilar shader para un objeto específico
-    def CompileShaderForObject(self, vertexShader, fragmentShader):
-        """Compila y retorna un programa de shader"""
+    def CompileShaderForObject(self, vertexShader, fragmentShader, defines = ()):
+        """Compila y retorna un programa de shader. defines son los nombres a
+        definir en ambos shaders (por ejemplo model.shaderDefines)"""
         if vertexShader is not None and fragmentShader is not None:
-            return compileProgram( compileShader(vertexShader, GL_VERTEX_SHADER),
-                                  compileShader(fragmentShader, GL_FRAGMENT_SHADER) )
+            # El mismo par de fuentes devuelve el mismo programa
+            return self.programCache.Program(AddDefines(IncludeBlocks(vertexShader), defines),
+                                             AddDefines(IncludeBlocks(fragmentShader), defines))
         return None
 
+    def BatchedShaderFor(self, shader):
+        """Variante BATCHED de un shader (GLSL 450, lee la matriz de modelo de
+        cada dibujo con gl_DrawIDARB); None si no se conocen sus fuentes o si
+        es una variante INSTANCED, que no se puede dibujar por lotes (las dos
+        reemplazan la matriz de modelo)"""
+        if shader is None or shader.sources is None:
+            return None
+        if "#define INSTANCED\n" in shader.sources[0]:
+            return None
+
+        if shader.program not in self.batchedShaders:
+            vertexShader, fragmentShader = shader.sources
+            self.batchedShaders[shader.program] = self.programCache.Program(BatchedSource(vertexShader),
+                                                                            BatchedSource(fragmentShader))
+        return self.batchedShaders[shader.program]
+
+    def UpdateFrameUniforms(self):
+        """Sube al UBO compartido los uniforms que son iguales para todo el frame"""
+        self.frameUniforms.Update(self.camera.viewMatrix,
+                                  self.camera.projectionMatrix,
+                                  self.pointLight,
+                                  self.ambientLight,
+                                  self.elapsedTime,
+                                  self.value)
+
     # MODIFICADO: Enviar uniforms a cualquier shader
     def SendUniforms(self, shaderProgram, obj=None):
-        """Envía los uniforms comunes a un shader dado"""
-        glUniformMatrix4fv( glGetUniformLocation(shaderProgram, "viewMatrix"),
-                            1, GL_FALSE, glm.value_ptr(self.camera.GetViewMatrix()) )
+        """Envía los uniforms propios de un shader dado. La camara, la luz,
+        time y value llegan por el bloque FrameUniforms; aqui quedan las
+        unidades de textura (que Shader envia una sola vez) y la matriz de
+        modelo"""
+        shaderProgram.Set("tex0", 0)
+        shaderProgram.Set("tex1", 1)
 
-        glUniformMatrix4fv( glGetUniformLocation(shaderProgram, "projectionMatrix"),
-                            1, GL_FALSE, glm.value_ptr(self.camera.projectionMatrix) )
+        # Si hay un objeto, enviar su matriz de modelo
+        if obj is not None:
+            shaderProgram.Set("modelMatrix", obj.GetModelMatrix())
 
-        glUniform3fv( glGetUniformLocation(shaderProgram, "pointLight"), 1, glm.value_ptr(self.pointLight) )
-        glUniform1f( glGetUniformLocation(shaderProgram, "ambientLight"), self.ambientLight )
+    def ScreenSize(self, obj):
+        """Diametro proyectado de la esfera del modelo sobre el alto de la
+        vista (1 = ocupa toda la altura)"""
+        bounds = getattr(obj, 'bounds', None)
+        if bounds is None:
+            return None
 
-        glUniform1f( glGetUniformLocation(shaderProgram, "value"), self.value )
-        glUniform1f( glGetUniformLocation(shaderProgram, "time"), self.elapsedTime )
+        modelMatrix = obj.GetModelMatrix()
+        center = glm.vec3(self.camera.viewMatrix * modelMatrix * glm.vec4(bounds['center'], 1.0))
+        scale = max(glm.length(glm.vec3(modelMatrix[0])),
+                    glm.length(glm.vec3(modelMatrix[1])),
+                    glm.length(glm.vec3(modelMatrix[2])))
+        radius = bounds['radius'] * scale
 
-        glUniform1i( glGetUniformLocation(shaderProgram, "tex0"), 0)
-        glUniform1i( glGetUniformLocation(shaderProgram, "tex1"), 1)
+        # Camara dentro de la esfera: el modelo llena la pantalla
+        distance = glm.length(center)
+        if distance <= radius:
+            return float('inf')
+        return radius * self.camera.projectionMatrix[1][1] / distance
 
-        # Si hay un objeto, enviar su matriz de modelo
-        if obj is not None:
-            glUniformMatrix4fv( glGetUniformLocation(shaderProgram, "modelMatrix"),
-                                1, GL_FALSE, glm.value_ptr( obj.GetModelMatrix() ) )
+    def SceneObjects(self):
+        """Objetos a dibujar: los nodos de scene y sus descendientes en el
+        grafo de escena (ver SceneNode), padres antes que hijos"""
+        for node in self.scene:
+            for obj in node.Walk():
+                if obj.drawable:
+                    yield obj
+
+    def FrameReport(self):
+        """Resumen de lo que costo el ultimo frame, para el titulo de la ventana"""
+        stats = self.renderQueue.stats
+        batch = ""
+        if self.useBatching:
+            batch = (" | Lotes: %d draws en %d llamadas"
+                     % (self.sceneBatch.stats['draws'], self.sceneBatch.stats['calls']))
+        return ("Objetos: %d dibujados, %d descartados | Triangulos: %d | Uniforms: %d enviados, %d omitidos"
+                " | Cambios: %d programas, %d texturas, %d VAOs en %d draws"
+                " | Estado GL: %d llamadas, %d omitidas"
+                % (self.cullStats['drawn'], self.cullStats['culled'], self.cullStats['triangles'],
+                   self.uniformCalls['issued'], self.uniformCalls['skipped'],
+                   stats['programs'], stats['textures'], stats['vaos'], stats['draws'],
+                   self.stateCalls['issued'], self.stateCalls['elided']) + batch)
 
     def Render(self):
+        if self.renderTarget is not None:
+            self.renderTarget.Bind()
+
         glClear( GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT )
 
+        # Llamadas a glUniform* y cambios de estado de este frame (hechos y
+        # omitidos por repetidos)
+        uniformCalls['issued'] = uniformCalls['skipped'] = 0
+        state.ResetCounters()
+
+        # Matrices de la camara del frame: se recalculan solo si se movio, y
+        # durante el frame se leen de camera.viewMatrix, projectionMatrix y
+        # viewProjectionMatrix
+        self.camera.Update()
+        self.UpdateFrameUniforms()
+
+        frustum = None
+        if self.useCulling:
+            self.frustum.Update(self.camera.viewProjectionMatrix)
+            frustum = self.frustum
+        cullStats = {'drawn': 0, 'culled': 0, 'culledDrawCalls': 0, 'triangles': 0}
+
         # Renderizar skybox primero siempre en modo relleno
         if self.skybox is not None:
-            glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
-            glDepthFunc(GL_LEQUAL)
+            state.PolygonMode(GL_FILL)
+            state.DepthFunc(GL_LEQUAL)
             self.skybox.Render()
-            glDepthFunc(GL_LESS)
-            # Restaurar el modo de polígono según el estado actual
+            state.DepthFunc(GL_LESS)
+            # Restaurar el modo de polígono según el estado actual (en modo
+            # relleno no hay nada que restaurar y state no llama a GL)
             if self.filledMode:
-                glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+                state.PolygonMode(GL_FILL)
             else:
-                glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
+                state.PolygonMode(GL_LINE)
+
+        # MODIFICADO: Renderizar objetos. Primero se juntan sus rangos visibles
+        # en la cola y despues se dibujan ordenados por estado
+        self.renderQueue.Clear()
+        self.sceneBatch.Clear()
+
+        objects = list(self.SceneObjects())
+        if self.useBatching:
+            # La arena se vuelve a armar solo si cambian los modelos de la escena
+            self.sceneBatch.Build([obj for obj in objects if getattr(obj, 'batchable', False)])
+
+        for obj in objects:
+            obj.Prepare()
+
+            # Volumen del modelo (en espacio de objeto) fuera de la vista: ni
+            # siquiera entra a la cola
+            if frustum is not None and not frustum.IsVisible(getattr(obj, 'bounds', None), obj.GetModelMatrix(),
+                                                             getattr(obj, 'boundsPadding', 0.0)):
+                cullStats['culled'] += 1
+                continue
+            cullStats['drawn'] += 1
+
+            # Nivel de detalle por tamaño en pantalla (sin LOD, la malla completa)
+            obj.SelectLod(self.ScreenSize(obj) if self.useLod else None)
 
-        # MODIFICADO: Renderizar objetos
-        for obj in self.scene:
             # Determinar qué shader usar
             if self.useIndividualShaders and hasattr(obj, 'customShader') and obj.customShader is not None:
                 # Usar shader individual del objeto
                 currentShader = obj.customShader
             else:
                 # Usar shader global (o ninguno)
-                currentShader = self.activeShader
+                currentShader = self.ActiveShaderFor(obj)
+
+            drawCalls, culled = obj.VisibleDrawCalls(frustum)
+            cullStats['culledDrawCalls'] += culled
+            cullStats['triangles'] += obj.TriangleCount(drawCalls)
+
+            # Solo los modelos que pueden entrar al lote necesitan la variante
+            batchedShader = None
+            if self.useBatching and getattr(obj, 'batchable', False):
+                batchedShader = self.BatchedShaderFor(currentShader)
+
+            for drawCall in drawCalls:
+                if batchedShader is not None and self.sceneBatch.Accepts(obj, drawCall):
+                    self.sceneBatch.Add(batchedShader, obj, drawCall)
+                    continue
+
+                depth = 0.0
+                if drawCall['transparent'] and drawCall['bounds'] is not None:
+                    center = self.camera.viewMatrix * obj.GetModelMatrix() * glm.vec4(drawCall['bounds']['center'], 1.0)
+                    depth = center.z
+                self.renderQueue.Add(currentShader, obj, drawCall, depth)
+
+        # Los lotes son opacos: van antes que la cola, que deja los
+        # transparentes para el final
+        self.sceneBatch.Execute()
 
-            # Activar el shader correspondiente
-            if currentShader is not None:
-                glUseProgram(currentShader)
-                self.SendUniforms(currentShader, obj)
+        self.renderQueue.Sort()
+        self.renderQueue.Execute(self.SendUniforms)
 
-            # Renderizar el objeto
-            obj.Render()
\ No newline at end of file
+        self.uniformCalls = dict(uniformCalls)
+        self.stateCalls = dict(state.calls)
+        self.cullStats = cullStats
\ No newline at end of file
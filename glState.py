@@ -0,0 +1,167 @@
+from OpenGL.GL import *
+
+
+class GLState(object):
+	"""Copia del estado de GL que cambia el Renderer: programa, texturas
+	enlazadas por unidad, VAO, framebuffer, capacidades (glEnable), funcion
+	y mascara de profundidad, caras descartadas, modo de poligono y
+	blending.
+
+	Cada funcion llama a GL solo si el valor pedido es distinto del que ya
+	esta puesto, y devuelve True si hizo la llamada. El estado empieza
+	desconocido, asi que la primera llamada de cada tipo siempre se hace.
+	Si otro codigo cambia el estado directamente con GL, hay que llamar a
+	Reset(). calls cuenta las llamadas hechas y las omitidas."""
+
+	def __init__(self):
+		self.values = {}
+		self.calls = {'issued': 0, 'elided': 0}
+
+
+	def Reset(self):
+		"""Olvida todo el estado: la proxima llamada de cada tipo se hace"""
+		self.values = {}
+
+
+	def ResetCounters(self):
+		self.calls['issued'] = self.calls['elided'] = 0
+
+
+	def Change(self, key, value):
+		"""True si key tiene que pasar a value (y lo anota como puesto)"""
+		if key in self.values and self.values[key] == value:
+			self.calls['elided'] += 1
+			return False
+
+		self.values[key] = value
+		self.calls['issued'] += 1
+		return True
+
+
+	def UseProgram(self, program):
+		if self.Change('program', int(program)):
+			glUseProgram(program)
+			return True
+		return False
+
+
+	def ActiveTexture(self, unit):
+		if self.Change('activeTexture', unit):
+			glActiveTexture(GL_TEXTURE0 + unit)
+			return True
+		return False
+
+
+	def BindTexture(self, target, texture, unit = 0):
+		"""Enlaza texture en target de la unidad unit (que queda activa)"""
+		self.ActiveTexture(unit)
+		if self.Change(('texture', unit, target), int(texture)):
+			glBindTexture(target, texture)
+			return True
+		return False
+
+
+	def BindFramebuffer(self, framebuffer):
+		"""Framebuffer donde se dibuja y del que se lee (0 = la ventana)"""
+		if self.Change('framebuffer', int(framebuffer)):
+			glBindFramebuffer(GL_FRAMEBUFFER, framebuffer)
+			return True
+		return False
+
+
+	def BindVertexArray(self, vao):
+		if self.Change('vertexArray', int(vao)):
+			glBindVertexArray(vao)
+			return True
+		return False
+
+
+	def Enable(self, capability):
+		if self.Change(('enabled', capability), True):
+			glEnable(capability)
+			return True
+		return False
+
+
+	def Disable(self, capability):
+		if self.Change(('enabled', capability), False):
+			glDisable(capability)
+			return True
+		return False
+
+
+	def DepthFunc(self, function):
+		if self.Change('depthFunc', function):
+			glDepthFunc(function)
+			return True
+		return False
+
+
+	def DepthMask(self, flag):
+		if self.Change('depthMask', bool(flag)):
+			glDepthMask(GL_TRUE if flag else GL_FALSE)
+			return True
+		return False
+
+
+	def CullFace(self, mode):
+		if self.Change('cullFace', mode):
+			glCullFace(mode)
+			return True
+		return False
+
+
+	def FrontFace(self, mode):
+		if self.Change('frontFace', mode):
+			glFrontFace(mode)
+			return True
+		return False
+
+
+	def PolygonMode(self, mode):
+		"""Modo de poligono para las dos caras (el unico que acepta el core profile)"""
+		if self.Change('polygonMode', mode):
+			glPolygonMode(GL_FRONT_AND_BACK, mode)
+			return True
+		return False
+
+
+	def BlendFunc(self, source, destination):
+		if self.Change('blendFunc', (source, destination)):
+			glBlendFunc(source, destination)
+			return True
+		return False
+
+
+	def DeleteTextures(self, textures):
+		"""Borra texturas; las unidades donde estaban enlazadas vuelven a 0,
+		como hace GL"""
+		textures = [int(texture) for texture in textures]
+		glDeleteTextures(len(textures), textures)
+		for key, value in list(self.values.items()):
+			if isinstance(key, tuple) and key[0] == 'texture' and value in textures:
+				self.values[key] = 0
+
+
+	def DeleteVertexArrays(self, vaos):
+		vaos = [int(vao) for vao in vaos]
+		glDeleteVertexArrays(len(vaos), vaos)
+		if self.values.get('vertexArray') in vaos:
+			self.values['vertexArray'] = 0
+
+
+	def DeleteFramebuffers(self, framebuffers):
+		framebuffers = [int(framebuffer) for framebuffer in framebuffers]
+		glDeleteFramebuffers(len(framebuffers), framebuffers)
+		if self.values.get('framebuffer') in framebuffers:
+			self.values['framebuffer'] = 0
+
+
+	def DeleteProgram(self, program):
+		glDeleteProgram(program)
+		if self.values.get('program') == int(program):
+			del self.values['program']
+
+
+# Un solo contexto de GL: todos los modulos comparten el mismo estado
+state = GLState()
@@ -0,0 +1,183 @@
+import ctypes
+import os
+
+# PyOpenGL elige la plataforma (GLX, EGL u OSMesa) al importarse por primera
+# vez: sin ventana hace falta EGL u OSMesa, asi que este modulo tiene que
+# importarse antes que gl.py, model.py o cualquier otro que importe OpenGL.
+# PYOPENGL_PLATFORM=osmesa elige OSMesa (llvmpipe sin GPU ni display)
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+
+from OpenGL import platform
+from OpenGL.GL import *
+
+from numpy import empty, uint8
+
+from renderTarget import RenderTarget
+
+
+# Versiones de GL que se piden, de la mas nueva a la minima de los shaders
+# (el skybox y el dibujo por lotes usan GLSL 450; los modelos, 330)
+contextVersions = ((4, 5), (4, 3), (3, 3))
+
+# EGL_PLATFORM_SURFACELESS_MESA, que PyOpenGL no define
+platformSurfaceless = 0x31DD
+
+
+class HeadlessContext(object):
+	"""Contexto de GL sin ventana, para dibujar donde no hay display ni GPU
+	(por ejemplo en integracion continua, con Mesa llvmpipe).
+
+	Usa EGL sin superficie (EGL_MESA_platform_surfaceless, o el display por
+	defecto con EGL_KHR_surfaceless_context) u OSMesa, segun la plataforma
+	de PyOpenGL, y dibuja en un RenderTarget del tamaño pedido. El contexto
+	tiene get_rect() como la ventana de pygame, asi que el Renderer, los
+	modelos, el skybox y los shaders se usan igual que con ventana:
+
+		context = HeadlessContext(640, 480)
+		rend = Renderer(context, renderTarget = context.renderTarget)
+		...
+		images = context.RenderFrames(rend, 30)
+	"""
+
+	def __init__(self, width, height):
+		self.width = width
+		self.height = height
+
+		self.backend = type(platform.PLATFORM).__name__.replace("Platform", "").lower()
+		if self.backend == "egl":
+			self.CreateEGLContext()
+		elif self.backend == "osmesa":
+			self.CreateOSMesaContext()
+		else:
+			raise RuntimeError("PyOpenGL ya usa la plataforma %s: importar headless antes que OpenGL "
+							   "o definir PYOPENGL_PLATFORM=egl u osmesa" % self.backend)
+
+		self.renderTarget = RenderTarget(width, height)
+
+
+	def CreateEGLContext(self):
+		from OpenGL import EGL
+
+		# Sin display ni GPU: la plataforma surfaceless de Mesa, si existe
+		self.display = EGL.EGL_NO_DISPLAY
+		try:
+			self.display = EGL.eglGetPlatformDisplayEXT(platformSurfaceless, EGL.EGL_DEFAULT_DISPLAY, None)
+		except Exception:
+			pass
+		if not self.display:
+			self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+
+		major, minor = EGL.EGLint(), EGL.EGLint()
+		if not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+			raise RuntimeError("No se pudo inicializar EGL")
+		EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+
+		self.context = EGL.EGL_NO_CONTEXT
+		for version in contextVersions:
+			attributes = (EGL.EGLint * 7)(EGL.EGL_CONTEXT_MAJOR_VERSION, version[0],
+										  EGL.EGL_CONTEXT_MINOR_VERSION, version[1],
+										  EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT,
+										  EGL.EGL_NONE)
+			try:
+				self.context = EGL.eglCreateContext(self.display, None, EGL.EGL_NO_CONTEXT, attributes)
+			except Exception:
+				continue
+			if self.context:
+				break
+
+		if not self.context:
+			raise RuntimeError("EGL no pudo crear un contexto de OpenGL 3.3 core")
+
+		# Sin superficie: se dibuja solo en el RenderTarget
+		if not EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, self.context):
+			raise RuntimeError("No se pudo activar el contexto de EGL")
+
+
+	def CreateOSMesaContext(self):
+		from OpenGL import osmesa
+
+		self.context = None
+		for version in contextVersions:
+			attributes = [osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA,
+						  osmesa.OSMESA_DEPTH_BITS, 24,
+						  osmesa.OSMESA_PROFILE, osmesa.OSMESA_CORE_PROFILE,
+						  osmesa.OSMESA_CONTEXT_MAJOR_VERSION, version[0],
+						  osmesa.OSMESA_CONTEXT_MINOR_VERSION, version[1],
+						  0]
+			try:
+				self.context = osmesa.OSMesaCreateContextAttribs(attributes, None)
+			except Exception:
+				continue
+			if self.context:
+				break
+
+		if not self.context:
+			raise RuntimeError("OSMesa no pudo crear un contexto de OpenGL 3.3 core")
+
+		# OSMesa necesita un buffer de color propio aunque se dibuje en el FBO
+		self.buffer = empty((self.height, self.width, 4), dtype = uint8)
+		if not osmesa.OSMesaMakeCurrent(self.context, self.buffer, GL_UNSIGNED_BYTE, self.width, self.height):
+			raise RuntimeError("No se pudo activar el contexto de OSMesa")
+
+
+	def get_rect(self):
+		return (0, 0, self.width, self.height)
+
+
+	def RenderFrames(self, renderer, count, deltaTime = 1 / 60, callback = None):
+		"""Dibuja count frames con renderer y devuelve sus imagenes en un
+		arreglo (count, alto, ancho, 3) de uint8. Como en el ciclo de la
+		ventana, elapsedTime avanza deltaTime antes de cada frame;
+		callback(renderer, frame), si se da, se llama antes de dibujar (para
+		mover la camara, la luz o los modelos)"""
+		images = empty((count, self.height, self.width, 3), dtype = uint8)
+		for frame in range(count):
+			if callback is not None:
+				callback(renderer, frame)
+
+			renderer.elapsedTime += deltaTime
+			renderer.Render()
+			images[frame] = self.renderTarget.ReadPixels()
+		return images
+
+
+	def Delete(self):
+		self.renderTarget.Delete()
+
+		if self.backend == "egl":
+			from OpenGL import EGL
+			EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+			EGL.eglDestroyContext(self.display, self.context)
+			EGL.eglTerminate(self.display)
+		else:
+			from OpenGL import osmesa
+			osmesa.OSMesaDestroyContext(self.context)
+
+
+if __name__ == "__main__":
+	# Prueba rapida (python headless.py): un frame con el dibujo por lotes
+	# activado y un InstancedModel en la escena, que no entra al lote y tiene
+	# que seguir usando su variante INSTANCED
+	from gl import Renderer
+	from instancedModel import InstancedModel
+	from model import Model
+	from vertexShaders import wave_shader
+	from fragmentShaders import cosmic_shader
+
+	context = HeadlessContext(320, 240)
+	rend = Renderer(context, renderTarget = context.renderTarget)
+	rend.SetShaders(wave_shader, cosmic_shader)
+	rend.ToggleBatching()
+
+	rend.scene.append(Model("models/leaf.obj"))
+	instanced = InstancedModel("models/leaf.obj")
+	instanced.AddInstance(position = (3, 0, 0))
+	instanced.AddInstance(position = (-3, 0, 0))
+	rend.scene.append(instanced)
+
+	context.RenderFrames(rend, 1)
+	print(rend.FrameReport())
+	error = glGetError()
+	context.Delete()
+	if error != GL_NO_ERROR:
+		raise SystemExit("Error de GL: 0x%x" % error)
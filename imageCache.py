@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+
+from numpy import uint8, uint16
+
+from meshCache import MeshCache
+
+
+def MipChain(pixels):
+	"""Niveles de mipmap de una imagen (alto, ancho, canales) hasta 1x1,
+	promediando bloques de 2x2 como glGenerateMipmap"""
+	levels = [pixels]
+	while levels[-1].shape[0] > 1 or levels[-1].shape[1] > 1:
+		level = levels[-1].astype(uint16)
+		height, width = level.shape[:2]
+
+		if height > 1:
+			level = level[0:height // 2 * 2:2] + level[1:height // 2 * 2:2]
+		else:
+			level = level * 2
+
+		if width > 1:
+			level = level[:, 0:width // 2 * 2:2] + level[:, 1:width // 2 * 2:2]
+		else:
+			level = level * 2
+
+		levels.append(((level + 2) // 4).astype(uint8))
+	return levels
+
+
+class ImageCache(MeshCache):
+	"""Cache en disco de imagenes ya decodificadas, con toda su cadena de
+	mipmaps (o con los bloques comprimidos que devuelve el driver). Las
+	entradas se validan contra el archivo fuente igual que las mallas y los
+	niveles se mapean a memoria, asi que se suben sin decodificar ni copiar.
+
+	variant distingue las formas de decodificar un mismo archivo (formato,
+	inversion en Y, compresion)."""
+
+	magic = b"IMGMIPS1"
+	folder = "images"
+
+	def EntryPath(self, filename, variant = ""):
+		key = hashlib.sha1(("%s|%s" % (os.path.abspath(filename), variant)).encode()).hexdigest()
+		return os.path.join(self.directory, key + ".image")
+
+
+	def Load(self, filename, variant):
+		"""Imagen guardada (en el formato de DecodeTexture, con 'levels'), o
+		None si no hay una entrada valida"""
+		path = self.EntryPath(filename, variant)
+		header = self.ReadHeader(path)
+		if header is None:
+			return None
+
+		if not self.SourcesFresh(path, header):
+			return None
+
+		channels = 4 if header['channels'] == 4 else 3
+		levels = []
+		try:
+			for level in header['levels']:
+				data = self.Map(path, uint8, level['size'], level['offset'])
+				if header['compressed'] is None:
+					data = data.reshape(level['height'], level['width'], channels)
+				levels.append({'width': level['width'], 'height': level['height'], 'data': data})
+		except (OSError, ValueError):
+			return None
+
+		return {'data': levels[0]['data'],
+				'width': header['width'],
+				'height': header['height'],
+				'format': header['format'],
+				'compressed': header['compressed'],
+				'levels': levels,
+				'source': filename,
+				'variant': variant}
+
+
+	def Store(self, filename, variant, image):
+		"""Guarda los niveles de image; si no se puede escribir, se ignora.
+		image['sources'] es el Describe() del archivo tomado antes de
+		decodificarlo; sin el, se describe ahora"""
+		levels = image['levels']
+		header = {'sources': image.get('sources') or [self.Describe(filename)],
+				  'format': image['format'],
+				  'channels': 4 if image['data'].ndim == 3 and image['data'].shape[2] == 4 else 3,
+				  'width': image['width'],
+				  'height': image['height'],
+				  'compressed': image.get('compressed'),
+				  'levels': [{'width': level['width'], 'height': level['height'],
+							  'size': level['data'].nbytes, 'offset': 0} for level in levels]}
+
+		# Igual que en las mallas: reservar el encabezado y despues alinear
+		headerSize = len(self.magic) + len(json.dumps(header)) + 32 * len(levels) + 32
+		offset = self.Align(headerSize)
+		for level in header['levels']:
+			level['offset'] = offset
+			offset = self.Align(offset + level['size'])
+
+		encoded = json.dumps(header).encode()
+		chunks = [self.magic, encoded, b"\0" * (header['levels'][0]['offset'] - len(self.magic) - len(encoded))]
+		for i, level in enumerate(levels):
+			chunks.append(level['data'])
+			end = header['levels'][i]['offset'] + header['levels'][i]['size']
+			chunks.append(b"\0" * (self.Align(end) - end))
+
+		self.Write(self.EntryPath(filename, variant), chunks)
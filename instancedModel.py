@@ -0,0 +1,179 @@
+import glm
+from OpenGL.GL import *
+
+from numpy import array, dtype, einsum, float32, frombuffer, zeros
+
+from buffer import Buffer
+from frustum import Bounds
+from glState import state
+from model import Model
+from sceneNode import SceneNode
+
+
+# Datos de cada instancia, en el orden de los atributos de los shaders
+# (#ifdef INSTANCED): matriz en 4..7 (una columna por atributo), tinte en 8
+# y desfase de tiempo en 9
+instanceFormat = dtype([('matrix',     float32, (4, 4)),
+						('tint',       float32, 4),
+						('timeOffset', float32)])
+
+
+class Instance(SceneNode):
+	"""Una copia de un InstancedModel: transformacion relativa al modelo
+	(position, rotation, scale con sus matrices guardadas), tinte que
+	multiplica el color y desfase que se suma a time en los shaders"""
+
+	def __init__(self, position = None, rotation = None, scale = None, tint = None, timeOffset = 0.0):
+		SceneNode.__init__(self)
+
+		if position is not None:
+			self.position = glm.vec3(position)
+		if rotation is not None:
+			self.rotation = glm.vec3(rotation)
+		if scale is not None:
+			self.scale = glm.vec3(scale)
+
+		self.tint = glm.vec4(1) if tint is None else glm.vec4(tint)
+		self.timeOffset = timeOffset
+
+		# PackKey() de lo que se subio al buffer de instancias
+		self.packedKey = None
+
+
+	def PackKey(self):
+		"""Cambia cuando cambian los datos de la instancia en el buffer: la
+		version de la matriz local, el tinte o el desfase"""
+		self.GetLocalMatrix()
+		return (self.localVersion, tuple(self.tint), self.timeOffset)
+
+
+class InstancedModel(Model):
+	"""Una malla dibujada muchas veces con glDrawElementsInstanced.
+
+	La malla, sus buffers y texturas se cargan una sola vez; cada copia es
+	un Instance en instances, y sus matrices, tintes y desfases van en un
+	buffer con divisor 1. La transformacion del modelo (position, rotation,
+	scale, padre) se aplica a todas las instancias, asi que mover el grupo no
+	toca el buffer. Se dibuja con las variantes INSTANCED de los shaders,
+	que se eligen solas por shaderDefines."""
+
+	# Las instancias necesitan su propio buffer: no entran a SceneBatch
+	batchable = False
+
+	def __init__(self, filename, mesh = None, images = None, simplifyLods = True):
+		Model.__init__(self, filename, mesh = mesh, images = images, simplifyLods = simplifyLods)
+
+		self.shaderDefines = tuple(self.shaderDefines) + ("INSTANCED",)
+
+		self.instances = []
+
+		# Volumen de la malla sola; bounds pasa a envolver a todas las instancias
+		self.meshBounds = self.bounds
+		self.bounds = None
+
+		# Copia de lo ultimo que se subio y la lista de instancias con la que
+		# se armo; solo se vuelven a empaquetar las instancias que cambiaron
+		self.instanceData = zeros(0, dtype = instanceFormat)
+		self.packedInstances = []
+		self.instanceUploads = 0
+
+		self.instanceBuffer = Buffer(zeros(1, dtype = instanceFormat), usage = GL_DYNAMIC_DRAW)
+
+		state.BindVertexArray(self.VAO)
+
+		stride = instanceFormat.itemsize
+		offset = instanceFormat.fields['matrix'][1]
+		for column in range(4):
+			self.instanceBuffer.Use(4 + column, 4, stride, offset + column * 16, divisor = 1)
+		self.instanceBuffer.Use(8, 4, stride, instanceFormat.fields['tint'][1], divisor = 1)
+		self.instanceBuffer.Use(9, 1, stride, instanceFormat.fields['timeOffset'][1], divisor = 1)
+
+		state.BindVertexArray(0)
+
+
+	def AddInstance(self, position = None, rotation = None, scale = None, tint = None, timeOffset = 0.0):
+		instance = Instance(position, rotation, scale, tint, timeOffset)
+		self.instances.append(instance)
+		return instance
+
+
+	def RemoveInstance(self, instance):
+		self.instances.remove(instance)
+
+
+	def Prepare(self):
+		"""Empaqueta las instancias que cambiaron y sube solo ese rango; si
+		cambio la lista (AddInstance, RemoveInstance) se arma todo de nuevo.
+		Si alguna matriz cambio, recalcula el volumen que las envuelve"""
+		rebuild = self.instances != self.packedInstances
+		if rebuild:
+			data = zeros(len(self.instances), dtype = instanceFormat)
+			self.packedInstances = list(self.instances)
+		else:
+			data = self.instanceData
+
+		changed = []
+		matricesChanged = rebuild
+		for i, instance in enumerate(self.instances):
+			key = instance.PackKey()
+			if rebuild or key != instance.packedKey:
+				changed.append(i)
+				if instance.packedKey is None or key[0] != instance.packedKey[0]:
+					matricesChanged = True
+				instance.packedKey = key
+
+		if not rebuild and not changed:
+			return
+
+		for i in changed:
+			instance = self.instances[i]
+			data['matrix'][i] = frombuffer(instance.localMatrix.to_bytes(), dtype = float32).reshape(4, 4)
+			data['tint'][i] = tuple(instance.tint)
+			data['timeOffset'][i] = instance.timeOffset
+
+		if rebuild:
+			if len(data):
+				self.instanceBuffer.Orphan(data)
+		else:
+			self.instanceBuffer.Update(data[changed[0]:changed[-1] + 1], offset = changed[0])
+		self.instanceData = data
+		self.instanceUploads += 1
+
+		if not matricesChanged:
+			return
+
+		# Caja de la malla llevada por cada matriz de instancia. Las filas de
+		# data['matrix'] son las columnas de la matriz, asi que p' = p @ M
+		self.bounds = None
+		if len(data) and self.meshBounds is not None:
+			low, high = self.meshBounds['min'], self.meshBounds['max']
+			corners = array([[x, y, z, 1.0] for x in (low.x, high.x)
+											for y in (low.y, high.y)
+											for z in (low.z, high.z)], dtype = float32)
+			points = einsum('kc,ncr->nkr', corners, data['matrix'])[:, :, :3]
+			self.bounds = Bounds(points.reshape(-1, 3))
+
+
+	def VisibleDrawCalls(self, frustum = None):
+		# Los volumenes de cada grupo de materiales son de la malla sola: con
+		# instancias solo se prueba el volumen de todo el modelo
+		if not len(self.instanceData):
+			return [], 0
+		return self.drawCalls, 0
+
+
+	def TriangleCount(self, drawCalls):
+		return Model.TriangleCount(self, drawCalls) * len(self.instanceData)
+
+
+	def Draw(self, drawCall):
+		glDrawElementsInstanced(GL_TRIANGLES,
+								drawCall['indexCount'],
+								self.indexType,
+								ctypes.c_void_p(drawCall['first'] * self.indexSize),
+								len(self.instanceData))
+
+
+	def Delete(self):
+		self.instanceBuffer.Delete()
+		Model.Delete(self)
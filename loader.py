@@ -0,0 +1,248 @@
+import multiprocessing
+import os
+import queue
+import threading
+
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+from numpy import dtype, ndarray
+
+from meshLod import SimplifyMesh
+from model import Model, ReadMesh, vertexFormat
+from textureCache import DecodeTexture
+
+
+# Alineacion de los indices dentro del bloque de memoria compartida
+alignment = 64
+
+
+def ParseMesh(filename):
+	"""Corre en un proceso del pool: lee la malla (del cache o del OBJ) y la
+	copia a un bloque de memoria compartida. Solo viaja de vuelta una
+	descripcion pequeña; los arreglos se leen del bloque sin serializarlos"""
+	mesh = ReadMesh(filename, Model.meshCache)
+	vertices = mesh['vertices']
+	indices = mesh['indices']
+
+	indexOffset = (vertices.nbytes + alignment - 1) // alignment * alignment
+	size = max(indexOffset + indices.nbytes, 1)
+
+	# El bloque lo libera (unlink) el proceso principal, al recibirlo o en
+	# Shutdown() si no llego a usarlo
+	block = shared_memory.SharedMemory(create = True, size = size)
+	ndarray(len(vertices), dtype = vertexFormat, buffer = block.buf)[:] = vertices
+	ndarray(len(indices), dtype = indices.dtype, buffer = block.buf, offset = indexOffset)[:] = indices
+	block.close()
+
+	return {'sharedMemory': block.name,
+			'vertexCount': len(vertices),
+			'indexType': indices.dtype.str,
+			'indexCount': len(indices),
+			'indexOffset': indexOffset,
+			'materialBuffers': mesh['materialBuffers'],
+			'materials': mesh['materials']}
+
+
+class AssetLoader(object):
+	"""Carga modelos en segundo plano. Los OBJ/MTL se parsean en un pool de
+	procesos (los arreglos vuelven por memoria compartida), las texturas se
+	decodifican en un pool de hilos y solo las llamadas a GL (buffers, VAO y
+	texturas) quedan para el hilo del contexto, en Update(). Los niveles de
+	detalle que no esten en el cache se simplifican despues, tambien en el
+	pool de procesos; mientras tanto el modelo se dibuja completo.
+
+	Conviene crearlo y empezar las cargas antes de abrir la ventana, asi los
+	procesos arrancan antes de que existan el contexto y los hilos de SDL.
+
+	LoadModel() devuelve un Future que se completa con el Model listo para
+	dibujar, y opcionalmente llama a un callback en el hilo de GL."""
+
+	def __init__(self, processes = None, threads = 4):
+		# Los procesos del pool arrancan con spawn: un fork copiaria los hilos
+		# de SDL y el contexto de GL a medio usar. spawn vuelve a importar el
+		# script principal (que necesita la guardia __main__) y pygame, que no
+		# tiene que repetir su saludo en cada proceso
+		os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+		self.meshPool = ProcessPoolExecutor(processes, mp_context = multiprocessing.get_context("spawn"))
+
+		self.texturePool = ThreadPoolExecutor(threads)
+
+		# (funcion, carga) listas para el hilo de GL: modelos con malla y
+		# texturas listas, o niveles de detalle ya simplificados
+		self.ready = queue.Queue()
+		self.pending = 0
+
+
+	def LoadModel(self, filename, callback = None, modelClass = Model):
+		"""Empieza a cargar un modelo. callback(model) se llama desde Update()
+		en el hilo de GL, cuando el modelo ya tiene sus buffers y texturas.
+		modelClass permite crear otra clase de modelo (por ejemplo
+		InstancedModel) con la misma malla"""
+		result = Future()
+		load = {'filename': filename,
+				'future': result,
+				'callback': callback,
+				'modelClass': modelClass,
+				'mesh': None,
+				'images': {},
+				'error': None}
+		self.pending += 1
+
+		meshFuture = self.meshPool.submit(ParseMesh, filename)
+		meshFuture.add_done_callback(lambda done: self.MeshParsed(load, done))
+		return result
+
+
+	def MeshParsed(self, load, meshFuture):
+		try:
+			load['mesh'] = meshFuture.result()
+		except Exception as e:
+			load['error'] = e
+			self.ready.put((self.Upload, load))
+			return
+
+		# Decodificar en paralelo las texturas difusas de los materiales que
+		# no esten ya en la GPU
+		paths = []
+		for material in (load['mesh']['materials'] or {}).values():
+			path = material.get('diffuse')
+			if path and path not in paths and os.path.exists(path) and not Model.textureCache.Contains(path):
+				paths.append(path)
+
+		if not paths:
+			self.ready.put((self.Upload, load))
+			return
+
+		lock = threading.Lock()
+		remaining = [len(paths)]
+
+		def Decoded(path, imageFuture):
+			try:
+				load['images'][path] = imageFuture.result()
+			except Exception:
+				pass  # Igual que en Model: las texturas que fallan se omiten
+
+			with lock:
+				remaining[0] -= 1
+				if remaining[0] == 0:
+					self.ready.put((self.Upload, load))
+
+		for path in paths:
+			imageFuture = self.texturePool.submit(DecodeTexture, path)
+			imageFuture.add_done_callback(lambda done, path = path: Decoded(path, done))
+
+
+	def Update(self, maxUploads = None):
+		"""Sube a GL las cargas que ya estan listas. Llamar en el hilo del
+		contexto, por ejemplo una vez por frame; maxUploads limita cuantos
+		modelos se crean por llamada para no trabar el frame"""
+		uploaded = 0
+		while maxUploads is None or uploaded < maxUploads:
+			try:
+				upload, load = self.ready.get_nowait()
+			except queue.Empty:
+				break
+
+			self.pending -= 1
+			uploaded += 1
+			upload(load)
+
+		return uploaded
+
+
+	def Upload(self, load):
+		model = None
+		error = load['error']
+
+		if error is None:
+			description = load['mesh']
+			try:
+				block = shared_memory.SharedMemory(name = description['sharedMemory'])
+			except Exception as e:
+				block = None
+				error = e
+
+			if block is not None:
+				try:
+					# El bloque se puede desvincular ya: sigue existiendo mientras
+					# este mapeado
+					block.unlink()
+
+					mesh = {'vertices': ndarray(description['vertexCount'], dtype = vertexFormat, buffer = block.buf),
+							'indices': ndarray(description['indexCount'], dtype = dtype(description['indexType']),
+											   buffer = block.buf, offset = description['indexOffset']),
+							'materialBuffers': description['materialBuffers'],
+							'materials': description['materials']}
+
+					model = load['modelClass'](load['filename'], mesh = mesh, images = load['images'],
+											   simplifyLods = False)
+
+					# Los arreglos del modelo apuntan al bloque; se guarda con el modelo
+					model.sharedMemory = block
+				except Exception as e:
+					model = None
+					error = e
+
+		if error is not None:
+			load['future'].set_exception(error)
+			return
+
+		if model.lodsPending:
+			self.SimplifyLods(model)
+
+		load['future'].set_result(model)
+		if load['callback'] is not None:
+			load['callback'](model)
+
+
+	def SimplifyLods(self, model):
+		"""Simplifica en el pool de procesos los niveles de detalle que no
+		estaban en el cache; los agrega UploadLods() en el hilo de GL"""
+		job = {'model': model, 'levels': None}
+		self.pending += 1
+
+		def Simplified(levelsFuture):
+			try:
+				job['levels'] = levelsFuture.result()
+				if model.lodCache is not None:
+					model.lodCache.Store(model.lodKey, job['levels'])
+			except Exception:
+				pass  # Sin niveles el modelo se sigue dibujando completo
+			self.ready.put((self.UploadLods, job))
+
+		levelsFuture = self.meshPool.submit(SimplifyMesh, model.vertices, model.indices,
+											model.materialBuffers, model.lodRatios)
+		levelsFuture.add_done_callback(Simplified)
+
+
+	def UploadLods(self, job):
+		model = job['model']
+		if job['levels'] is not None and model.VAO:
+			model.AddLods(job['levels'])
+
+
+	def Finish(self):
+		"""Espera y sube todo lo pendiente (carga sincrona), niveles de
+		detalle incluidos"""
+		while self.pending > 0:
+			upload, load = self.ready.get()
+			self.pending -= 1
+			upload(load)
+
+
+	def Shutdown(self):
+		self.meshPool.shutdown(wait = False, cancel_futures = True)
+		self.texturePool.shutdown(wait = False, cancel_futures = True)
+
+		# Mallas parseadas que ya no se van a subir: liberar sus bloques
+		while True:
+			try:
+				upload, load = self.ready.get_nowait()
+			except queue.Empty:
+				break
+			if upload == self.Upload and load['mesh'] is not None:
+				try:
+					shared_memory.SharedMemory(name = load['mesh']['sharedMemory']).unlink()
+				except Exception:
+					pass
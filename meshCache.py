@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import threading
+
+from numpy import dtype, empty, memmap
+
+
+def FileHash(filename):
+	"""SHA-1 del contenido de un archivo"""
+	digest = hashlib.sha1()
+	with open(filename, "rb") as file:
+		for chunk in iter(lambda: file.read(1 << 20), b""):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+class MeshCache(object):
+	"""Cache en disco de mallas ya procesadas (vertices intercalados, indices
+	y rangos de material), para no volver a parsear el OBJ en cada arranque.
+
+	Cada entrada es un archivo binario: un encabezado JSON con los datos de
+	los archivos fuente (ruta, tamaño, fecha de modificacion y hash) seguido
+	de los arreglos de vertices e indices alineados a 64 bytes. Una entrada
+	se descarta si alguno de sus archivos fuente cambio."""
+
+	magic = b"OBJMESH2"
+	alignment = 64
+	folder = "meshes"
+
+	def __init__(self, directory = None):
+		if directory is None:
+			directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", self.folder)
+		self.directory = directory
+
+
+	def EntryPath(self, filename):
+		key = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()
+		return os.path.join(self.directory, key + ".mesh")
+
+
+	def Describe(self, filename):
+		"""Datos de un archivo fuente para validar la entrada mas adelante"""
+		path = os.path.abspath(filename)
+		try:
+			stat = os.stat(path)
+		except OSError:
+			# Archivos que no existen tambien cuentan: si aparecen, la entrada
+			# deja de ser valida
+			return {'path': path, 'size': None}
+
+		return {'path': path,
+				'size': stat.st_size,
+				'mtime': stat.st_mtime_ns,
+				'sha1': FileHash(path)}
+
+
+	def IsFresh(self, source):
+		try:
+			stat = os.stat(source['path'])
+		except OSError:
+			return source['size'] is None
+
+		if source['size'] is None or stat.st_size != source['size']:
+			return False
+
+		# Misma fecha: no hace falta leer el archivo. Si solo cambio la fecha,
+		# el hash decide
+		if stat.st_mtime_ns == source['mtime']:
+			return True
+		if FileHash(source['path']) != source['sha1']:
+			return False
+
+		# El contenido es el mismo (checkout, touch): se anota la fecha nueva
+		# para que la proxima vez no haga falta volver a leer el archivo
+		source['mtime'] = stat.st_mtime_ns
+		return True
+
+
+	def SourcesFresh(self, path, header):
+		"""True si ningun archivo fuente de la entrada cambio. Si solo cambiaron
+		fechas, las actualiza en el encabezado de la entrada"""
+		mtimes = [source.get('mtime') for source in header['sources']]
+		if not all(self.IsFresh(source) for source in header['sources']):
+			return False
+
+		if mtimes != [source.get('mtime') for source in header['sources']]:
+			self.RewriteHeader(path, header)
+		return True
+
+
+	def ReadHeaderBytes(self, file):
+		"""Texto del encabezado (sin el byte nulo que lo termina), desde el
+		principio del archivo, o None si no es una entrada"""
+		if file.read(len(self.magic)) != self.magic:
+			return None
+
+		# El encabezado termina en el primer byte nulo
+		data = b""
+		while b"\0" not in data:
+			chunk = file.read(4096)
+			if not chunk:
+				return None
+			data += chunk
+		return data[:data.index(b"\0")]
+
+
+	def ReadHeader(self, path):
+		"""Lee solo el encabezado de una entrada, o None si no es valida"""
+		try:
+			with open(path, "rb") as file:
+				data = self.ReadHeaderBytes(file)
+		except OSError:
+			return None
+
+		if data is None:
+			return None
+		try:
+			return json.loads(data.decode())
+		except ValueError:
+			return None
+
+
+	def RewriteHeader(self, path, header):
+		"""Reemplaza el encabezado de una entrada con los mismos arreglos. Solo
+		si el nuevo no es mas largo: se completa con espacios, que JSON ignora,
+		y los offsets no cambian. Se escribe con Write(), asi otro proceso que
+		tenga mapeada la entrada sigue leyendo la anterior. Los errores se
+		ignoran"""
+		encoded = json.dumps(header).encode()
+		try:
+			with open(path, "rb") as file:
+				data = self.ReadHeaderBytes(file)
+				if data is None or len(encoded) > len(data):
+					return
+				file.seek(len(self.magic) + len(data))
+				rest = file.read()
+		except OSError:
+			return
+
+		self.Write(path, [self.magic, encoded + b" " * (len(data) - len(encoded)), rest])
+
+
+	def Map(self, path, dataType, count, offset):
+		"""Arreglo de solo lectura mapeado sobre el archivo: las paginas se leen
+		bajo demanda y glBufferData las toma directo del mapeo, sin copias"""
+		if count == 0:
+			return empty(0, dtype = dataType)
+		return memmap(path, dtype = dataType, mode = "r", offset = offset, shape = (count,))
+
+
+	def Load(self, filename, vertexFormat):
+		"""Devuelve la malla guardada para filename, o None si no hay una
+		entrada valida para estos archivos y este formato de vertice"""
+		path = self.EntryPath(filename)
+		header = self.ReadHeader(path)
+		if header is None:
+			return None
+
+		if header.get('vertexFormat') != str(vertexFormat.descr):
+			return None
+
+		if not self.SourcesFresh(path, header):
+			return None
+
+		try:
+			vertices = self.Map(path, vertexFormat, header['vertexCount'], header['vertexOffset'])
+			indices = self.Map(path, dtype(header['indexType']), header['indexCount'], header['indexOffset'])
+		except (OSError, ValueError):
+			return None
+
+		return {'vertices': vertices,
+				'indices': indices,
+				'materialBuffers': header['materialBuffers'],
+				'materials': header['materials']}
+
+
+	def Store(self, filename, mesh, sources):
+		"""Guarda la malla; sources son los Describe() de los archivos de los
+		que depende (el OBJ y sus MTL), tomados antes de leerlos. Si no se
+		puede escribir, se ignora"""
+		vertices = mesh['vertices']
+		indices = mesh['indices']
+
+		header = {'sources': sources,
+				  'vertexFormat': str(vertices.dtype.descr),
+				  'vertexCount': len(vertices),
+				  'indexType': indices.dtype.str,
+				  'indexCount': len(indices),
+				  'materialBuffers': mesh['materialBuffers'],
+				  'materials': mesh['materials']}
+
+		# Los offsets dependen del largo del encabezado, que incluye los offsets:
+		# se reservan con un valor fijo y luego se alinean
+		header['vertexOffset'] = header['indexOffset'] = 0
+		headerSize = len(self.magic) + len(json.dumps(header)) + 32
+		header['vertexOffset'] = self.Align(headerSize)
+		header['indexOffset'] = self.Align(header['vertexOffset'] + vertices.nbytes)
+
+		encoded = json.dumps(header).encode()
+		padding = header['vertexOffset'] - len(self.magic) - len(encoded)
+
+		self.Write(self.EntryPath(filename), [self.magic, encoded, b"\0" * padding,
+											 vertices,
+											 b"\0" * (header['indexOffset'] - header['vertexOffset'] - vertices.nbytes),
+											 indices])
+
+
+	def Write(self, path, chunks):
+		"""Escribe la entrada en un archivo temporal y la reemplaza de una vez,
+		para que nunca se lea a medio escribir. Los errores se ignoran"""
+		temporary = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+		try:
+			os.makedirs(self.directory, exist_ok = True)
+			with open(temporary, "wb") as file:
+				for chunk in chunks:
+					if isinstance(chunk, bytes):
+						file.write(chunk)
+					else:
+						chunk.tofile(file)
+			os.replace(temporary, path)
+		except OSError:
+			try:
+				os.remove(temporary)
+			except OSError:
+				pass
+
+
+	def Align(self, offset):
+		return (offset + self.alignment - 1) // self.alignment * self.alignment
@@ -0,0 +1,334 @@
+import hashlib
+import heapq
+import json
+import os
+
+from numpy import (add, arange, array, concatenate, cross, dtype, einsum, float64, int64, unique,
+				   zeros)
+from numpy.linalg import norm
+
+from meshCache import MeshCache
+
+
+# Peso de los planos que fijan los bordes de la malla y de los materiales:
+# colapsar a lo largo de un borde es barato, sacar un vertice de el no
+boundaryWeight = 100.0
+
+
+def WeldPositions(positions):
+	"""Grupo de cada vertice (los vertices con la misma posicion, que solo se
+	separaron por coordenadas de textura o normales, van juntos) y la
+	posicion de cada grupo"""
+	groupPositions, groupOf = unique(positions, axis = 0, return_inverse = True)
+	return groupOf.ravel(), groupPositions.astype(float64)
+
+
+def PlaneQuadric(normal, point, weight):
+	"""Cuadrica (4x4) de la distancia al cuadrado al plano, por weight"""
+	plane = concatenate((normal, [-normal.dot(point)]))
+	return weight * einsum('i,j->ij', plane, plane)
+
+
+def SimplifyMesh(vertices, indices, materialBuffers, ratios):
+	"""Niveles de detalle de una malla por colapso de aristas con error
+	cuadratico (Garland y Heckbert).
+
+	Se colapsa siempre un vertice sobre otro que ya existe (half-edge
+	collapse), asi que los niveles son solo indices nuevos sobre los mismos
+	vertices y comparten el vertex buffer del modelo. Los vertices se agrupan
+	por posicion, para que las costuras de textura no abran la malla; al
+	moverse un grupo, cada esquina toma el vertice del destino del mismo
+	lado de la costura y del mismo material (ver Destinations). Los bordes
+	de la malla, entre materiales y las costuras se conservan con planos de
+	mucho peso, y no se aceptan colapsos que den vuelta triangulos.
+
+	ratios son las fracciones de triangulos de cada nivel, de mayor a menor.
+	Devuelve un (indices, materialBuffers) por nivel, con los rangos de
+	material en el mismo orden que materialBuffers"""
+	triangles = indices.astype(int64).reshape(-1, 3)
+	triangleCount = len(triangles)
+
+	# Material de cada triangulo
+	materialOf = zeros(triangleCount, dtype = int64)
+	for i, materialBuffer in enumerate(materialBuffers):
+		first = materialBuffer['first'] // 3
+		materialOf[first:first + materialBuffer['indexCount'] // 3] = i
+
+	groupOf, positions = WeldPositions(vertices['position'])
+	groupCount = len(positions)
+	corners = groupOf[triangles]
+
+	# Cuñas: vertices con la misma posicion y coordenadas de textura. Los que
+	# solo difieren en la normal (aristas duras) no abren costuras
+	_, wedgeOf = unique(concatenate((groupOf[:, None], vertices['texCoords']), axis = 1),
+						axis = 0, return_inverse = True)
+	wedgeOf = wedgeOf.ravel()
+	vertexNormals = vertices['normal']
+
+	# Cuadrica de cada grupo: suma de los planos de sus triangulos, por area
+	p0, p1, p2 = positions[corners[:, 0]], positions[corners[:, 1]], positions[corners[:, 2]]
+	normals = cross(p1 - p0, p2 - p0)
+	areas = norm(normals, axis = 1)
+	valid = areas > 0
+	normals[valid] /= areas[valid, None]
+	planes = concatenate((normals, -einsum('ij,ij->i', normals, p0)[:, None]), axis = 1)
+	triangleQuadrics = einsum('t,ti,tj->tij', areas * 0.5, planes, planes)
+
+	quadrics = zeros((groupCount, 4, 4), dtype = float64)
+	for k in range(3):
+		add.at(quadrics, corners[:, k], triangleQuadrics)
+
+	# Aristas fijas: de un solo triangulo, entre materiales distintos o
+	# costuras (los triangulos de cada lado usan cuñas distintas). Llevan
+	# un plano perpendicular al triangulo por la arista en sus dos extremos
+	edgeTriangles = {}
+	edgeWedges = {}
+	for t in range(triangleCount):
+		for k in range(3):
+			a, b = int(corners[t, k]), int(corners[t, (k + 1) % 3])
+			if a != b:
+				pair = (int(wedgeOf[triangles[t, k]]), int(wedgeOf[triangles[t, (k + 1) % 3]]))
+				edgeTriangles.setdefault((min(a, b), max(a, b)), []).append(t)
+				edgeWedges.setdefault((min(a, b), max(a, b)), set()).add(pair if a < b else pair[::-1])
+
+	fixedEdges = set()
+	for edge, adjacent in edgeTriangles.items():
+		if len(adjacent) != 2 or materialOf[adjacent[0]] != materialOf[adjacent[1]] or len(edgeWedges[edge]) > 1:
+			fixedEdges.add(edge)
+
+	# Un vertice de una arista fija solo puede moverse a lo largo de ellas
+	fixed = [False] * groupCount
+	for a, b in fixedEdges:
+		fixed[a] = fixed[b] = True
+
+	for a, b in fixedEdges:
+		adjacent = edgeTriangles[(a, b)]
+		edge = positions[b] - positions[a]
+		for t in adjacent:
+			normal = cross(edge, normals[t])
+			length = norm(normal)
+			if length == 0:
+				continue
+			quadric = PlaneQuadric(normal / length, positions[a], boundaryWeight * edge.dot(edge))
+			quadrics[a] += quadric
+			quadrics[b] += quadric
+
+	# Triangulos de cada grupo y triangulos vivos
+	groupTriangles = [set() for _ in range(groupCount)]
+	for t in range(triangleCount):
+		for group in corners[t]:
+			groupTriangles[group].add(t)
+	alive = [True] * triangleCount
+	liveCount = triangleCount
+
+	homogeneous = concatenate((positions, [[1.0]] * groupCount), axis = 1)
+	version = [0] * groupCount
+
+	def Cost(source, target):
+		"""Error de llevar source a la posicion de target"""
+		point = homogeneous[target]
+		return float(point.dot(quadrics[source] + quadrics[target]).dot(point))
+
+	def Neighbors(group):
+		return set(int(g) for t in groupTriangles[group] for g in corners[t]) - {group}
+
+	heap = []
+
+	def Push(a, b):
+		costAB, costBA = Cost(a, b), Cost(b, a)
+		if costAB <= costBA:
+			heapq.heappush(heap, (costAB, a, b, version[a], version[b]))
+		else:
+			heapq.heappush(heap, (costBA, b, a, version[b], version[a]))
+
+	for a, b in edgeTriangles:
+		Push(a, b)
+
+	def CanCollapse(source, target):
+		if fixed[source] and (min(source, target), max(source, target)) not in fixedEdges:
+			return False
+
+		# Los vecinos comunes deben ser solo los de los triangulos de la arista;
+		# si no, la malla se pellizca
+		shared = [t for t in groupTriangles[source] if target in corners[t]]
+		common = Neighbors(source) & Neighbors(target)
+		if len(common) > len(shared):
+			return False
+
+		# Ningun triangulo que queda puede darse vuelta ni aplastarse
+		for t in groupTriangles[source]:
+			if target in corners[t]:
+				continue
+			moved = corners[t].copy()
+			moved[moved == source] = target
+			before = cross(positions[corners[t, 1]] - positions[corners[t, 0]],
+						   positions[corners[t, 2]] - positions[corners[t, 0]])
+			after = cross(positions[moved[1]] - positions[moved[0]],
+						  positions[moved[2]] - positions[moved[0]])
+			if after.dot(before) <= 1e-12 * before.dot(before):
+				return False
+		return True
+
+	# Vertice (no grupo) de cada esquina, que se actualiza con cada colapso
+	cornerVertices = triangles.copy()
+
+	def Corner(t, group):
+		return int(cornerVertices[t][corners[t] == group][0])
+
+	def Destinations(source, target):
+		"""Vertice de target al que pasa cada vertice de source, por material.
+		La cuña de destino es la que comparte la arista colapsada (del mismo
+		lado de una costura) o, si no, la unica de target con ese material; de
+		sus vertices se elige el de normal mas parecida. None si alguna cuña
+		es ambigua (el colapso mezclaria coordenadas de textura)"""
+		around = [(Corner(t, target), materialOf[t]) for t in groupTriangles[target]]
+
+		wedges = {}
+		for t in groupTriangles[source]:
+			if target in corners[t]:
+				key = (wedgeOf[Corner(t, source)], materialOf[t])
+				if wedges.setdefault(key, wedgeOf[Corner(t, target)]) != wedgeOf[Corner(t, target)]:
+					return None
+
+		destination = {}
+		for t in groupTriangles[source]:
+			vertex = Corner(t, source)
+			key = (vertex, materialOf[t])
+			if key in destination:
+				continue
+
+			wedge = wedges.get((wedgeOf[vertex], materialOf[t]))
+			if wedge is None:
+				candidates = set(wedgeOf[other] for other, material in around if material == materialOf[t])
+				if len(candidates) != 1:
+					return None
+				wedge = candidates.pop()
+
+			options = [other for other, material in around if material == materialOf[t] and wedgeOf[other] == wedge]
+			destination[key] = max(options, key = lambda other: vertexNormals[other].dot(vertexNormals[vertex]))
+		return destination
+
+	targets = [max(int(triangleCount * ratio), 1) for ratio in ratios]
+	snapshots = []
+
+	while len(snapshots) < len(targets):
+		# Guardar cada nivel al llegar a su cantidad de triangulos
+		while len(snapshots) < len(targets) and liveCount <= targets[len(snapshots)]:
+			snapshots.append((array(alive), cornerVertices.copy()))
+		if len(snapshots) == len(targets) or not heap:
+			break
+
+		cost, source, target, sourceVersion, targetVersion = heapq.heappop(heap)
+		if version[source] != sourceVersion or version[target] != targetVersion:
+			continue
+		if not CanCollapse(source, target):
+			continue
+		destination = Destinations(source, target)
+		if destination is None:
+			continue
+
+		for t in list(groupTriangles[source]):
+			column = (corners[t] == source).nonzero()[0][0]
+			key = (int(cornerVertices[t, column]), materialOf[t])
+
+			if target in corners[t]:
+				alive[t] = False
+				liveCount -= 1
+				for group in corners[t]:
+					groupTriangles[group].discard(t)
+			else:
+				corners[t, column] = target
+				cornerVertices[t, column] = destination[key]
+				groupTriangles[target].add(t)
+		groupTriangles[source] = set()
+
+		# Las aristas fijas de source pasan a target
+		for neighbor in Neighbors(target):
+			if (min(source, neighbor), max(source, neighbor)) in fixedEdges:
+				fixedEdges.add((min(target, neighbor), max(target, neighbor)))
+
+		quadrics[target] += quadrics[source]
+		version[source] = -1
+		version[target] += 1
+		for neighbor in Neighbors(target):
+			Push(target, neighbor)
+
+	# Si no hubo mas colapsos posibles, los niveles que faltan quedan iguales
+	while len(snapshots) < len(targets):
+		snapshots.append((array(alive), cornerVertices.copy()))
+
+	levels = []
+	for liveMask, levelVertices in snapshots:
+		kept = arange(triangleCount)[liveMask]
+		levelIndices = levelVertices[kept]
+
+		counts = [int((materialOf[kept] == i).sum()) * 3 for i in range(len(materialBuffers))]
+		levelBuffers = []
+		first = 0
+		for materialBuffer, count in zip(materialBuffers, counts):
+			if count:
+				levelBuffers.append({'material': materialBuffer['material'],
+									 'first': first,
+									 'indexCount': count})
+			first += count
+
+		levels.append((levelIndices.ravel().astype(indices.dtype), levelBuffers))
+	return levels
+
+
+class LodCache(MeshCache):
+	"""Niveles de detalle guardados en disco. La entrada se identifica por el
+	hash de la malla ya preparada (vertices, indices y rangos de material) y
+	de las fracciones pedidas, asi que no hace falta validar archivos
+	fuente: si la malla cambia, cambia la clave"""
+
+	magic = b"MESHLOD1"
+	folder = "lods"
+
+	def Key(self, vertices, indices, materialBuffers, ratios):
+		digest = hashlib.sha1()
+		for data in (vertices, indices):
+			digest.update(str(data.dtype.descr).encode())
+			digest.update(data.tobytes())
+		digest.update(json.dumps([materialBuffers, list(ratios)]).encode())
+		return digest.hexdigest()
+
+
+	def EntryPath(self, key):
+		return os.path.join(self.directory, key + ".lod")
+
+
+	def Load(self, key):
+		"""Lista de (indices, materialBuffers) por nivel, o None"""
+		path = self.EntryPath(key)
+		header = self.ReadHeader(path)
+		if header is None:
+			return None
+
+		try:
+			indices = self.Map(path, dtype(header['indexType']), header['indexCount'], header['indexOffset'])
+		except (OSError, ValueError):
+			return None
+
+		levels = []
+		first = 0
+		for level in header['levels']:
+			levels.append((indices[first:first + level['indexCount']], level['materialBuffers']))
+			first += level['indexCount']
+		return levels
+
+
+	def Store(self, key, levels):
+		indices = concatenate([levelIndices for levelIndices, levelBuffers in levels])
+
+		header = {'levels': [{'indexCount': len(levelIndices), 'materialBuffers': levelBuffers}
+							 for levelIndices, levelBuffers in levels],
+				  'indexType': indices.dtype.str,
+				  'indexCount': len(indices),
+				  'indexOffset': 0}
+		header['indexOffset'] = self.Align(len(self.magic) + len(json.dumps(header)) + 32)
+
+		encoded = json.dumps(header).encode()
+		self.Write(self.EntryPath(key), [self.magic, encoded,
+										 b"\0" * (header['indexOffset'] - len(self.magic) - len(encoded)),
+										 indices])
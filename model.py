@@ -1,200 +1,691 @@
 from OpenGL.GL import *
 from obj import Obj
 from buffer import Buffer
+from meshCache import MeshCache
+from textureCache import DecodeTexture, StackImages, TextureCache
+from atlas import TextureAtlas, TriangleShifts, maxOverhang
+from sceneNode import SceneNode
+from frustum import Bounds
+from meshLod import LodCache, SimplifyMesh
+from glState import state
 
 import glm
 
-import pygame
+from numpy import (arange, argsort, bincount, column_stack, concatenate, cumsum, dtype, empty, float32, full,
+				   int64, maximum, ones, prod, repeat, stack, uint16, uint32, unique, zeros)
+
+
+# Formato de vertice intercalado: posicion, coordenadas de textura y normal
+vertexFormat = dtype([('position',  float32, 3),
+					  ('texCoords', float32, 2),
+					  ('normal',    float32, 3)])
+
+def ReadMesh(filename, meshCache = None):
+	"""Malla de un OBJ (vertices, indices, rangos de material y materiales),
+	desde el cache en disco o parseando el archivo. No usa GL, asi que se
+	puede llamar desde otros hilos o procesos"""
+	mesh = None
+	if meshCache is not None:
+		mesh = meshCache.Load(filename, vertexFormat)
+
+	if mesh is None:
+		# No esta en el cache o el OBJ/MTL cambio: parsear y guardar. Los
+		# archivos se describen antes de leerlos: si cambian durante el parseo,
+		# la entrada queda vieja en vez de guardar la malla anterior con los
+		# datos nuevos
+		objFile = Obj(filename, meshCache.Describe if meshCache is not None else None)
+		mesh = BuildMeshData(objFile)
+
+		if meshCache is not None:
+			meshCache.Store(filename, mesh, objFile.sources)
+
+	return mesh
+
+
+def UniqueRows(keys):
+	"""Filas unicas de un arreglo de enteros (N, columnas), en el orden en que
+	aparecen por primera vez, y el indice de la fila unica de cada fila"""
+	low = keys.min(axis = 0) if len(keys) else zeros(keys.shape[1], dtype = int64)
+	span = (keys.max(axis = 0) - low + 1) if len(keys) else ones(keys.shape[1], dtype = int64)
+
+	if prod(span.astype(float)) < 2 ** 62:
+		# Empacar cada fila en un solo entero; unique en 1D es mucho mas rapido
+		packed = zeros(len(keys), dtype = int64)
+		for column in range(keys.shape[1]):
+			packed = packed * span[column] + (keys[:, column] - low[column])
+		_, firstUse, inverse = unique(packed, return_index = True, return_inverse = True)
+		uniqueKeys = keys[firstUse]
+	else:
+		uniqueKeys, firstUse, inverse = unique(keys, axis = 0, return_index = True, return_inverse = True)
+	byFirstUse = argsort(firstUse)
+	remap = empty(len(byFirstUse), dtype = int64)
+	remap[byFirstUse] = arange(len(byFirstUse))
+	return uniqueKeys[byFirstUse], remap[inverse.ravel()]
+
+
+def IndexArray(indices, vertexCount):
+	"""Indices de 16 bits si alcanzan, si no de 32"""
+	return indices.astype(uint16 if vertexCount <= 0x10000 else uint32)
+
+
+def BuildMeshData(objFile):
+	"""Convierte las caras de un Obj en vertices unicos, indices y rangos
+	de indices por material"""
+	# Esquinas (v, vt, vn) de todas las caras, base 1 (0 = no existe)
+	corners = objFile.faces
+	faceSizes = objFile.faceSizes
+	faceStarts = objFile.faceStarts
+	faceCount = len(faceSizes)
+
+	# Agrupar caras por material, en orden de aparicion
+	materials = list(dict.fromkeys(material for material, first, count in objFile.materialRanges))
+	materialIds = {material: i for i, material in enumerate(materials)}
+	faceMaterialIds = repeat([materialIds[material] for material, first, count in objFile.materialRanges],
+							 [count for material, first, count in objFile.materialRanges]).astype(int64)
+
+	# Triangular cada cara en abanico: (0, i, i+1). Un triangulo da uno,
+	# un quad da (0,1,2) y (0,2,3)
+	faceTriangles = maximum(faceSizes - 2, 0)
+	triangleFaces = repeat(arange(faceCount), faceTriangles)
+	triangleLocal = arange(len(triangleFaces)) - repeat(cumsum(faceTriangles) - faceTriangles, faceTriangles)
+
+	# Ordenar los triangulos por material (estable, respeta el orden del archivo)
+	order = argsort(faceMaterialIds[triangleFaces], kind = 'stable')
+	triangleFaces = triangleFaces[order]
+	triangleLocal = triangleLocal[order]
+
+	base = faceStarts[triangleFaces]
+	triangleCorners = stack((base, base + triangleLocal + 1, base + triangleLocal + 2), axis = 1).ravel()
+
+	# Cada combinacion unica (v, vt, vn) es un solo vertice del modelo;
+	# los vertices quedan en el orden en que los usan los triangulos
+	uniqueKeys, indices = UniqueRows(corners[triangleCorners])
+
+	vertices = empty(len(uniqueKeys), dtype = vertexFormat)
+
+	# Posiciones
+	positions = objFile.vertices
+	vertices['position'] = positions[uniqueKeys[:, 0] - 1] if len(positions) else 0
+
+	# Coordenadas de textura (con valor por defecto si no existen)
+	texCoords = objFile.texCoords
+	valid = (uniqueKeys[:, 1] > 0) & (uniqueKeys[:, 1] <= len(texCoords))
+	vertices['texCoords'] = (0, 0)  # Valor por defecto
+	vertices['texCoords'][valid] = texCoords[uniqueKeys[valid, 1] - 1]
+
+	# Normales (con valor por defecto si no existen)
+	normals = objFile.normals
+	valid = (uniqueKeys[:, 2] > 0) & (uniqueKeys[:, 2] <= len(normals))
+	vertices['normal'] = (0, 1, 0)  # Normal hacia arriba por defecto
+	vertices['normal'][valid] = normals[uniqueKeys[valid, 2] - 1]
+
+	# Rango de indices de cada material
+	indexCounts = bincount(faceMaterialIds[triangleFaces], minlength = len(materials)) * 3
+	firsts = cumsum(indexCounts) - indexCounts
+
+	materialBuffers = []
+	for i, material in enumerate(materials):
+		materialBuffers.append({
+			'material': material,
+			'first': int(firsts[i]),
+			'indexCount': int(indexCounts[i])
+		})
+
+	indices = IndexArray(indices, len(vertices))
+
+	return {'vertices': vertices,
+			'indices': indices,
+			'materialBuffers': materialBuffers,
+			'materials': objFile.mtlFile}
+
+
+class Model(SceneNode):
+	# Nodo de escena con malla: el Renderer lo dibuja
+	drawable = True
+
+	# Cache en disco de mallas ya procesadas; None para desactivarlo
+	meshCache = MeshCache()
+
+	# Texturas compartidas por todos los modelos
+	textureCache = TextureCache()
+
+	# Empaquetar las texturas difusas de cada modelo en un atlas, para dibujar
+	# todos los materiales que entren en una sola llamada
+	useAtlas = True
+
+	# Alternativa al atlas (tiene prioridad): las texturas del mismo tamaño
+	# van en capas de un GL_TEXTURE_2D_ARRAY y cada vertice guarda su capa.
+	# Los shaders se compilan con shaderDefines (TEXTURE_ARRAY)
+	useTextureArray = False
+
+	# Cuanto pueden mover los vertices los shaders (en espacio de objeto):
+	# agranda los volumenes con los que se descartan modelos fuera de la vista
+	boundsPadding = 0.0
 
-class Model(object):
-	def __init__(self, filename):
-		self.objFile = Obj(filename)
+	# El Renderer puede copiar la malla a la arena de SceneBatch y dibujarla
+	# con los demas modelos en una sola llamada (ver Renderer.useBatching)
+	batchable = True
+
+	# Niveles de detalle simplificados (meshLod.py): fraccion de triangulos
+	# de cada nivel y tamaño en pantalla (diametro proyectado sobre el alto de
+	# la vista) bajo el cual se pasa a ese nivel. Las mallas con menos de
+	# minLodTriangles triangulos se dibujan siempre completas
+	lodRatios = (0.5, 0.25, 0.15)
+	lodScreenSizes = (0.5, 0.25, 0.12)
+	minLodTriangles = 256
+
+	# Margen relativo alrededor de cada tamaño: para volver al nivel anterior
+	# hay que pasar el umbral por este margen, asi el nivel no salta de un
+	# frame a otro cuando el modelo queda justo en el limite
+	lodHysteresis = 0.15
+
+	# Cache en disco de los niveles de detalle; None para no guardarlos
+	lodCache = LodCache()
 
-		self.position = glm.vec3(0,0,0)
-		self.rotation = glm.vec3(0,0,0)
-		self.scale = glm.vec3(1,1,1)
+	def __init__(self, filename, mesh = None, images = None, simplifyLods = True):
+		self.filename = filename
+
+		# Vertices, indices y materiales: los que se reciben ya preparados
+		# (por ejemplo del AssetLoader), o desde el cache o el OBJ
+		self.LoadMesh(mesh)
+
+		# Sube cuando cambian los indices ya subidos (ver AddLods)
+		self.meshVersion = 0
+
+		# position, rotation, scale y las matrices guardadas
+		SceneNode.__init__(self)
 
 		self.textures = {}  # Diccionario: nombre_material -> texture_id
 		self.materialToTexture = {}  # Mapa de material a índice de textura
 		
 		# Cargar texturas desde el archivo MTL si existe
-		self.LoadTexturesFromMTL()
+		self.LoadTexturesFromMTL(images)
 		
-		self.BuildBuffers()  # Después de cargar texturas
+		self.BuildBuffers(simplifyLods)  # Después de cargar texturas
 
-	def GetModelMatrix(self):
+	def LoadMesh(self, mesh = None):
+		if mesh is None:
+			mesh = ReadMesh(self.filename, self.meshCache)
 
-		identity = glm.mat4(1)
+		self.vertices = mesh['vertices']
+		self.indices = mesh['indices']
+		self.materialBuffers = mesh['materialBuffers']
+		self.materials = mesh['materials']
 
-		translateMat = glm.translate(identity, self.position)
+		self.vertexCount = len(self.vertices)
+		self.indexCount = len(self.indices)
 
-		pitchMat = glm.rotate(identity, glm.radians(self.rotation.x), glm.vec3(1,0,0))
-		yawMat =   glm.rotate(identity, glm.radians(self.rotation.y), glm.vec3(0,1,0))
-		rollMat =  glm.rotate(identity, glm.radians(self.rotation.z), glm.vec3(0,0,1))
 
-		rotationMat = pitchMat * yawMat * rollMat
+	def BuildBuffers(self, simplifyLods = True):
+		if self.atlasIndex:
+			self.ApplyAtlas()
+		elif self.layerIndex:
+			self.ApplyTextureLayers()
 
-		scaleMat = glm.scale(identity, self.scale)
+		# Los niveles de detalle van a continuacion en el mismo buffer de indices
+		self.BuildLods(simplifyLods)
 
-		return translateMat * rotationMat * scaleMat
+		self.indexType = GL_UNSIGNED_SHORT if self.indices.dtype == uint16 else GL_UNSIGNED_INT
+		self.indexSize = self.indices.itemsize
 
+		# Grabar el formato de vertices y el buffer de indices en un VAO;
+		# todos los rangos de material lo comparten
+		self.VAO = glGenVertexArrays(1)
+		state.BindVertexArray(self.VAO)
 
-	def BuildBuffers(self):
-		# Agrupar caras por material
-		material_groups = {}
-		
-		for face_idx, face in enumerate(self.objFile.faces):
-			material = self.objFile.faceMaterials[face_idx] if face_idx < len(self.objFile.faceMaterials) else None
-			
-			if material not in material_groups:
-				material_groups[material] = []
-			material_groups[material].append(face)
-		
-		# Crear buffers separados para cada material
-		self.materialBuffers = []
-		
-		for material, faces in material_groups.items():
-			positions = []
-			texCoords = []
-			normals = []
-			vertexCount = 0
-			
-			for face in faces:
-				facePositions = []
-				faceTexCoords = []
-				faceNormals = []
-
-				for i in range(len(face)):
-					# Posiciones
-					facePositions.append(self.objFile.vertices[face[i][0] - 1])
-					
-					# Coordenadas de textura (con valor por defecto si no existen)
-					if face[i][1] != 0 and face[i][1] <= len(self.objFile.texCoords):
-						faceTexCoords.append(self.objFile.texCoords[face[i][1] - 1])
-					else:
-						faceTexCoords.append([0, 0])  # Valor por defecto
-					
-					# Normales (con valor por defecto si no existen)
-					if face[i][2] != 0 and face[i][2] <= len(self.objFile.normals):
-						faceNormals.append(self.objFile.normals[face[i][2] - 1])
-					else:
-						faceNormals.append([0, 1, 0])  # Normal hacia arriba por defecto
-
-				# Primer triángulo
-				for value in facePositions[0]: positions.append(value)
-				for value in facePositions[1]: positions.append(value)
-				for value in facePositions[2]: positions.append(value)
-
-				for value in faceTexCoords[0]: texCoords.append(value)
-				for value in faceTexCoords[1]: texCoords.append(value)
-				for value in faceTexCoords[2]: texCoords.append(value)
-
-				for value in faceNormals[0]: normals.append(value)
-				for value in faceNormals[1]: normals.append(value)
-				for value in faceNormals[2]: normals.append(value)
-
-				vertexCount += 3
-
-				# Si es un quad, agregar el segundo triángulo
-				if len(face) == 4:
-					for value in facePositions[0]: positions.append(value)
-					for value in facePositions[2]: positions.append(value)
-					for value in facePositions[3]: positions.append(value)
-
-					for value in faceTexCoords[0]: texCoords.append(value)
-					for value in faceTexCoords[2]: texCoords.append(value)
-					for value in faceTexCoords[3]: texCoords.append(value)
-
-					for value in faceNormals[0]: normals.append(value)
-					for value in faceNormals[2]: normals.append(value)
-					for value in faceNormals[3]: normals.append(value)
-
-					vertexCount += 3
-			
-			# Crear buffers para este material
-			materialBuffer = {
-				'material': material,
-				'posBuffer': Buffer(positions),
-				'texCoordsBuffer': Buffer(texCoords),
-				'normalsBuffer': Buffer(normals),
-				'vertexCount': vertexCount
-			}
-			self.materialBuffers.append(materialBuffer)
-
-
-	def AddTexture(self, filename):
-		textureSurface = pygame.image.load(filename)
-		
-		# Detectar si la imagen tiene canal alpha (transparencia)
-		if textureSurface.get_alpha() is not None or filename.lower().endswith('.png'):
-			textureData = pygame.image.tostring(textureSurface, "RGBA", True)
-			internalFormat = GL_RGBA
-			format = GL_RGBA
-		else:
-			textureData = pygame.image.tostring(textureSurface, "RGB", True)
-			internalFormat = GL_RGB
-			format = GL_RGB
-
-		texture = glGenTextures(1)
-		glBindTexture(GL_TEXTURE_2D, texture)
-
-		glTexImage2D(GL_TEXTURE_2D,
-					 0,
-					 internalFormat,
-					 textureSurface.get_width(),
-					 textureSurface.get_height(),
-					 0,
-					 format,
-					 GL_UNSIGNED_BYTE,
-					 textureData)
-
-		glGenerateMipmap(GL_TEXTURE_2D)
-
-		return texture
-	
-	
-	def LoadTexturesFromMTL(self):
-		"""Carga automáticamente las texturas desde el archivo MTL"""
-		if self.objFile.mtlFile:
-			for material_name, material_data in self.objFile.mtlFile.items():
-				if 'diffuse' in material_data:
-					import os
-					texture_path = material_data['diffuse']
-					
-					if os.path.exists(texture_path):
-						try:
-							texture_id = self.AddTexture(texture_path)
-							self.textures[material_name] = texture_id
-						except Exception as e:
-							pass
+		# Un solo VBO por modelo con el formato pos/uv/normal intercalado
+		self.vertexBuffer = Buffer(self.vertices)
+		self.indexBuffer = Buffer(self.indices, target = GL_ELEMENT_ARRAY_BUFFER)
+
+		stride = vertexFormat.itemsize
+		self.vertexBuffer.Use(0, 3, stride, vertexFormat.fields['position'][1])
+		self.vertexBuffer.Use(1, 2, stride, vertexFormat.fields['texCoords'][1])
+		self.vertexBuffer.Use(2, 3, stride, vertexFormat.fields['normal'][1])
+
+		# Capa del arreglo de texturas de cada vertice, en su propio buffer
+		if self.layerIndex:
+			self.layerBuffer = Buffer(self.layers)
+			self.layerBuffer.Use(3, 1)
+
+		state.BindVertexArray(0)
+
+		self.BuildDrawCalls()
+
+		# Volumenes envolventes (caja y esfera, en espacio de objeto) del modelo
+		# y de cada llamada de dibujo, para descartar lo que queda fuera de la vista
+		self.bounds = Bounds(self.vertices['position'])
+		self.BuildDrawCallBounds()
+
+
+	def BuildDrawCallBounds(self):
+		positions = self.vertices['position']
+		for lod in self.lods:
+			for drawCall in lod['drawCalls']:
+				drawCall['bounds'] = Bounds(positions[self.indices[drawCall['first']:drawCall['first'] + drawCall['indexCount']]])
 
 
-	def Render(self):
-		# Renderizar cada grupo de material con su textura
+	def ApplyAtlas(self):
+		"""Lleva las coordenadas de textura de los materiales del atlas a sus
+		rectangulos y deja esos materiales juntos al principio de los indices.
+		Cada triangulo se desplaza a la repeticion de la textura donde cae su
+		centro, asi que un vertice compartido por triangulos de repeticiones
+		distintas se duplica"""
+		triangles = self.indices.astype(int64).reshape(-1, 3)
+		shifts, overhangs = TriangleShifts(self.vertices['texCoords'][triangles])
+		shifts = shifts.astype(int64)
+
+		# Rectangulo del atlas de cada triangulo (-1 = fuera del atlas)
+		rects = full(len(triangles), -1, dtype = int64)
 		for materialBuffer in self.materialBuffers:
-			material = materialBuffer['material']
-			
-			# Activar la textura correspondiente al material
-			if material and material in self.textures:
-				glActiveTexture(GL_TEXTURE0)
-				glBindTexture(GL_TEXTURE_2D, self.textures[material])
-			elif len(self.textures) > 0:
-				# Si no hay material específico, usar la primera textura
-				first_texture = list(self.textures.values())[0]
-				glActiveTexture(GL_TEXTURE0)
-				glBindTexture(GL_TEXTURE_2D, first_texture)
-			
-			# Usar los buffers de este grupo
-			materialBuffer['posBuffer'].Use(0, 3)
-			materialBuffer['texCoordsBuffer'].Use(1, 2)
-			materialBuffer['normalsBuffer'].Use(2, 3)
+			first = materialBuffer['first'] // 3
+			rects[first:first + materialBuffer['indexCount'] // 3] = self.atlasIndex.get(materialBuffer['material'], -1)
+		shifts[rects < 0] = 0
+
+		# Materiales del atlas primero; vertices unicos por (vertice, desplazamiento, rectangulo)
+		keys = self.Regroup(sorted(self.materialBuffers, key = lambda materialBuffer: materialBuffer['material'] not in self.atlasIndex),
+							column_stack((shifts, rects)))
+
+		for rect in range(len(self.atlas.rects)):
+			inRect = keys[:, 2] == rect
+			texCoords = self.vertices['texCoords'][inRect] - keys[inRect, 0:2]
+			u, v = self.atlas.Remap(texCoords, rect)
+			self.vertices['texCoords'][inRect, 0] = u
+			self.vertices['texCoords'][inRect, 1] = v
+
+
+	def ApplyTextureLayers(self):
+		"""Guarda la capa de textura de cada vertice y deja juntos los
+		materiales que usan el mismo arreglo de texturas. Un vertice compartido
+		por materiales de capas distintas se duplica"""
+		triangleCount = len(self.indices) // 3
+		layers = zeros(triangleCount, dtype = int64)
+		for materialBuffer in self.materialBuffers:
+			first = materialBuffer['first'] // 3
+			layers[first:first + materialBuffer['indexCount'] // 3] = self.layerIndex[materialBuffer['material']][1]
 
-			glDrawArrays(GL_TRIANGLES, 0, materialBuffer['vertexCount'])
+		arrayOrder = lambda materialBuffer: self.textureArrays.index(self.layerIndex[materialBuffer['material']][0])
+		keys = self.Regroup(sorted(self.materialBuffers, key = arrayOrder), layers[:, None])
+		self.layers = keys[:, 0].astype(float32)
 
-			glDisableVertexAttribArray(0)
-			glDisableVertexAttribArray(1)
-			glDisableVertexAttribArray(2)
 
+	def Regroup(self, materialBuffers, triangleKeys):
+		"""Reordena los rangos de material como en materialBuffers y arma un
+		vertice por cada combinacion (vertice, claves de su triangulo).
+		triangleKeys es un arreglo de enteros (triangulos, columnas) en el orden
+		actual; devuelve las claves de cada vertice nuevo"""
+		order = [arange(materialBuffer['first'] // 3, (materialBuffer['first'] + materialBuffer['indexCount']) // 3)
+				 for materialBuffer in materialBuffers]
+		order = concatenate(order) if order else zeros(0, dtype = int64)
 
+		triangles = self.indices.astype(int64).reshape(-1, 3)[order]
+		triangleKeys = triangleKeys[order]
+		keys = column_stack((triangles.reshape(-1, 1), repeat(triangleKeys, 3, axis = 0)))
+		uniqueKeys, indices = UniqueRows(keys)
 
+		first = 0
+		self.materialBuffers = []
+		for materialBuffer in materialBuffers:
+			self.materialBuffers.append({'material': materialBuffer['material'],
+										 'first': first,
+										 'indexCount': materialBuffer['indexCount']})
+			first += materialBuffer['indexCount']
+
+		self.vertices = self.vertices[uniqueKeys[:, 0]]
+		self.indices = IndexArray(indices, len(self.vertices))
+		self.vertexCount = len(self.vertices)
+		self.indexCount = len(self.indices)
+		return uniqueKeys[:, 1:]
+
+
+	def BuildLods(self, simplify = True):
+		"""Agrega a los indices los niveles de detalle simplificados (desde el
+		cache en disco o con SimplifyMesh). lodBuffers queda con los rangos de
+		material de cada nivel, el 0 es la malla completa. Con simplify en
+		False solo se usa el cache: si no estan, lodsPending queda en True y
+		los niveles llegan despues con AddLods (asi lo hace el AssetLoader,
+		que simplifica fuera del hilo de GL)"""
+		self.lodBuffers = [self.materialBuffers]
+		self.lodKey = None
+		self.lodsPending = False
+		if len(self.indices) // 3 < self.minLodTriangles or not self.lodRatios:
+			return
+
+		levels = None
+		if self.lodCache is not None:
+			self.lodKey = self.lodCache.Key(self.vertices, self.indices, self.materialBuffers, self.lodRatios)
+			levels = self.lodCache.Load(self.lodKey)
+
+		if levels is None:
+			if not simplify:
+				self.lodsPending = True
+				return
+			levels = SimplifyMesh(self.vertices, self.indices, self.materialBuffers, self.lodRatios)
+			if self.lodCache is not None:
+				self.lodCache.Store(self.lodKey, levels)
+
+		self.AppendLods(levels)
+
+
+	def AppendLods(self, levels):
+		"""Pone los indices de cada nivel despues de los de la malla"""
+		parts = [self.indices]
+		first = len(self.indices)
+		for levelIndices, levelBuffers in levels:
+			self.lodBuffers.append([{'material': materialBuffer['material'],
+									 'first': first + materialBuffer['first'],
+									 'indexCount': materialBuffer['indexCount']}
+									for materialBuffer in levelBuffers])
+			parts.append(levelIndices.astype(self.indices.dtype))
+			first += len(levelIndices)
+
+		self.indices = concatenate(parts)
+		self.indexCount = len(self.indices)
+
+
+	def AddLods(self, levels):
+		"""Agrega niveles de detalle a un modelo que ya tiene sus buffers:
+		sube de nuevo los indices y rearma las llamadas de dibujo"""
+		self.AppendLods(levels)
+		self.lodsPending = False
+
+		state.BindVertexArray(self.VAO)
+		self.indexBuffer.Orphan(self.indices)
+		state.BindVertexArray(0)
+
+		self.BuildDrawCalls()
+		self.BuildDrawCallBounds()
+
+		# La arena de SceneBatch copio los indices anteriores
+		self.meshVersion += 1
+
+
+	def BuildDrawCalls(self):
+		"""Llamadas de dibujo de cada nivel de detalle; drawCalls son las del
+		nivel actual (lod)"""
+		self.lods = []
+		for materialBuffers in self.lodBuffers:
+			drawCalls = self.MaterialDrawCalls(materialBuffers)
+			self.lods.append({'drawCalls': drawCalls,
+							  'triangles': sum(drawCall['indexCount'] for drawCall in drawCalls) // 3})
+
+		self.lod = 0
+		self.drawCalls = self.lods[0]['drawCalls']
+
+
+	def MaterialDrawCalls(self, materialBuffers):
+		"""Resuelve la textura de cada rango de material y junta los rangos
+		seguidos que usan la misma textura en una sola llamada de dibujo"""
+		drawCalls = []
+		for materialBuffer in materialBuffers:
+			material = materialBuffer['material']
 
+			target = GL_TEXTURE_2D
+			if material in self.layerIndex:
+				texture = self.layerIndex[material][0]
+				target = GL_TEXTURE_2D_ARRAY
+			elif material in self.atlasIndex:
+				texture = self.atlasTexture
+			elif material and material in self.textures:
+				texture = self.textures[material]
+			elif len(self.textures) > 0:
+				# Si no hay material específico, usar la primera textura
+				texture = list(self.textures.values())[0]
+			else:
+				texture = None
+
+			# Materiales con opacidad (d o Tr del MTL) menor a 1 se dibujan
+			# aparte, de atras hacia adelante
+			transparent = bool(self.materials) and self.materials.get(material, {}).get('dissolve', 1.0) < 1.0
+
+			last = drawCalls[-1] if drawCalls else None
+			if (last is not None and last['texture'] == texture and last['transparent'] == transparent and
+				last['first'] + last['indexCount'] == materialBuffer['first']):
+				last['indexCount'] += materialBuffer['indexCount']
+			else:
+				drawCalls.append({'texture': texture,
+								  'target': target,
+								  'transparent': transparent,
+								  'first': materialBuffer['first'],
+								  'indexCount': materialBuffer['indexCount']})
+		return drawCalls
+
+
+	def AddTexture(self, filename, image = None):
+		"""Id de la textura para filename, compartida con los demas modelos que
+		la usen. image es la imagen ya decodificada, si se tiene"""
+		return self.textureCache.Acquire(filename, image)
+	
+	
+	def LoadTexturesFromMTL(self, images = None):
+		"""Carga automáticamente las texturas desde el archivo MTL. images son
+		las imagenes ya decodificadas por ruta (por ejemplo en otro hilo); las
+		que falten se decodifican aqui"""
+		if images is None:
+			images = {}
+
+		# Textura difusa de cada material cuyo archivo existe
+		self.texturePaths = {}
+		if self.materials:
+			for material_name, material_data in self.materials.items():
+				if 'diffuse' in material_data:
+					import os
+					texture_path = material_data['diffuse']
+
+					if texture_path in images or os.path.exists(texture_path):
+						self.texturePaths[material_name] = texture_path
+
+		self.atlas = None
+		self.atlasTexture = None
+		self.atlasIndex = {}  # Material -> rectangulo del atlas
+		self.textureArrays = []
+		self.layerIndex = {}  # Material -> (arreglo de texturas, capa)
+		if self.useTextureArray:
+			self.BuildTextureArrays(images)
+		elif self.useAtlas:
+			self.BuildAtlas(images)
+
+		self.shaderDefines = ("TEXTURE_ARRAY",) if self.layerIndex else ()
+
+		# Las texturas que no entraron al atlas o a un arreglo se usan por separado
+		for material_name, texture_path in list(self.texturePaths.items()):
+			if material_name in self.atlasIndex or material_name in self.layerIndex:
+				continue
+			try:
+				self.textures[material_name] = self.AddTexture(texture_path, images.get(texture_path))
+			except Exception as e:
+				pass
+
+
+	def BuildAtlas(self, images):
+		"""Empaqueta en un atlas las texturas cuyos triangulos no se salen mas
+		de maxOverhang repeticiones de la textura. Los materiales sin textura
+		usan la primera, como en Render()"""
+		if not self.texturePaths:
+			return
+		firstPath = next(iter(self.texturePaths.values()))
+
+		# Cuanto se sale de su textura cada rango de material, juntado por archivo
+		triangles = self.indices.astype(int64).reshape(-1, 3)
+		shifts, overhangs = TriangleShifts(self.vertices['texCoords'][triangles])
+
+		pathOverhangs = {}
+		for materialBuffer in self.materialBuffers:
+			path = self.texturePaths.get(materialBuffer['material'], firstPath)
+			first = materialBuffer['first'] // 3
+			count = materialBuffer['indexCount'] // 3
+			overhang = overhangs[first:first + count].max(axis = 0) if count else zeros(2, dtype = float32)
+			pathOverhangs[path] = maximum(pathOverhangs.get(path, 0), overhang)
+
+		paths = [path for path, overhang in pathOverhangs.items() if overhang.max() <= maxOverhang]
+		if len(paths) < 2:
+			return
+
+		# Dos modelos con las mismas texturas y bordes comparten el atlas
+		key = ('atlas',) + tuple((self.textureCache.Key(path)[0],
+								  round(float(pathOverhangs[path][0]), 4),
+								  round(float(pathOverhangs[path][1]), 4)) for path in paths)
+		entry = self.textureCache.Lookup(key)
+
+		if entry is None:
+			decoded = []
+			for path in paths:
+				try:
+					decoded.append(images[path] if path in images else DecodeTexture(path))
+				except Exception as e:
+					# Igual que sin atlas: el material pasa a usar la primera textura
+					for material_name in [name for name, texturePath in self.texturePaths.items() if texturePath == path]:
+						del self.texturePaths[material_name]
+					return self.BuildAtlas(images)
+
+			atlas = TextureAtlas([(image['width'], image['height']) for image in decoded],
+								 [pathOverhangs[path] for path in paths],
+								 glGetIntegerv(GL_MAX_TEXTURE_SIZE))
+			if not atlas.IsValid():
+				return
+
+			entry = self.textureCache.Insert(key, atlas.Compose(decoded), atlas)
+
+		self.atlas = entry['info']
+		self.atlasTexture = entry['texture']
+
+		rects = {path: i for i, path in enumerate(paths)}
+		for materialBuffer in self.materialBuffers:
+			path = self.texturePaths.get(materialBuffer['material'], firstPath)
+			if path in rects:
+				self.atlasIndex[materialBuffer['material']] = rects[path]
+
+
+	def BuildTextureArrays(self, images):
+		"""Sube las texturas de los materiales como capas de GL_TEXTURE_2D_ARRAY,
+		un arreglo por cada tamaño de imagen. Los materiales sin textura usan
+		la primera, como en Render()"""
+		if not self.texturePaths:
+			return
+		firstPath = next(iter(self.texturePaths.values()))
+
+		paths = list(dict.fromkeys(self.texturePaths.get(materialBuffer['material'], firstPath)
+								   for materialBuffer in self.materialBuffers))
+
+		decoded = {}
+		for path in paths:
+			try:
+				decoded[path] = images[path] if path in images else DecodeTexture(path)
+			except Exception as e:
+				# Igual que sin arreglos: el material pasa a usar la primera textura
+				for material_name in [name for name, texturePath in self.texturePaths.items() if texturePath == path]:
+					del self.texturePaths[material_name]
+				return self.BuildTextureArrays(images)
+
+		# Agrupar por tamaño, en el orden en que se usan
+		groups = {}
+		for path in paths:
+			groups.setdefault((decoded[path]['width'], decoded[path]['height']), []).append(path)
+
+		layers = {}
+		for size, group in groups.items():
+			key = ('array', size) + tuple(self.textureCache.Key(path)[0] for path in group)
+			entry = self.textureCache.Lookup(key)
+			if entry is None:
+				entry = self.textureCache.Insert(key, StackImages([decoded[path] for path in group]))
+
+			self.textureArrays.append(entry['texture'])
+			for layer, path in enumerate(group):
+				layers[path] = (entry['texture'], layer)
+
+		for materialBuffer in self.materialBuffers:
+			path = self.texturePaths.get(materialBuffer['material'], firstPath)
+			self.layerIndex[materialBuffer['material']] = layers[path]
+
+
+	def Delete(self):
+		"""Libera los buffers, el VAO y las referencias a las texturas"""
+		for texture in self.textures.values():
+			self.textureCache.Release(texture)
+		self.textures = {}
+
+		if self.atlasTexture is not None:
+			self.textureCache.Release(self.atlasTexture)
+			self.atlasTexture = None
+
+		for texture in self.textureArrays:
+			self.textureCache.Release(texture)
+		self.textureArrays = []
+		self.layerIndex = {}
+
+		self.vertexBuffer.Delete()
+		self.indexBuffer.Delete()
+		if hasattr(self, 'layerBuffer'):
+			self.layerBuffer.Delete()
+		state.DeleteVertexArrays([self.VAO])
+		self.VAO = 0
+
+
+	def Prepare(self):
+		"""Se llama una vez por frame antes de decidir si el modelo se ve.
+		Los modelos que cambian datos de la GPU cada frame (InstancedModel)
+		los suben aqui"""
+		pass
+
+
+	def SelectLod(self, screenSize = None):
+		"""Elige el nivel de detalle para el tamaño del modelo en pantalla
+		(ver lodScreenSizes); sin tamaño vuelve a la malla completa. Devuelve
+		True si cambio de nivel"""
+		lod = 0
+		if screenSize is not None:
+			lod = self.lod
+			while lod + 1 < len(self.lods) and screenSize < self.lodScreenSizes[lod] * (1.0 - self.lodHysteresis):
+				lod += 1
+			while lod > 0 and screenSize > self.lodScreenSizes[lod - 1] * (1.0 + self.lodHysteresis):
+				lod -= 1
+
+		if lod == self.lod:
+			return False
+		self.lod = lod
+		self.drawCalls = self.lods[lod]['drawCalls']
+		return True
+
+
+	def TriangleCount(self, drawCalls):
+		"""Triangulos que dibujan drawCalls"""
+		return sum(drawCall['indexCount'] for drawCall in drawCalls) // 3
+
+
+	def VisibleDrawCalls(self, frustum = None):
+		"""Llamadas de dibujo del modelo que no quedan fuera de frustum, y
+		cuantas se descartaron"""
+		# Con un solo grupo, el Renderer ya probo el volumen del modelo
+		if frustum is None or len(self.drawCalls) < 2:
+			return self.drawCalls, 0
+
+		modelMatrix = self.GetModelMatrix()
+		visible = [drawCall for drawCall in self.drawCalls
+				   if frustum.IsVisible(drawCall['bounds'], modelMatrix, self.boundsPadding)]
+		return visible, len(self.drawCalls) - len(visible)
+
+
+	def Draw(self, drawCall):
+		"""Dibuja un rango de indices; el VAO y la textura ya estan enlazados"""
+		glDrawElements(GL_TRIANGLES,
+					   drawCall['indexCount'],
+					   self.indexType,
+					   ctypes.c_void_p(drawCall['first'] * self.indexSize))
+
+
+	def Render(self, frustum = None):
+		"""Dibuja el modelo. Con frustum, se saltean los grupos de materiales
+		que quedan fuera de la vista; devuelve cuantos se saltearon"""
+		drawCalls, culled = self.VisibleDrawCalls(frustum)
+
+		state.BindVertexArray(self.VAO)
+
+		# Renderizar cada grupo de materiales con su textura; si ya esta
+		# enlazada, state no la vuelve a enlazar
+		for drawCall in drawCalls:
+			if drawCall['texture'] is not None:
+				state.BindTexture(drawCall['target'], drawCall['texture'])
+
+			self.Draw(drawCall)
+
+		state.BindVertexArray(0)
+		return culled
@@ -1,72 +1,457 @@
+import os
+import re
+
+from numpy import (arange, argmax, bincount, concatenate, count_nonzero, cumsum, diff,
+				   flatnonzero, float32, frombuffer, fromstring, int32, int64, isnan,
+				   minimum, ones, repeat, searchsorted, uint8, where, zeros)
+
+
+# Tipos de linea que se convierten en bloque
+OTHER, VERTEX, TEXCOORD, NORMAL, FACE = range(5)
+
+# Prefijo de cada tipo de linea
+prefixes = (b"", b"v ", b"vt ", b"vn ", b"f ")
+
+SPACE, NEWLINE, SLASH, POINT, MINUS = ord(" "), ord("\n"), ord("/"), ord("."), ord("-")
+
+# Las lineas de caras se convierten completas: la f pasa a ser un 0 al
+# principio de cada cara y las barras separan numeros como los espacios
+faceTable = bytes.maketrans(b"f/", b"0 ")
+
+# Mayor entero que se lee como decimal sin punto (ver ParseDecimals): desde
+# 2**53 float64 ya no representa todos los enteros. Las potencias de 10 hasta
+# 10**15 son exactas
+decimalLimit = 2 ** 53
+powersOfTen = 10.0 ** arange(16)
+
+# Hasta cuantos tramos de lineas seguidas de un tipo se copian por separado;
+# con mas (por ejemplo v, vt y vn intercalados) se separan con una mascara
+maxRuns = 4096
+
+
+def HasTrailingComment(data):
+	"""True si algun comentario empieza despues del principio de su linea. Las
+	lineas que empiezan con # ya quedan fuera por su primer caracter; solo
+	hay que borrar los demas. data termina en "\n" """
+	position = data.find(b"#")
+	while position >= 0:
+		if position > 0 and data[position - 1] != NEWLINE:
+			return True
+		position = data.find(b"#", data.find(b"\n", position) + 1)
+	return False
+
+
+def Lines(data):
+	"""data como arreglo de bytes y el inicio y el fin ("\n") de cada linea"""
+	buffer = frombuffer(data, dtype = uint8)
+	ends = flatnonzero(buffer == NEWLINE)
+	return buffer, concatenate(([0], ends[:-1] + 1)), ends
+
+
+def KindLines(data, starts, ends, selected):
+	"""Partes de data con todas las lineas elegidas (selected, uno por linea),
+	completas (con su prefijo y su "\n"), y los numeros de esas lineas"""
+	lines = flatnonzero(selected)
+	if len(lines) == 0:
+		return [], lines
+
+	# Tramos de lineas elegidas seguidas
+	breaks = flatnonzero(diff(lines) != 1)
+	firsts = lines[concatenate(([0], breaks + 1))]
+	lasts = lines[concatenate((breaks, [len(lines) - 1]))]
+
+	if len(firsts) <= maxRuns:
+		view = memoryview(data)
+		return [view[start:end] for start, end in zip(starts[firsts].tolist(), (ends[lasts] + 1).tolist())], lines
+
+	buffer = frombuffer(data, dtype = uint8)
+	return [memoryview(buffer[repeat(selected, ends - starts + 1)])], lines
+
+
+def KindText(data, starts, ends, kinds, kind, lineEnd):
+	"""Texto de todas las lineas de un tipo, sin el prefijo y cada una
+	terminada en lineEnd, y los numeros de esas lineas"""
+	parts, lines = KindLines(data, starts, ends, kinds == kind)
+	if len(lines) == 0:
+		return b"", lines
+
+	# Sin el prefijo de la primera linea ni el "\n" de la ultima
+	prefix = prefixes[kind]
+	parts[0] = parts[0][len(prefix):]
+	parts[-1] = parts[-1][:-1]
+
+	# Todas las lineas del texto son del tipo: cada "\n" va seguido del prefijo
+	return b"".join(parts + [lineEnd]).replace(b"\n" + prefix, lineEnd), lines
+
+
+def ParseDecimals(text, lineKinds):
+	"""Numeros de lineas completas (ver KindLines) de tipos con prefijos de
+	letras (v, vt, vn); lineKinds tiene el tipo de cada linea. Se leen como
+	enteros sin el punto, que numpy lee bastante mas rapido que los decimales,
+	y se dividen por la potencia de 10 de sus decimales (el cociente es el
+	mismo float64 que da leer el decimal). Devuelve los numeros en float64, el
+	primero de cada linea y cuantos tiene cada una, o None si algun numero no
+	se puede leer asi (por ejemplo con exponente)"""
+	lines = len(lineKinds)
+	if lines == 0:
+		return None
+
+	# Palabras separadas por un espacio o un "\n": la primera de cada linea es
+	# el prefijo y las demas son numeros
+	buffer = frombuffer(text, dtype = uint8)
+	separators = flatnonzero(buffer <= SPACE)
+	lineEnds = flatnonzero(buffer[separators] == NEWLINE)
+	isNumber = ones(len(separators), dtype = bool)
+	isNumber[concatenate(([0], lineEnds[:-1] + 1))] = False
+	numberStarts = separators[:-1][isNumber[1:]] + 1
+	numberEnds = separators[isNumber]
+	counts = diff(lineEnds, prepend = -1) - 1
+	firsts = cumsum(counts) - counts
+	if len(numberEnds) == 0:
+		return None
+
+	# Las letras de los prefijos pasan a ser espacios. Con hasta 9 caracteres
+	# los numeros entran en int32, que numpy lee mas rapido. Si sobran
+	# separadores (palabras vacias) o una letra de prefijo parte un numero, no
+	# coincide la cantidad de numeros
+	kindLines = bincount(lineKinds)
+	letters = b"".join(prefixes[kind][:-1] for kind in flatnonzero(kindLines))
+	lengths = numberEnds - numberStarts
+	dtype = int32 if lengths.max() <= 9 else int64
+	try:
+		numbers = fromstring(text.translate(bytes.maketrans(letters, b" " * len(letters)), b"."), dtype = dtype, sep = " ")
+	except ValueError:
+		return None
+	if len(numbers) != len(numberEnds):
+		return None
+	if dtype is int64 and ((numbers > decimalLimit).any() or (numbers < -decimalLimit).any()):
+		return None
+
+	# Ni siquiera al principio o al final de un numero ("1.0v" se leeria como
+	# 10) puede haber letras fuera de los prefijos: las que quedaron en el
+	# texto convertido no son numeros y del menor caracter de las letras para
+	# arriba no hay digitos
+	prefixLetters = sum(int(count) * (len(prefixes[kind]) - 1) for kind, count in enumerate(kindLines))
+	if count_nonzero(buffer >= min(letters)) != prefixLetters:
+		return None
+
+	# Caso comun: cada numero con la cantidad de decimales del primero de su
+	# tipo, o sea con un punto a esa distancia de su fin, dentro del numero, y
+	# ningun otro punto
+	kindDecimals = zeros(lineKinds.max() + 1, dtype = int64)
+	for kind in flatnonzero(bincount(lineKinds)):
+		number = firsts[argmax(lineKinds == kind)]
+		point = text.find(b".", int(numberStarts[number]), int(numberEnds[number]))
+		if point >= 0:
+			kindDecimals[kind] = numberEnds[number] - point - 1
+	decimals = repeat(kindDecimals[lineKinds], counts)
+	withPoint = decimals > 0
+	sameDecimals = kindDecimals.max() < len(powersOfTen) and count_nonzero(buffer == POINT) == count_nonzero(withPoint)
+	if sameDecimals and withPoint.all():
+		sameDecimals = (lengths > decimals).all() and (buffer[numberEnds - decimals - 1] == POINT).all()
+	elif sameDecimals:
+		sameDecimals = (lengths > decimals)[withPoint].all() and (buffer[(numberEnds - decimals - 1)[withPoint]] == POINT).all()
+
+	# Si no, el numero de cada punto (los prefijos no tienen) y sus
+	# decimales; a lo sumo un punto por numero
+	if not sameDecimals:
+		points = flatnonzero(buffer == POINT)
+		owners = searchsorted(numberEnds, points)
+		decimals = zeros(len(numbers), dtype = int64)
+		decimals[owners] = numberEnds[owners] - points - 1
+		if (diff(owners) == 0).any() or decimals.max() >= len(powersOfTen):
+			return None
+
+	values = numbers / powersOfTen[decimals]
+
+	# Los ceros negativos ("-0.000") se leen como 0: se mira su signo
+	zeroes = flatnonzero(numbers == 0)
+	values[zeroes[buffer[numberStarts[zeroes]] == MINUS]] = -0.0
+	return values, firsts, counts
+
+
+def SplitRows(values, firsts, counts, width):
+	"""Arreglo (lineas, width) en float32 con los numeros de unas lineas:
+	firsts es la posicion en values del primero de cada una y counts cuantos
+	tiene. Se recortan o se rellenan con ceros"""
+	rows = zeros((len(counts), width), dtype = float32)
+	for column in range(width):
+		present = counts > column
+		if present.all():
+			rows[:, column] = values[firsts + column]
+		else:
+			rows[present, column] = values[firsts[present] + column]
+	return rows
+
+
+def ParseBlock(block, lines, width, dtype):
+	"""Convierte un bloque de texto con `lines` lineas de numeros en un arreglo
+	(lines, width). Cada linea del bloque termina en " nan\n" (ver
+	KindText): los nan marcan donde termina cada linea entre los numeros
+	convertidos, asi que se convierte de una sola vez con numpy aunque las
+	lineas tengan distinta cantidad de valores (se recortan o se rellenan con
+	ceros). Si el texto no se puede convertir, linea por linea."""
+	values = zeros((lines, width), dtype = dtype)
+	if lines == 0:
+		return values
+
+	try:
+		numbers = fromstring(block, dtype = dtype, sep = " ")
+	except ValueError:
+		numbers = None
+
+	if numbers is not None:
+		ends = flatnonzero(isnan(numbers))
+		if len(ends) == lines:
+			counts = diff(ends, prepend = -1) - 1
+			if (counts == counts[0]).all():
+				numbers = numbers.reshape(lines, counts[0] + 1)[:, :min(counts[0], width)]
+				values[:, :numbers.shape[1]] = numbers
+			else:
+				# Lineas con distinta cantidad de valores: fila y columna de cada valor
+				rows = repeat(arange(lines), counts + 1)
+				columns = arange(len(numbers)) - repeat(ends - counts, counts + 1)
+				keep = columns < minimum(counts, width)[rows]
+				values[rows[keep], columns[keep]] = numbers[keep]
+			return values
+
+	for i, line in enumerate(block.split(b"\n")[:lines]):
+		row = line.split()[:-1][:width]
+		values[i, :len(row)] = [float(value) for value in row]
+	return values
+
 
 class Obj(object):
-	def __init__(self, filename):
+	def __init__(self, filename, describe = None):
+		# describe(ruta), si se da, se llama justo antes de leer el OBJ y cada
+		# MTL; sus resultados quedan en sources (el cache de mallas anota asi
+		# los archivos tal como estaban antes de parsearlos)
+		self.sources = []
+		if describe is not None:
+			self.sources.append(describe(filename))
+
 		# Asumiendo que el archivo es un formato .obj
-		with open(filename, "r") as file:
-			lines = file.read().splitlines()
-			
-		self.vertices = []
-		self.texCoords = []
-		self.normals = []
-		self.faces = []
-		self.faceMaterials = []  # Guardar el material para cada cara
+		with open(filename, "rb") as file:
+			data = file.read()
+
+		# Normalizar espacios y comentarios para poder clasificar las lineas
+		# mirando solo sus primeros caracteres
+		if not data.endswith(b"\n"):
+			data += b"\n"
+		if b"\t" in data or b"\r" in data:
+			data = data.replace(b"\t", b" ").replace(b"\r", b" ")
+		if HasTrailingComment(data):
+			data = re.sub(rb"#[^\n]*", b"", data)
+
+		# Inicio y fin de cada linea, y sus tres primeros caracteres
+		buffer, starts, ends = Lines(data)
+		if (buffer[starts] == SPACE).any():
+			data = re.sub(rb"(?m)^ +", b"", data)
+			buffer, starts, ends = Lines(data)
+
+		last = len(buffer) - 1
+		first = buffer[starts]
+		second = buffer[minimum(starts + 1, last)]
+		third = buffer[minimum(starts + 2, last)]
+
+		kinds = zeros(len(starts), dtype = uint8)
+		kinds[(first == ord("v")) & (second == SPACE)] = VERTEX
+		kinds[(first == ord("v")) & (second == ord("t")) & (third == SPACE)] = TEXCOORD
+		kinds[(first == ord("v")) & (second == ord("n")) & (third == SPACE)] = NORMAL
+		kinds[(first == ord("f")) & (second == SPACE)] = FACE
+
+		# Vertices (x, y, z; se ignoran w y colores por vertice), coordenadas de
+		# textura (u, v) y normales. Se leen todos juntos con ParseDecimals y
+		# si no se puede, cada tipo con ParseBlock
+		vectors = (VERTEX, 3), (TEXCOORD, 2), (NORMAL, 3)
+		parts, lines = KindLines(data, starts, ends, (kinds >= VERTEX) & (kinds <= NORMAL))
+		numbers = ParseDecimals(b"".join(parts), kinds[lines])
+		del parts
+
+		if numbers is not None:
+			values, firsts, counts = numbers
+			rows = []
+			for kind, width in vectors:
+				selected = kinds[lines] == kind
+				rows.append(SplitRows(values, firsts[selected], counts[selected], width))
+		else:
+			rows = []
+			for kind, width in vectors:
+				text, lines = KindText(data, starts, ends, kinds, kind, b" nan\n")
+				rows.append(ParseBlock(text, len(lines), width, float32))
+		self.vertices, self.texCoords, self.normals = rows
+		del numbers
+
+		# Caras: cada cara es una lista de esquinas v, v/vt, v//vn o v/vt/vn
+		# de cualquier largo. Se guardan todas las esquinas en un arreglo
+		# (esquinas, 3) de indices base 1 (0 = no existe) y el largo de cada cara
+		faceParts, faceLines = KindLines(data, starts, ends, kinds == FACE)
+		faceText = b"".join(faceParts)
+		del faceParts
+		self.faces, self.faceSizes = self.ParseFaces(faceText, len(faceLines))
+		self.faceStarts = cumsum(self.faceSizes) - self.faceSizes
+		del faceText
+
+		# Indices negativos: relativos al ultimo elemento definido antes de la cara
+		if (self.faces < 0).any():
+			cornerLines = repeat(faceLines, self.faceSizes)
+
+			for column, kind in enumerate((VERTEX, TEXCOORD, NORMAL)):
+				defined = searchsorted(flatnonzero(kinds == kind), cornerLines)
+				indices = self.faces[:, column]
+				self.faces[:, column] = where(indices < 0, indices + defined + 1, indices)
+
+		# Lineas restantes: cambios de material y archivos MTL
+		self.materialRanges = []  # (material, primera cara, cantidad de caras)
 		self.mtlFile = None
-		
+		self.mtlFiles = []  # Rutas de los MTL referenciados (existan o no)
 		current_material = None  # Material activo
-		
-		for line in lines:
-			# Si la linea no cuenta con un prefijo y un valor,
-			# seguimos a la siguiente la linea
-
-			line = line.rstrip()
+		firstFace = 0
 
+		for line in flatnonzero((kinds == OTHER) & ((first == ord("u")) | (first == ord("m")))):
 			try:
-				prefix, value = line.split(" ", 1)
+				prefix, value = data[starts[line]:ends[line]].decode().split(" ", 1)
 			except:
 				continue
-			
-			# Dependiendo del prefijo, parseamos y guardamos
-			# la informacion en el contenedor correcto
-			
-			if prefix == "v": # Vertices
-				vert = list(map(float,value.split(" ")))
-				self.vertices.append(vert)
-				
-			elif prefix == "vt": # Coordenadas de textura
-				vts = list(map(float,value.split(" ")))
-				self.texCoords.append([vts[0],vts[1]])
-				
-			elif prefix == "vn": # Normales
-				norm = list(map(float,value.split(" ")))
-				self.normals.append(norm)
-				
-			elif prefix == "f": # Caras
-				face = []
-				verts = value.split(" ")
-				for vert in verts:
-					vert = list(map(int, vert.split("/")))
-					# Asegurar que cada vértice tenga 3 valores (posición, texcoord, normal)
-					while len(vert) < 3:
-						vert.append(0)
-					face.append(vert)
-				self.faces.append(face)
-				self.faceMaterials.append(current_material)  # Guardar material para esta cara
-			
-			elif prefix == "usemtl":  # Cambiar material activo
+
+			if prefix == "usemtl":  # Cambiar material activo
+				faceIndex = int(searchsorted(faceLines, line))
+				if faceIndex > firstFace:
+					self.materialRanges.append((current_material, firstFace, faceIndex - firstFace))
 				current_material = value.strip()
-			
+				firstFace = faceIndex
+
 			elif prefix == "mtllib": # Archivo MTL
-				import os
 				# Obtener el directorio del archivo OBJ
 				obj_dir = os.path.dirname(filename)
 				if not obj_dir:
 					obj_dir = "."  # Directorio actual si está vacío
 				mtl_filename = os.path.join(obj_dir, value.strip())
+				self.mtlFiles.append(mtl_filename)
+				if describe is not None:
+					self.sources.append(describe(mtl_filename))
 				try:
-					self.mtlFile = self.LoadMTL(mtl_filename)
+					materials = self.LoadMTL(mtl_filename)
+					if self.mtlFile is None:
+						self.mtlFile = materials
+					else:
+						self.mtlFile.update(materials)
 				except Exception as e:
 					pass  # Silenciar errores de carga MTL
-	
+
+		if len(faceLines) > firstFace:
+			self.materialRanges.append((current_material, firstFace, len(faceLines) - firstFace))
+
+
+	def ParseFaces(self, faceText, faceCount):
+		"""Esquinas de todas las caras en un arreglo (esquinas, 3) y cantidad de
+		esquinas de cada cara. faceText tiene las lineas de caras completas
+		("f ...\n"): con faceTable cada cara empieza con un 0 entre los numeros
+		convertidos, y como 0 no es un indice valido marca donde empieza cada
+		cara. Si las esquinas no tienen todas el formato de la primera, se
+		cuentan las palabras de cada linea"""
+		if faceCount == 0:
+			return zeros((0, 3), dtype = int64), zeros(0, dtype = int64)
+
+		slash = frombuffer(faceText, dtype = uint8) == SLASH
+		slashes = count_nonzero(slash)
+		firstLine = faceText[:faceText.find(b"\n")].split()
+		firstCorner = firstLine[1] if len(firstLine) > 1 else b""
+
+		# Campos de cada esquina segun la primera; v//vn no tiene vt
+		if b"//" in firstCorner:
+			columns = [0, 2]
+		else:
+			columns = list(range(firstCorner.count(b"/") + 1))[:3]
+
+		try:
+			numbers = fromstring(faceText.translate(faceTable), dtype = int64, sep = " ")
+		except ValueError:
+			numbers = None
+
+		if numbers is not None:
+			faceStarts = flatnonzero(numbers == 0)
+			counts = diff(faceStarts, append = len(numbers)) - 1
+			if len(faceStarts) == faceCount and not (counts % len(columns)).any():
+				sizes = counts // len(columns)
+				cornerCount = int(sizes.sum())
+
+				# Todas las esquinas con el formato de la primera
+				if columns == [0, 2]:
+					sameFormat = slashes == 2 * cornerCount and faceText.count(b"//") == cornerCount
+				elif len(columns) == 2:
+					sameFormat = slashes == cornerCount and not re.search(rb"/[^\s/]*/", faceText)
+				else:
+					sameFormat = slashes == (len(columns) - 1) * cornerCount and not (slash[1:] & slash[:-1]).any()
+
+				if sameFormat:
+					# Todas las caras del mismo largo: sin el 0 de cada una
+					if (counts == counts[0]).all():
+						numbers = numbers.reshape(faceCount, counts[0] + 1)[:, 1:]
+					else:
+						numbers = numbers[numbers != 0]
+					numbers = numbers.reshape(cornerCount, len(columns))
+					if len(columns) == 3:
+						return numbers, sizes
+					result = zeros((cornerCount, 3), dtype = int64)
+					result[:, columns] = numbers
+					return result, sizes
+
+		# Formatos mezclados
+		faceText = faceText[len(prefixes[FACE]):].replace(b"\n" + prefixes[FACE], b"\n")
+		sizes = self.CountCorners(faceText, faceCount)
+		return self.ParseCorners(faceText, int(sizes.sum())), sizes
+
+
+	def CountCorners(self, faceText, faceCount):
+		"""Cantidad de esquinas (palabras) de cada linea del bloque de caras"""
+		text = frombuffer(faceText, dtype = uint8)
+		separator = (text == SPACE) | (text == NEWLINE)
+		wordStarts = flatnonzero(~separator[1:] & separator[:-1]) + 1
+		if len(text) and not separator[0]:
+			wordStarts = concatenate(([0], wordStarts))
+
+		lineOfWord = searchsorted(flatnonzero(text == NEWLINE), wordStarts)
+		return bincount(lineOfWord, minlength = faceCount).astype(int64)
+
+
+	def ParseCorners(self, faceText, cornerCount):
+		"""Convierte las esquinas de cara ('7', '7/3', '7//2', '7/3/2') en un
+		arreglo (esquinas, 3). Los campos vacios o ausentes quedan en 0."""
+		result = zeros((cornerCount, 3), dtype = int64)
+		if cornerCount == 0:
+			return result
+
+		slashes = faceText.count(b"/")
+
+		# Caso comun: todas las esquinas con el mismo formato
+		columns = None
+		if slashes == 2 * cornerCount:
+			faceText = faceText.replace(b"//", b"/0/")
+			columns = 3
+		elif slashes == cornerCount and not re.search(rb"/[^\s/]*/", faceText):
+			columns = 2
+		elif slashes == 0:
+			columns = 1
+
+		if columns is not None:
+			try:
+				values = fromstring(faceText.replace(b"/", b" "), dtype = int64, sep = " ")
+			except ValueError:
+				values = None
+
+			if values is not None and values.size == columns * cornerCount:
+				result[:, :columns] = values.reshape(cornerCount, columns)
+				return result
+
+		# Formatos mezclados
+		for i, corner in enumerate(faceText.split()):
+			for j, value in enumerate(corner.split(b"/")[:3]):
+				if value:
+					result[i, j] = int(value)
+		return result
+
+
 	def LoadMTL(self, filename):
 		"""Carga un archivo MTL y extrae las texturas"""
 		with open(filename, "r") as file:
@@ -113,5 +498,13 @@ class Obj(object):
 				texture_file = " ".join(parts[1:])
 				texture_path = os.path.join(mtl_dir, texture_file)
 				materials[current_material]['bump'] = texture_path
+			
+			elif prefix == "d" and current_material and len(parts) > 1:
+				# Opacidad (dissolve): 1 = opaco
+				materials[current_material]['dissolve'] = float(parts[1])
+			
+			elif prefix == "Tr" and current_material and len(parts) > 1:
+				# Transparencia (1 - d); si el material tambien tiene d, manda d
+				materials[current_material].setdefault('dissolve', 1.0 - float(parts[1]))
 		
 		return materials                                                                                                                                                                                                                                                                                                                                                                                           
\ No newline at end of file
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+
+from OpenGL.GL import *
+from OpenGL.GL.shaders import ShaderProgram, compileProgram, compileShader
+from OpenGL.raw.GL.VERSION.GL_4_1 import glGetProgramBinary as glGetProgramBinaryRaw
+from OpenGL.raw.GL.VERSION.GL_4_1 import glProgramBinary as glProgramBinaryRaw
+
+from numpy import empty, uint8
+
+from meshCache import MeshCache
+from glState import state
+from shader import Shader
+
+
+class ProgramCache(MeshCache):
+	"""Programas de shaders compartidos y guardados en disco.
+
+	Cada par de fuentes (vertex, fragment) se identifica por su hash: el mismo
+	par se compila una sola vez por proceso y todos los que lo pidan reciben
+	el mismo programa. Ademas, el programa enlazado se guarda con
+	glGetProgramBinary, asi que en el proximo arranque se carga con
+	glProgramBinary sin compilar GLSL. Las entradas se descartan si cambia el
+	driver (vendor, renderer o version)."""
+
+	magic = b"GLPROG01"
+	folder = "programs"
+
+	def __init__(self, directory = None):
+		MeshCache.__init__(self, directory)
+
+		self.programs = {}  # hash de las fuentes -> Shader
+		self.driver = None
+
+		self.hits = 0
+		self.loaded = 0
+		self.compiled = 0
+
+
+	def Key(self, vertexShader, fragmentShader):
+		digest = hashlib.sha1()
+		digest.update(vertexShader.encode())
+		digest.update(b"\0")
+		digest.update(fragmentShader.encode())
+		return digest.hexdigest()
+
+
+	def EntryPath(self, key):
+		return os.path.join(self.directory, key + ".program")
+
+
+	def Driver(self):
+		"""Identifica al driver; un binario solo sirve para el mismo"""
+		if self.driver is None:
+			self.driver = " | ".join((glGetString(name) or b"").decode(errors = "replace")
+									 for name in (GL_VENDOR, GL_RENDERER, GL_VERSION))
+		return self.driver
+
+
+	def Program(self, vertexShader, fragmentShader):
+		"""Programa enlazado para el par de fuentes, envuelto en un Shader (sus
+		uniforms se leen una sola vez, al enlazar)"""
+		key = self.Key(vertexShader, fragmentShader)
+		if key in self.programs:
+			self.hits += 1
+			return self.programs[key]
+
+		program = self.LoadBinary(key)
+		if program is not None:
+			self.loaded += 1
+		else:
+			program = compileProgram(compileShader(vertexShader, GL_VERTEX_SHADER),
+									 compileShader(fragmentShader, GL_FRAGMENT_SHADER),
+									 retrievable = True)
+			self.compiled += 1
+			self.StoreBinary(key, program)
+
+		self.programs[key] = Shader(program, (vertexShader, fragmentShader))
+		return self.programs[key]
+
+
+	def LoadBinary(self, key):
+		"""Programa desde el binario guardado, o None si no hay uno valido"""
+		path = self.EntryPath(key)
+		header = self.ReadHeader(path)
+		if header is None or header.get('driver') != self.Driver():
+			return None
+
+		try:
+			binary = self.Map(path, uint8, header['size'], header['offset'])
+		except (OSError, ValueError):
+			return None
+
+		# Se llama a GL directo con el puntero: asi no se copia el mapeo
+		program = glCreateProgram()
+		glProgramBinaryRaw(program, header['format'], ctypes.c_void_p(binary.ctypes.data), header['size'])
+
+		# El driver puede rechazar el binario (por ejemplo tras una
+		# actualizacion con el mismo nombre): se compila de nuevo
+		if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+			state.DeleteProgram(program)
+			return None
+		return ShaderProgram(program)
+
+
+	def StoreBinary(self, key, program):
+		length = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+		if not length:
+			return
+
+		binary = empty(length, dtype = uint8)
+		written = GLsizei()
+		format = GLenum()
+		glGetProgramBinaryRaw(program, length, ctypes.byref(written), ctypes.byref(format),
+							  ctypes.c_void_p(binary.ctypes.data))
+		if glGetError() != GL_NO_ERROR or not written.value:
+			return
+		binary = binary[:written.value]
+
+		header = {'driver': self.Driver(),
+				  'format': int(format.value),
+				  'size': len(binary),
+				  'offset': 0}
+		header['offset'] = self.Align(len(self.magic) + len(json.dumps(header)) + 32)
+
+		encoded = json.dumps(header).encode()
+		self.Write(self.EntryPath(key), [self.magic, encoded,
+										 b"\0" * (header['offset'] - len(self.magic) - len(encoded)),
+										 binary])
+
+
+	def Report(self):
+		return ("Programas: %d compilados, %d cargados del disco, %d reusados"
+				% (self.compiled, self.loaded, self.hits))
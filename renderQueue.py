@@ -0,0 +1,103 @@
+from OpenGL.GL import *
+
+from glState import state
+
+
+def SortKey(shader, texture, vao):
+	"""Clave de 64 bits de un item: programa en los 16 bits altos, textura en
+	los 24 siguientes y VAO en los 24 bajos. Ordenar por la clave junta los
+	items de un mismo programa y, dentro de ellos, los de una misma textura"""
+	program = int(shader.program) if shader is not None else 0
+	return ((program & 0xFFFF) << 48) | ((int(texture or 0) & 0xFFFFFF) << 24) | (int(vao) & 0xFFFFFF)
+
+
+class RenderQueue(object):
+	"""Cola de dibujo de un frame.
+
+	Cada item es un rango de indices de un modelo con su shader, su textura y
+	su transformacion (la del modelo). Los opacos se ordenan por SortKey para
+	cambiar de programa, textura y VAO lo menos posible; los transparentes van
+	en otro grupo, despues, de atras hacia adelante y con blending."""
+
+	def __init__(self):
+		self.opaque = []
+		self.transparent = []
+
+		# Cambios de estado y llamadas de dibujo del ultimo Execute()
+		self.stats = {'programs': 0, 'textures': 0, 'vaos': 0, 'draws': 0}
+
+
+	def Clear(self):
+		self.opaque = []
+		self.transparent = []
+
+
+	def Add(self, shader, obj, drawCall, depth = 0.0):
+		"""depth es la profundidad en espacio de vista (z, negativa hacia
+		adelante); solo ordena a los transparentes"""
+		item = {'key': SortKey(shader, drawCall['texture'], obj.VAO),
+				'shader': shader,
+				'obj': obj,
+				'drawCall': drawCall,
+				'depth': depth}
+
+		if drawCall.get('transparent'):
+			self.transparent.append(item)
+		else:
+			self.opaque.append(item)
+
+
+	def Sort(self):
+		self.opaque.sort(key = lambda item: item['key'])
+
+		# El mas lejano (z mas negativa) primero
+		self.transparent.sort(key = lambda item: (item['depth'], item['key']))
+
+
+	def Execute(self, sendUniforms):
+		"""Dibuja los items; state omite los cambios de programa, textura o
+		VAO que no hacen falta, y stats cuenta los que si se hicieron.
+		sendUniforms(shader, obj) envia los uniforms del objeto despues de
+		activar el programa"""
+		stats = {'programs': 0, 'textures': 0, 'vaos': 0, 'draws': 0}
+		current = {'shader': None, 'obj': None}
+
+		for bucket in (self.opaque, self.transparent):
+			if not bucket:
+				continue
+
+			if bucket is self.transparent:
+				state.Enable(GL_BLEND)
+				state.BlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+				state.DepthMask(False)
+
+			for item in bucket:
+				shader, obj, drawCall = item['shader'], item['obj'], item['drawCall']
+
+				# Sin shader se dibuja con el programa que este activo, como antes
+				if shader is not None:
+					if shader is not current['shader']:
+						if shader.Use():
+							stats['programs'] += 1
+						current['shader'] = shader
+						current['obj'] = None
+
+					if obj is not current['obj']:
+						sendUniforms(shader, obj)
+						current['obj'] = obj
+
+				if state.BindVertexArray(obj.VAO):
+					stats['vaos'] += 1
+
+				if drawCall['texture'] is not None and state.BindTexture(drawCall['target'], drawCall['texture']):
+					stats['textures'] += 1
+
+				obj.Draw(drawCall)
+				stats['draws'] += 1
+
+			if bucket is self.transparent:
+				state.DepthMask(True)
+				state.Disable(GL_BLEND)
+
+		state.BindVertexArray(0)
+		self.stats = stats
@@ -0,0 +1,62 @@
+from OpenGL.GL import *
+
+from numpy import frombuffer, uint8
+
+from glState import state
+
+
+class RenderTarget(object):
+	"""Framebuffer fuera de pantalla (FBO) con color RGBA8 y profundidad de
+	24 bits, del tamaño de la vista. El Renderer lo enlaza al empezar cada
+	frame si se lo pasa como renderTarget; ReadPixels() devuelve lo dibujado
+	como imagen de numpy.
+
+	Tiene get_rect(), como la ventana de pygame, asi que tambien sirve como
+	screen del Renderer cuando no hay ventana."""
+
+	def __init__(self, width, height):
+		self.width = width
+		self.height = height
+
+		self.FBO = glGenFramebuffers(1)
+		state.BindFramebuffer(self.FBO)
+
+		self.colorBuffer = glGenRenderbuffers(1)
+		glBindRenderbuffer(GL_RENDERBUFFER, self.colorBuffer)
+		glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+		glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.colorBuffer)
+
+		self.depthBuffer = glGenRenderbuffers(1)
+		glBindRenderbuffer(GL_RENDERBUFFER, self.depthBuffer)
+		glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, width, height)
+		glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.depthBuffer)
+
+		glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+		status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+		if status != GL_FRAMEBUFFER_COMPLETE:
+			self.Delete()
+			raise RuntimeError("Framebuffer incompleto (0x%04X)" % status)
+
+
+	def get_rect(self):
+		return (0, 0, self.width, self.height)
+
+
+	def Bind(self):
+		state.BindFramebuffer(self.FBO)
+
+
+	def ReadPixels(self):
+		"""Imagen (alto, ancho, 3) en uint8, con la primera fila arriba"""
+		self.Bind()
+		glPixelStorei(GL_PACK_ALIGNMENT, 1)
+		data = glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE)
+
+		# GL lee de abajo hacia arriba
+		return frombuffer(data, dtype = uint8).reshape(self.height, self.width, 3)[::-1].copy()
+
+
+	def Delete(self):
+		state.DeleteFramebuffers([self.FBO])
+		glDeleteRenderbuffers(2, [self.colorBuffer, self.depthBuffer])
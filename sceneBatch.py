@@ -0,0 +1,204 @@
+from OpenGL.GL import *
+
+from numpy import concatenate, dtype, float32, frombuffer, uint32, zeros
+
+from buffer import Buffer
+from glState import state
+from model import vertexFormat
+
+
+# Punto de enlace del SSBO con los datos de cada dibujo (BatchDraws en los
+# shaders)
+drawBinding = 1
+
+# Un elemento de BatchDraws (std430): matriz de modelo
+drawFormat = dtype([('modelMatrix', float32, (4, 4))])
+
+
+def BatchedSource(source):
+	"""Fuente de un shader de los modelos para el modo por lotes: GLSL 450
+	con gl_DrawIDARB (GL_ARB_shader_draw_parameters) y BATCHED definido"""
+	return source.replace("#version 330 core",
+						  "#version 450 core\n"
+						  "#extension GL_ARB_shader_draw_parameters : require\n"
+						  "#define BATCHED", 1)
+
+
+def BatchingSupported():
+	"""Hace falta GL 4.3 (SSBO y glMultiDrawElementsIndirect) y gl_DrawIDARB"""
+	try:
+		version = glGetIntegerv(GL_MAJOR_VERSION) * 10 + glGetIntegerv(GL_MINOR_VERSION)
+		extensions = set(glGetStringi(GL_EXTENSIONS, i).decode()
+						 for i in range(glGetIntegerv(GL_NUM_EXTENSIONS)))
+	except Exception:
+		return False
+	return version >= 43 and "GL_ARB_shader_draw_parameters" in extensions
+
+
+class SceneBatch(object):
+	"""Dibuja muchos modelos con una sola llamada por programa.
+
+	Las mallas de los modelos se copian a un solo arreglo de vertices y uno
+	de indices (la arena, con un VAO propio). Cada frame se arma un
+	comando de glMultiDrawElementsIndirect por rango de material visible y,
+	en un SSBO, su matriz de modelo; los shaders BATCHED la leen con
+	gl_DrawIDARB. Hay una llamada por programa y textura, con la textura en
+	tex0 como en el dibujo normal."""
+
+	def __init__(self):
+		self.models = ()
+		self.key = ()
+		self.entries = {}  # id(model) -> {'baseVertex', 'firstIndex'}
+
+		self.VAO = None
+		self.vertexBuffer = None
+		self.indexBuffer = None
+		self.commandBuffer = None
+		self.drawBuffer = None
+
+		self.items = []
+
+		# Llamadas de GL y dibujos que hicieron del ultimo Execute()
+		self.stats = {'calls': 0, 'draws': 0}
+
+
+	def Build(self, models):
+		"""Arma la arena con las mallas de models, si cambio el conjunto o
+		la malla de alguno (meshVersion, por ejemplo al llegar sus niveles de
+		detalle)"""
+		models = tuple(models)
+		key = tuple((id(model), model.meshVersion) for model in models)
+		if key == self.key:
+			return
+		self.DeleteArena()
+		self.models = models
+		self.key = key
+		if not models:
+			return
+
+		vertices = []
+		indices = []
+		baseVertex = firstIndex = 0
+		for model in models:
+			self.entries[id(model)] = {'baseVertex': baseVertex, 'firstIndex': firstIndex}
+			vertices.append(model.vertices)
+			indices.append(model.indices.astype(uint32))
+			baseVertex += len(model.vertices)
+			firstIndex += len(model.indices)
+
+		self.VAO = glGenVertexArrays(1)
+		state.BindVertexArray(self.VAO)
+
+		self.vertexBuffer = Buffer(concatenate(vertices).astype(vertexFormat))
+		self.indexBuffer = Buffer(concatenate(indices), target = GL_ELEMENT_ARRAY_BUFFER)
+
+		stride = vertexFormat.itemsize
+		self.vertexBuffer.Use(0, 3, stride, vertexFormat.fields['position'][1])
+		self.vertexBuffer.Use(1, 2, stride, vertexFormat.fields['texCoords'][1])
+		self.vertexBuffer.Use(2, 3, stride, vertexFormat.fields['normal'][1])
+
+		state.BindVertexArray(0)
+
+
+	def Accepts(self, obj, drawCall):
+		"""Rangos que se pueden dibujar por lotes: de un Model comun, opacos y
+		con una textura 2D (el resto sigue en la RenderQueue)"""
+		return (getattr(obj, 'batchable', False) and
+				drawCall['target'] == GL_TEXTURE_2D and
+				drawCall['texture'] is not None and
+				not drawCall['transparent'])
+
+
+	def Clear(self):
+		self.items = []
+
+
+	def Add(self, shader, obj, drawCall):
+		self.items.append((shader, obj, drawCall))
+
+
+	def Execute(self):
+		"""Dibuja los items agregados desde Clear(). shader es la variante
+		BATCHED de cada programa"""
+		stats = {'calls': 0, 'draws': 0}
+		if not self.items or self.VAO is None:
+			self.stats = stats
+			return
+
+		# Una llamada por programa y textura: gl_DrawIDARB no es uniforme
+		# dentro de la llamada, asi que no sirve para elegir la textura de un
+		# arreglo de samplers (en AMD las texturas se mezclan entre dibujos)
+		groups = {}
+		for shader, obj, drawCall in self.items:
+			key = (id(shader), drawCall['texture'])
+			groups.setdefault(key, (shader, drawCall['texture'], []))[2].append((obj, drawCall))
+
+		calls = []
+		commands = []
+		modelMatrices = []
+		for key in sorted(groups):
+			shader, texture, items = groups[key]
+
+			first = len(commands)
+			for obj, drawCall in items:
+				entry = self.entries[id(obj)]
+				commands.append((drawCall['indexCount'], 1,
+								 entry['firstIndex'] + drawCall['first'],
+								 entry['baseVertex'], 0))
+				modelMatrices.append(obj.GetModelMatrix())
+			calls.append((shader, texture, first, len(commands) - first))
+
+		commandData = zeros((len(commands), 5), dtype = uint32)
+		commandData[:] = commands
+
+		drawData = zeros(len(modelMatrices), dtype = drawFormat)
+		for i, modelMatrix in enumerate(modelMatrices):
+			drawData['modelMatrix'][i] = frombuffer(modelMatrix.to_bytes(), dtype = float32).reshape(4, 4)
+
+		if self.commandBuffer is None:
+			self.commandBuffer = Buffer(commandData, usage = GL_STREAM_DRAW, target = GL_DRAW_INDIRECT_BUFFER)
+			self.drawBuffer = Buffer(drawData, usage = GL_STREAM_DRAW, target = GL_SHADER_STORAGE_BUFFER)
+		else:
+			self.commandBuffer.Orphan(commandData)
+			self.drawBuffer.Orphan(drawData)
+
+		glBindBufferBase(GL_SHADER_STORAGE_BUFFER, drawBinding, self.drawBuffer.VBO)
+		glBindBuffer(GL_DRAW_INDIRECT_BUFFER, self.commandBuffer.VBO)
+		state.BindVertexArray(self.VAO)
+
+		for shader, texture, first, count in calls:
+			shader.Use()
+			shader.Set("batchDrawOffset", first)
+			state.BindTexture(GL_TEXTURE_2D, texture)
+
+			glMultiDrawElementsIndirect(GL_TRIANGLES, GL_UNSIGNED_INT,
+										ctypes.c_void_p(first * commandData.itemsize * 5),
+										count, 0)
+			stats['calls'] += 1
+			stats['draws'] += count
+
+		state.BindVertexArray(0)
+		glBindBuffer(GL_DRAW_INDIRECT_BUFFER, 0)
+		self.stats = stats
+
+
+	def DeleteArena(self):
+		if self.VAO is not None:
+			self.vertexBuffer.Delete()
+			self.indexBuffer.Delete()
+			state.DeleteVertexArrays([self.VAO])
+		self.VAO = None
+		self.vertexBuffer = None
+		self.indexBuffer = None
+		self.models = ()
+		self.key = ()
+		self.entries = {}
+
+
+	def Delete(self):
+		self.DeleteArena()
+		if self.commandBuffer is not None:
+			self.commandBuffer.Delete()
+			self.drawBuffer.Delete()
+		self.commandBuffer = None
+		self.drawBuffer = None
@@ -0,0 +1,125 @@
+import glm
+
+
+class SceneNode(object):
+	"""Nodo del grafo de escena: una transformacion (position, rotation en
+	grados, scale) relativa a su padre, y sus hijos.
+
+	Las matrices local, world y normal se guardan y se recalculan solo cuando
+	cambia position, rotation o scale (del nodo o de algun ancestro). Los
+	vectores se pueden modificar en el lugar (node.position.x = 3) o
+	reemplazar: se compara contra la copia con la que se calculo la matriz.
+	Un nodo sin malla sirve para agrupar y mover varios modelos juntos."""
+
+	# Los nodos que se dibujan (Model) lo ponen en True
+	drawable = False
+
+	def __init__(self):
+		self.position = glm.vec3(0,0,0)
+		self.rotation = glm.vec3(0,0,0)
+		self.scale = glm.vec3(1,1,1)
+
+		self.parent = None
+		self.children = []
+
+		# Copias de position, rotation y scale con las que se calculo
+		# localMatrix; localVersion sube cada vez que se recalcula
+		self.localPosition = None
+		self.localRotation = None
+		self.localScale = None
+		self.localMatrix = glm.mat4(1)
+		self.localVersion = 0
+
+		# worldVersion sube cada vez que cambia worldMatrix; los hijos guardan
+		# la version del padre con la que calcularon la suya
+		self.worldMatrix = glm.mat4(1)
+		self.worldVersion = 0
+		self.parentVersion = None
+		self.localChanged = True
+
+		self.normalMatrix = glm.mat3(1)
+		self.normalVersion = None
+
+
+	def AddChild(self, child):
+		if child.parent is not None:
+			child.parent.RemoveChild(child)
+		child.parent = self
+		child.parentVersion = None
+		self.children.append(child)
+		return child
+
+
+	def RemoveChild(self, child):
+		self.children.remove(child)
+		child.parent = None
+		child.parentVersion = None
+		child.localChanged = True
+
+
+	def Walk(self):
+		"""El nodo y todos sus descendientes, padres antes que hijos"""
+		yield self
+		for child in self.children:
+			for node in child.Walk():
+				yield node
+
+
+	def GetLocalMatrix(self):
+		if (self.position != self.localPosition or
+			self.rotation != self.localRotation or
+			self.scale != self.localScale):
+
+			self.localPosition = glm.vec3(self.position)
+			self.localRotation = glm.vec3(self.rotation)
+			self.localScale = glm.vec3(self.scale)
+
+			identity = glm.mat4(1)
+
+			translateMat = glm.translate(identity, self.position)
+
+			pitchMat = glm.rotate(identity, glm.radians(self.rotation.x), glm.vec3(1,0,0))
+			yawMat =   glm.rotate(identity, glm.radians(self.rotation.y), glm.vec3(0,1,0))
+			rollMat =  glm.rotate(identity, glm.radians(self.rotation.z), glm.vec3(0,0,1))
+
+			rotationMat = pitchMat * yawMat * rollMat
+
+			scaleMat = glm.scale(identity, self.scale)
+
+			self.localMatrix = translateMat * rotationMat * scaleMat
+			self.localVersion += 1
+			self.localChanged = True
+
+		return self.localMatrix
+
+
+	def GetWorldMatrix(self):
+		localMatrix = self.GetLocalMatrix()
+
+		if self.parent is None:
+			if self.localChanged:
+				self.worldMatrix = localMatrix
+				self.worldVersion += 1
+		else:
+			parentMatrix = self.parent.GetWorldMatrix()
+			if self.localChanged or self.parentVersion != self.parent.worldVersion:
+				self.worldMatrix = parentMatrix * localMatrix
+				self.worldVersion += 1
+				self.parentVersion = self.parent.worldVersion
+
+		self.localChanged = False
+		return self.worldMatrix
+
+
+	def GetNormalMatrix(self):
+		"""Inversa transpuesta de la parte 3x3 de worldMatrix, para llevar
+		normales a espacio de mundo con escalas no uniformes"""
+		worldMatrix = self.GetWorldMatrix()
+		if self.normalVersion != self.worldVersion:
+			self.normalMatrix = glm.transpose(glm.inverse(glm.mat3(worldMatrix)))
+			self.normalVersion = self.worldVersion
+		return self.normalMatrix
+
+
+	def GetModelMatrix(self):
+		return self.GetWorldMatrix()
@@ -0,0 +1,96 @@
+import glm # pip install PyGLM
+from OpenGL.GL import *
+
+from frameUniforms import frameBinding, frameBlock
+from glState import state
+
+
+# Llamadas a glUniform* hechas y omitidas (valor repetido) desde el ultimo
+# reinicio; el Renderer las reinicia en cada frame
+uniformCalls = {'issued': 0, 'skipped': 0}
+
+
+class Shader(object):
+	"""Programa enlazado con sus uniforms.
+
+	Al crearlo se leen una sola vez los uniforms activos (nombre, tipo y
+	location). Set() guarda el ultimo valor enviado a cada uniform y no
+	vuelve a llamar a glUniform* si el valor no cambio; como el valor de un
+	uniform es parte del estado del programa, esto vale aunque se cambie de
+	programa entre llamadas."""
+
+	def __init__(self, program, sources = None):
+		self.program = program
+
+		# Fuentes (vertex, fragment) con las que se enlazo, si se conocen;
+		# sirven para compilar variantes (por ejemplo para dibujar por lotes)
+		self.sources = sources
+
+		self.locations = {}  # nombre -> location
+		self.types = {}      # nombre -> tipo GL (GL_FLOAT_MAT4, GL_SAMPLER_2D, ...)
+		self.values = {}     # nombre -> ultimo valor enviado
+
+		for index in range(glGetProgramiv(program, GL_ACTIVE_UNIFORMS)):
+			name, size, type = glGetActiveUniform(program, index)
+			name = name.decode() if isinstance(name, bytes) else name
+
+			# Los arreglos se reportan como "nombre[0]"
+			if name.endswith("[0]"):
+				name = name[:-3]
+
+			location = glGetUniformLocation(program, name)
+			if location >= 0:
+				self.locations[name] = location
+				self.types[name] = type
+
+		# Los uniforms de FrameUniforms no tienen location: se leen del UBO
+		# enlazado en frameBinding
+		blockIndex = glGetUniformBlockIndex(program, frameBlock)
+		if blockIndex != GL_INVALID_INDEX:
+			glUniformBlockBinding(program, blockIndex, frameBinding)
+
+
+	def Use(self):
+		return state.UseProgram(self.program)
+
+
+	def Set(self, name, value):
+		"""Envia value al uniform name si cambio desde la ultima vez. Los
+		uniforms que el programa no usa se ignoran"""
+		location = self.locations.get(name)
+		if location is None:
+			return
+
+		if name in self.values and self.values[name] == value:
+			uniformCalls['skipped'] += 1
+			return
+
+		# Copia propia del valor: los vectores y matrices de glm se modifican
+		# en el lugar (por ejemplo pointLight), y value_ptr necesita que el
+		# objeto siga vivo
+		type = self.types[name]
+		if type == GL_FLOAT:
+			value = float(value)
+			glUniform1f(location, value)
+		elif type == GL_FLOAT_VEC2:
+			value = glm.vec2(value)
+			glUniform2fv(location, 1, glm.value_ptr(value))
+		elif type == GL_FLOAT_VEC3:
+			value = glm.vec3(value)
+			glUniform3fv(location, 1, glm.value_ptr(value))
+		elif type == GL_FLOAT_VEC4:
+			value = glm.vec4(value)
+			glUniform4fv(location, 1, glm.value_ptr(value))
+		elif type == GL_FLOAT_MAT3:
+			value = glm.mat3(value)
+			glUniformMatrix3fv(location, 1, GL_FALSE, glm.value_ptr(value))
+		elif type == GL_FLOAT_MAT4:
+			value = glm.mat4(value)
+			glUniformMatrix4fv(location, 1, GL_FALSE, glm.value_ptr(value))
+		else:
+			# Enteros, booleanos y samplers (unidad de textura)
+			value = int(value)
+			glUniform1i(location, value)
+
+		self.values[name] = value
+		uniformCalls['issued'] += 1
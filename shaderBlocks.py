@@ -0,0 +1,145 @@
+import re
+
+
+# GLSL
+
+# Bloques comunes a los shaders de los modelos. Cada shader los pide con una
+# linea #include "Nombre" que IncludeBlocks reemplaza antes de compilar; asi
+# cada bloque se escribe una sola vez y los shaders solo tienen su propio codigo
+
+# Uniforms por frame (frameUniforms.py guarda el UBO con este mismo orden)
+frameUniformsBlock = '''
+// Uniforms iguales para todos los objetos del frame (frameUniforms.py)
+layout (std140) uniform FrameUniforms
+{
+    mat4 viewMatrix;
+    mat4 projectionMatrix;
+    vec3 pointLight;
+    float ambientLight;
+    float time;
+    float value;
+};
+'''
+
+# Capa de textura de cada vertice (model.py, modo TEXTURE_ARRAY)
+textureArrayVertexBlock = '''
+#ifdef TEXTURE_ARRAY
+layout (location = 3) in float inLayer;
+flat out float fragLayer;
+#endif
+'''
+
+textureArrayVertexMain = '''
+#ifdef TEXTURE_ARRAY
+    fragLayer = inLayer;
+#endif
+'''
+
+# Textura del material: SampleTex0(uv) lee de la que corresponda segun el modo
+textureSamplerBlock = '''
+#ifdef TEXTURE_ARRAY
+// Texturas de todos los materiales en capas de un GL_TEXTURE_2D_ARRAY
+flat in float fragLayer;
+uniform sampler2DArray tex0;
+#define SampleTex0(uv) texture(tex0, vec3(uv, fragLayer))
+#else
+uniform sampler2D tex0;
+#define SampleTex0(uv) texture(tex0, uv)
+#endif
+'''
+
+# Datos por instancia (instancedModel.py, modo INSTANCED). Los shaders animan
+# con instanceTime, el time del frame mas el desfase de la instancia (sin
+# instancias es time); las funciones auxiliares lo reciben como parametro
+instancedVertexBlock = '''
+#ifdef INSTANCED
+// Datos de cada instancia (divisor 1): matriz relativa al modelo, tinte y
+// desfase de tiempo
+layout (location = 4) in mat4 inInstanceMatrix;
+layout (location = 8) in vec4 inInstanceTint;
+layout (location = 9) in float inInstanceTime;
+flat out vec4 fragTint;
+flat out float fragTimeOffset;
+#endif
+'''
+
+instancedVertexMain = '''
+#ifdef INSTANCED
+    // La variable local tapa al uniform: el resto del shader usa la matriz
+    // de la instancia sin cambios
+    mat4 modelMatrix = modelMatrix * inInstanceMatrix;
+    float instanceTime = time + inInstanceTime;
+    fragTint = inInstanceTint;
+    fragTimeOffset = inInstanceTime;
+#else
+    float instanceTime = time;
+#endif
+'''
+
+instancedFragmentBlock = '''
+#ifdef INSTANCED
+// Tinte y desfase de tiempo de la instancia (ver los vertex shaders)
+flat in vec4 fragTint;
+flat in float fragTimeOffset;
+#endif
+'''
+
+instancedFragmentMain = '''
+#ifdef INSTANCED
+    float instanceTime = time + fragTimeOffset;
+#else
+    float instanceTime = time;
+#endif
+'''
+
+instancedFragmentTint = '''
+#ifdef INSTANCED
+    fragColor *= fragTint;
+#endif
+'''
+
+# Dibujo por lotes (sceneBatch.py, modo BATCHED)
+batchedVertexBlock = '''
+#ifdef BATCHED
+// Dibujo por lotes (sceneBatch.py): matriz de modelo de cada dibujo en un
+// SSBO, indexado por gl_DrawIDARB
+struct BatchDraw
+{
+    mat4 modelMatrix;
+};
+layout (std430, binding = 1) readonly buffer BatchDraws
+{
+    BatchDraw batchDraws[];
+};
+uniform int batchDrawOffset;
+#endif
+'''
+
+batchedVertexMain = '''
+#ifdef BATCHED
+    mat4 modelMatrix = batchDraws[batchDrawOffset + gl_DrawIDARB].modelMatrix;
+#endif
+'''
+
+
+blocks = {
+	"FrameUniforms": frameUniformsBlock,
+	"TextureArrayVertex": textureArrayVertexBlock,
+	"TextureArrayVertexMain": textureArrayVertexMain,
+	"TextureSampler": textureSamplerBlock,
+	"InstancedVertex": instancedVertexBlock,
+	"InstancedVertexMain": instancedVertexMain,
+	"InstancedFragment": instancedFragmentBlock,
+	"InstancedFragmentMain": instancedFragmentMain,
+	"InstancedFragmentTint": instancedFragmentTint,
+	"BatchedVertex": batchedVertexBlock,
+	"BatchedVertexMain": batchedVertexMain,
+}
+
+includePattern = re.compile(r'^#include "(\w+)"$', re.M)
+
+
+def IncludeBlocks(source):
+	"""Reemplaza cada linea #include "Nombre" por el bloque de ese nombre; un
+	nombre desconocido es un KeyError"""
+	return includePattern.sub(lambda match: blocks[match.group(1)].strip("\n"), source)
@@ -7,15 +7,20 @@ from OpenGL.GL.EXT.texture_filter_anisotropic import GL_MAX_TEXTURE_MAX_ANISOTRO
 import pygame
 import math
 
+from glState import state
+from shader import Shader
+from shaderBlocks import IncludeBlocks
+from textureCache import DecodeTexture, UploadLevels
+
 
 skybox_vertex_shader = '''
 #version 450 core
 
 layout (location = 0) in vec3 inPosition;
 
-uniform mat4 viewMatrix;
-uniform mat4 projectionMatrix;
-
+// Mismo bloque de uniforms por frame que los shaders de los modelos; aqui
+// solo se usan las matrices
+#include "FrameUniforms"
 
 out vec3 texCoords;
 
@@ -127,41 +132,49 @@ class Skybox(object):
 		self.vertexBuffer = array(skyboxVertices, dtype = float32 )
 		self.VBO = glGenBuffers(1)
 		
+		# Subir el cubo una sola vez y grabar el formato en un VAO;
+		# Render() solo enlaza el VAO
+		self.VAO = glGenVertexArrays(1)
+		state.BindVertexArray(self.VAO)
+		
+		glBindBuffer(GL_ARRAY_BUFFER, self.VBO)
+		glBufferData(GL_ARRAY_BUFFER,
+					 self.vertexBuffer.nbytes,
+					 self.vertexBuffer,
+					 GL_STATIC_DRAW)
+		
+		glEnableVertexAttribArray(0)
+		
+		glVertexAttribPointer(0,
+							  3,
+							  GL_FLOAT,
+							  GL_FALSE,
+							  4 * 3,
+							  ctypes.c_void_p(0) )
+		
+		state.BindVertexArray(0)
+		
 		# Seleccionar shader según tipo de textura
 		if self.is360:
-			self.shaders = compileProgram(compileShader(skybox_vertex_shader, GL_VERTEX_SHADER),
-										  compileShader(skybox_fragment_shader_360, GL_FRAGMENT_SHADER))
+			self.shaders = Shader(compileProgram(compileShader(IncludeBlocks(skybox_vertex_shader), GL_VERTEX_SHADER),
+												 compileShader(skybox_fragment_shader_360, GL_FRAGMENT_SHADER)))
 		else:
-			self.shaders = compileProgram(compileShader(skybox_vertex_shader, GL_VERTEX_SHADER),
-										  compileShader(skybox_fragment_shader, GL_FRAGMENT_SHADER))
+			self.shaders = Shader(compileProgram(compileShader(IncludeBlocks(skybox_vertex_shader), GL_VERTEX_SHADER),
+												 compileShader(skybox_fragment_shader, GL_FRAGMENT_SHADER)))
 		
 		self.texture = glGenTextures(1)
 		
 		if self.is360:
 			# Cargar imagen 360 como textura 2D
-			glBindTexture(GL_TEXTURE_2D, self.texture)
-			
-			# Cargar imagen y convertir a formato RGB si es necesario
-			texture = pygame.image.load(textureList[0])
-			texture = texture.convert()  # Asegurar formato consistente
-			textureData = pygame.image.tostring(texture, "RGB", True)  # True = flip vertical
+			state.BindTexture(GL_TEXTURE_2D, self.texture)
 			
-			width = texture.get_width()
-			height = texture.get_height()
+			# Imagen en RGB invertida en Y, con sus mipmaps ya calculados; desde
+			# el cache en disco no hace falta decodificar el JPG
+			texture = DecodeTexture(textureList[0], GL_RGB, True)
 			
-			# Usar formato interno de alta calidad (RGB8 en lugar de RGB genérico)
-			glTexImage2D(GL_TEXTURE_2D,
-						 0,
-						 GL_RGB8,  # Formato interno de 8 bits por canal
-						 width,
-						 height,
-						 0,
-						 GL_RGB,
-						 GL_UNSIGNED_BYTE,
-						 textureData)
-			
-			# Generar mipmaps para mejor calidad
-			glGenerateMipmap(GL_TEXTURE_2D)
+			# Usar formato interno de alta calidad (RGB8 en lugar de RGB genérico),
+			# subiendo los mipmaps nivel por nivel
+			UploadLevels(GL_TEXTURE_2D, texture, GL_RGB8)
 			
 			# Filtros de máxima calidad
 			glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
@@ -177,21 +190,22 @@ class Skybox(object):
 				pass  # Si no está disponible, continuar sin anisotropic filtering
 		else:
 			# Cargar cubemap de 6 caras
-			glBindTexture(GL_TEXTURE_CUBE_MAP, self.texture)
+			state.BindTexture(GL_TEXTURE_CUBE_MAP, self.texture)
 			
+			glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
 			for i in range(len(textureList)):
-				texture = pygame.image.load(textureList[i])
-				textureData = pygame.image.tostring(texture, "RGB", False)
+				texture = DecodeTexture(textureList[i], GL_RGB, False)
 				
 				glTexImage2D(GL_TEXTURE_CUBE_MAP_POSITIVE_X + i,
 							 0,
 							 GL_RGB,
-							 texture.get_width(),
-							 texture.get_height(),
+							 texture['width'],
+							 texture['height'],
 							 0,
 							 GL_RGB,
 							 GL_UNSIGNED_BYTE,
-							 textureData)
+							 texture['data'])
+			glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
 			
 			glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
 			glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
@@ -204,43 +218,23 @@ class Skybox(object):
 		if self.shaders == None:
 			return
 		
-		glUseProgram(self.shaders)
-		
-		if self.cameraRef is not None:
-			glUniformMatrix4fv( glGetUniformLocation(self.shaders, "viewMatrix"),
-								1, GL_FALSE, glm.value_ptr( self.cameraRef.viewMatrix) )
-			
-			glUniformMatrix4fv( glGetUniformLocation(self.shaders, "projectionMatrix"),
-								1, GL_FALSE, glm.value_ptr( self.cameraRef.projectionMatrix) )
+		# Las matrices de la camara llegan por el bloque FrameUniforms, que el
+		# Renderer actualiza al empezar el frame
+		self.shaders.Use()
 		
-		glDepthMask(GL_FALSE)
+		state.DepthMask(False)
 		
 		# Bind textura según tipo
 		if self.is360:
-			glBindTexture(GL_TEXTURE_2D, self.texture)
+			state.BindTexture(GL_TEXTURE_2D, self.texture)
 		else:
-			glBindTexture(GL_TEXTURE_CUBE_MAP, self.texture)
-		
-		glBindBuffer(GL_ARRAY_BUFFER, self.VBO)
-		
-		glBufferData(GL_ARRAY_BUFFER,
-					 self.vertexBuffer.nbytes,
-					 self.vertexBuffer,
-					 GL_STATIC_DRAW)
-		
-		glEnableVertexAttribArray(0)
-		
-		glVertexAttribPointer(0,
-							  3,
-							  GL_FLOAT,
-							  GL_FALSE,
-							  4 * 3,
-							  ctypes.c_void_p(0) )
+			state.BindTexture(GL_TEXTURE_CUBE_MAP, self.texture)
 		
+		state.BindVertexArray(self.VAO)
 		
 		glDrawArrays(GL_TRIANGLES, 0, 36)
 		
-		glDisableVertexAttribArray(0)
+		state.BindVertexArray(0)
 
-		glDepthMask(GL_TRUE)
+		state.DepthMask(True)
 		
@@ -0,0 +1,336 @@
+import os
+
+from collections import OrderedDict
+
+from OpenGL.GL import *
+from OpenGL.GL.EXT.texture_compression_s3tc import GL_COMPRESSED_RGB_S3TC_DXT1_EXT, GL_COMPRESSED_RGBA_S3TC_DXT5_EXT
+from OpenGL.raw.GL.VERSION.GL_1_3 import glGetCompressedTexImage as glGetCompressedTexImageRaw
+
+import pygame
+
+from numpy import empty, frombuffer, stack, uint8
+
+from glState import state
+from imageCache import ImageCache, MipChain
+
+
+# Cache en disco de imagenes decodificadas con sus mipmaps; None para desactivarlo
+imageCache = ImageCache()
+
+
+def DecodeTexture(filename, format = None, flip = True):
+	"""Decodifica una imagen para glTexImage2D, sin tocar GL: devuelve los
+	pixeles (invertidos en Y si flip), el tamaño, el formato y la cadena de
+	mipmaps. format fuerza GL_RGB o GL_RGBA; con None se usa RGBA si la imagen
+	tiene alpha o es PNG. Si la imagen ya esta en imageCache no se decodifica"""
+	variant = "%s-%s" % (format, flip)
+	if imageCache is not None:
+		image = imageCache.Load(filename, variant)
+		if image is not None:
+			return image
+
+	# El archivo se describe antes de leerlo, igual que los OBJ (ver ReadMesh)
+	sources = [imageCache.Describe(filename)] if imageCache is not None else None
+	textureSurface = pygame.image.load(filename)
+
+	# Detectar si la imagen tiene canal alpha (transparencia)
+	if format is None:
+		if textureSurface.get_alpha() is not None or filename.lower().endswith('.png'):
+			format = GL_RGBA
+		else:
+			format = GL_RGB
+
+	width, height = textureSurface.get_width(), textureSurface.get_height()
+	channels = 4 if format == GL_RGBA else 3
+	pixels = frombuffer(pygame.image.tostring(textureSurface, "RGBA" if format == GL_RGBA else "RGB", flip),
+						dtype = uint8).reshape(height, width, channels)
+
+	image = {'data': pixels,
+			 'width': width,
+			 'height': height,
+			 'format': format,
+			 'levels': [{'width': level.shape[1], 'height': level.shape[0], 'data': level}
+						for level in MipChain(pixels)],
+			 'source': filename,
+			 'sources': sources,
+			 'variant': variant}
+
+	if imageCache is not None:
+		imageCache.Store(filename, variant, image)
+	return image
+
+
+def UploadLevels(target, image, internalFormat = None):
+	"""Sube toda la cadena de mipmaps de image (calculada por DecodeTexture) a
+	la textura enlazada en target, nivel por nivel"""
+	if internalFormat is None:
+		internalFormat = image['format']
+
+	# Las filas RGB de los niveles chicos no estan alineadas a 4 bytes
+	glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+	for level, data in enumerate(image['levels']):
+		glTexImage2D(target,
+					 level,
+					 internalFormat,
+					 data['width'],
+					 data['height'],
+					 0,
+					 image['format'],
+					 GL_UNSIGNED_BYTE,
+					 data['data'])
+	glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+
+	glTexParameteri(target, GL_TEXTURE_MAX_LEVEL, len(image['levels']) - 1)
+
+
+def ImagePixels(image):
+	"""Pixeles RGBA (alto, ancho, 4) de una imagen decodificada por DecodeTexture"""
+	channels = 4 if image['format'] == GL_RGBA else 3
+	pixels = frombuffer(image['data'], dtype = uint8).reshape(image['height'], image['width'], channels)
+	if channels == 4:
+		return pixels
+
+	rgba = empty((image['height'], image['width'], 4), dtype = uint8)
+	rgba[:, :, :3] = pixels
+	rgba[:, :, 3] = 255
+	return rgba
+
+
+def StackImages(images):
+	"""Junta imagenes del mismo tamaño en una sola imagen RGBA de varias capas,
+	para un GL_TEXTURE_2D_ARRAY"""
+	return {'data': stack([ImagePixels(image) for image in images]).tobytes(),
+			'width': images[0]['width'],
+			'height': images[0]['height'],
+			'layers': len(images),
+			'format': GL_RGBA}
+
+
+class TextureCache(object):
+	"""Registro de texturas compartido por todos los modelos del proceso.
+
+	Cada textura se identifica por su ruta resuelta y su formato, asi que dos
+	modelos (o dos instancias del mismo) que usan la misma imagen la decodifican
+	y suben una sola vez. Acquire() suma una referencia y Release() la resta;
+	las texturas sin referencias quedan en la GPU para reusarlas hasta que el
+	total pasa de budget bytes, y entonces se borran (glDeleteTextures) de la
+	menos usada recientemente a la mas reciente."""
+
+	def __init__(self, budget = 256 * 1024 * 1024, compress = False):
+		# Memoria de video aproximada permitida, en bytes (None = sin limite)
+		self.budget = budget
+
+		# Comprimir por bloques (S3TC) las texturas que vienen de un archivo.
+		# La primera vez comprime el driver y los bloques se guardan en imageCache
+		self.compress = compress
+		self.compressedFormats = None
+
+		# key -> entrada, de la menos a la mas usada recientemente
+		self.entries = OrderedDict()
+
+		# texture id -> key
+		self.keys = {}
+
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+
+	def Key(self, filename, format = None):
+		return (os.path.realpath(filename), format)
+
+
+	def Contains(self, filename, format = None):
+		return self.Key(filename, format) in self.entries
+
+
+	def Acquire(self, filename, image = None, format = None):
+		"""Devuelve el id de la textura para filename, subiendola si hace falta.
+		image es la imagen ya decodificada (por ejemplo en otro hilo); si no se
+		da, se decodifica aqui"""
+		key = self.Key(filename, format)
+		entry = self.Lookup(key)
+		if entry is None:
+			if image is None:
+				image = DecodeTexture(filename, format)
+			entry = self.Insert(key, image)
+		return entry['texture']
+
+
+	def Lookup(self, key):
+		"""Entrada ya residente para key (sumandole una referencia), o None.
+		Sirve para texturas que no salen de un solo archivo, como los atlas"""
+		entry = self.entries.get(key)
+		if entry is None:
+			self.misses += 1
+			return None
+
+		self.hits += 1
+		self.entries.move_to_end(key)
+		entry['references'] += 1
+		return entry
+
+
+	def Insert(self, key, image, info = None):
+		"""Sube image con una referencia; info queda guardado en la entrada"""
+		entry = {'texture': self.Upload(image),
+				 'size': self.ImageSize(image),
+				 'references': 1,
+				 'info': info}
+		self.entries[key] = entry
+		self.keys[entry['texture']] = key
+		self.size += entry['size']
+		self.Evict()
+		return entry
+
+
+	def Release(self, texture):
+		"""Suelta una referencia a la textura. Queda en la GPU mientras entre
+		en el presupuesto"""
+		key = self.keys.get(texture)
+		if key is None:
+			return
+
+		entry = self.entries[key]
+		entry['references'] = max(entry['references'] - 1, 0)
+		self.Evict()
+
+
+	def Evict(self, budget = None):
+		"""Borra texturas sin referencias, de la menos usada recientemente en
+		adelante, hasta entrar en el presupuesto"""
+		if budget is None:
+			budget = self.budget
+		if budget is None:
+			return
+
+		for key in list(self.entries):
+			if self.size <= budget:
+				break
+
+			entry = self.entries[key]
+			if entry['references'] == 0:
+				self.Delete(key)
+				self.evictions += 1
+
+
+	def Purge(self):
+		"""Borra todas las texturas que ya no tienen referencias"""
+		self.Evict(0)
+
+
+	def Delete(self, key):
+		entry = self.entries.pop(key)
+		del self.keys[entry['texture']]
+		self.size -= entry['size']
+		state.DeleteTextures([entry['texture']])
+
+
+	def Upload(self, image):
+		"""Sube a la GPU una imagen decodificada por DecodeTexture, o de varias
+		capas (StackImages) como GL_TEXTURE_2D_ARRAY"""
+		texture = glGenTextures(1)
+
+		if 'layers' in image:
+			state.BindTexture(GL_TEXTURE_2D_ARRAY, texture)
+
+			glTexImage3D(GL_TEXTURE_2D_ARRAY,
+						 0,
+						 image['format'],
+						 image['width'],
+						 image['height'],
+						 image['layers'],
+						 0,
+						 image['format'],
+						 GL_UNSIGNED_BYTE,
+						 image['data'])
+
+			glGenerateMipmap(GL_TEXTURE_2D_ARRAY)
+
+			return texture
+
+		state.BindTexture(GL_TEXTURE_2D, texture)
+
+		# Mipmaps ya calculados (por ejemplo desde imageCache): nivel por nivel
+		if 'levels' in image and 'maxLevel' not in image:
+			if not self.compress or not self.UploadCompressed(image):
+				UploadLevels(GL_TEXTURE_2D, image)
+			return texture
+
+		glTexImage2D(GL_TEXTURE_2D,
+					 0,
+					 image['format'],
+					 image['width'],
+					 image['height'],
+					 0,
+					 image['format'],
+					 GL_UNSIGNED_BYTE,
+					 image['data'])
+
+		# Algunas imagenes (los atlas) limitan sus niveles de mipmap
+		if 'maxLevel' in image:
+			glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, image['maxLevel'])
+
+		glGenerateMipmap(GL_TEXTURE_2D)
+
+		return texture
+
+
+	def UploadCompressed(self, image):
+		"""Sube image comprimida en bloques S3TC. Devuelve False si el driver no
+		tiene el formato"""
+		if image['format'] == GL_RGBA:
+			internalFormat = GL_COMPRESSED_RGBA_S3TC_DXT5_EXT
+		else:
+			internalFormat = GL_COMPRESSED_RGB_S3TC_DXT1_EXT
+
+		if self.compressedFormats is None:
+			count = glGetIntegerv(GL_NUM_COMPRESSED_TEXTURE_FORMATS)
+			self.compressedFormats = set(int(format) for format in glGetIntegerv(GL_COMPRESSED_TEXTURE_FORMATS)) if count else set()
+		if internalFormat not in self.compressedFormats:
+			return False
+
+		variant = "%s-s3tc" % image.get('variant')
+		compressed = None
+		if imageCache is not None and 'source' in image:
+			compressed = imageCache.Load(image['source'], variant)
+
+		if compressed is not None:
+			for level, data in enumerate(compressed['levels']):
+				glCompressedTexImage2D(GL_TEXTURE_2D, level, internalFormat,
+									   data['width'], data['height'], 0, data['data'])
+			glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(compressed['levels']) - 1)
+			return True
+
+		# Primera vez: comprime el driver al subir y se leen los bloques
+		UploadLevels(GL_TEXTURE_2D, image, internalFormat)
+
+		if imageCache is not None and 'source' in image:
+			levels = []
+			for level, data in enumerate(image['levels']):
+				blocks = empty(glGetTexLevelParameteriv(GL_TEXTURE_2D, level, GL_TEXTURE_COMPRESSED_IMAGE_SIZE), dtype = uint8)
+				glGetCompressedTexImageRaw(GL_TEXTURE_2D, level, ctypes.c_void_p(blocks.ctypes.data))
+				levels.append({'width': data['width'], 'height': data['height'], 'data': blocks})
+
+			imageCache.Store(image['source'], variant, {'data': levels[0]['data'],
+														'width': image['width'],
+														'height': image['height'],
+														'format': image['format'],
+														'compressed': internalFormat,
+														'levels': levels,
+														'sources': image.get('sources')})
+		return True
+
+
+	def ImageSize(self, image):
+		# Nivel base mas un tercio para la cadena de mipmaps
+		channels = 4 if image['format'] == GL_RGBA else 3
+		return image['width'] * image['height'] * image.get('layers', 1) * channels * 4 // 3
+
+
+	def Report(self):
+		lookups = self.hits + self.misses
+		return ("Texturas: %d aciertos, %d fallos (%.0f%% aciertos), %d residentes, %.1f MB, %d desalojadas"
+				% (self.hits, self.misses, 100.0 * self.hits / lookups if lookups else 0.0,
+				   len(self.entries), self.size / (1024.0 * 1024.0), self.evictions))
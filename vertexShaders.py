@@ -13,13 +13,23 @@ out vec2 fragTexCoords;
 out vec3 fragNormal;
 out vec4 fragPosition;
 
+#include "TextureArrayVertex"
+
 uniform mat4 modelMatrix;
-uniform mat4 viewMatrix;
-uniform mat4 projectionMatrix;
+
+#include "FrameUniforms"
+
+#include "InstancedVertex"
+
+#include "BatchedVertex"
 
 
 void main()
 {
+#include "BatchedVertexMain"
+
+#include "InstancedVertexMain"
+
     gl_Position = projectionMatrix * viewMatrix * modelMatrix * vec4(inPosition, 1.0);
 
     fragPosition = modelMatrix * vec4(inPosition, 1.0);
@@ -27,6 +37,8 @@ void main()
     fragNormal = normalize( vec3(modelMatrix * vec4(inNormals, 0.0)));
 
     fragTexCoords = inTexCoords;
+
+#include "TextureArrayVertexMain"
 }
 
 '''
@@ -44,11 +56,15 @@ out vec2 fragTexCoords;
 out vec3 fragNormal;
 out vec4 fragPosition;
 
+#include "TextureArrayVertex"
+
 uniform mat4 modelMatrix;
-uniform mat4 viewMatrix;
-uniform mat4 projectionMatrix;
-uniform float time;
-uniform float value;
+
+#include "FrameUniforms"
+
+#include "InstancedVertex"
+
+#include "BatchedVertex"
 
 // Función para rotar un vector alrededor de un eje
 vec3 rotateAroundAxis(vec3 p, vec3 axis, float angle) {
@@ -68,6 +84,10 @@ vec3 rotateAroundAxis(vec3 p, vec3 axis, float angle) {
 
 void main()
 {
+#include "BatchedVertexMain"
+
+#include "InstancedVertexMain"
+
     vec3 pos = inPosition;
     vec3 normal = inNormals;
     
@@ -85,7 +105,7 @@ void main()
     float angle1 = dist1 * foldStrength * 0.12;
     
     // Animación muy suave
-    angle1 += sin(time * 0.8) * 0.05;
+    angle1 += sin(instanceTime * 0.8) * 0.05;
     
     // Aplicar rotación alrededor del eje Y
     vec3 toCenter1 = pos - foldCenter1;
@@ -103,7 +123,7 @@ void main()
     // Doblez basado en la posición Y
     float dist2 = abs(pos.y);
     float angle2 = dist2 * foldStrength * 0.08;
-    angle2 += sin(time * 0.6 + 1.5) * 0.04;
+    angle2 += sin(instanceTime * 0.6 + 1.5) * 0.04;
     
     vec3 toCenter2 = pos - foldCenter2;
     vec3 folded2 = rotateAroundAxis(toCenter2, foldAxis2, angle2);
@@ -117,6 +137,8 @@ void main()
     
     fragNormal = normalize(vec3(modelMatrix * vec4(normal, 0.0)));
     fragTexCoords = inTexCoords;
+
+#include "TextureArrayVertexMain"
 }
 '''
 
@@ -133,14 +155,22 @@ out vec2 fragTexCoords;
 out vec3 fragNormal;
 out vec4 fragPosition;
 
+#include "TextureArrayVertex"
+
 uniform mat4 modelMatrix;
-uniform mat4 viewMatrix;
-uniform mat4 projectionMatrix;
-uniform float time;
-uniform float value;
+
+#include "FrameUniforms"
+
+#include "InstancedVertex"
+
+#include "BatchedVertex"
 
 void main()
 {
+#include "BatchedVertexMain"
+
+#include "InstancedVertexMain"
+
     vec3 pos = inPosition;
     
     // Amplitud controlada por value
@@ -148,7 +178,7 @@ void main()
     
     // Onda principal que viaja de abajo hacia arriba
     // Usa la posición Y del vértice para determinar la fase de la onda
-    float wave = sin(pos.y * 3.0 - time * 4.0) * amplitude;
+    float wave = sin(pos.y * 3.0 - instanceTime * 4.0) * amplitude;
     
     // Aplicar el desplazamiento en X y Z de forma uniforme
     // Esto hace que todo el objeto oscile junto
@@ -156,19 +186,21 @@ void main()
     pos.z += wave * 0.3;
     
     // También agregar un movimiento suave en Y para énfasis
-    pos.y += cos(pos.y * 2.0 - time * 4.0) * amplitude * 0.2;
+    pos.y += cos(pos.y * 2.0 - instanceTime * 4.0) * amplitude * 0.2;
     
     fragPosition = modelMatrix * vec4(pos, 1.0);
     gl_Position = projectionMatrix * viewMatrix * fragPosition;
     
     // Calcular normal modificada basada en la derivada de la onda
-    float derivative = cos(pos.y * 3.0 - time * 4.0) * 3.0 * amplitude;
+    float derivative = cos(pos.y * 3.0 - instanceTime * 4.0) * 3.0 * amplitude;
     
     vec3 tangentY = vec3(derivative * 0.3, 1.0, derivative * 0.3);
     vec3 modifiedNormal = normalize(cross(vec3(1.0, 0.0, 0.0), tangentY));
     
     fragNormal = normalize(vec3(modelMatrix * vec4(modifiedNormal, 0.0)));
     fragTexCoords = inTexCoords;
+
+#include "TextureArrayVertexMain"
 }
 '''
 
@@ -185,11 +217,15 @@ out vec2 fragTexCoords;
 out vec3 fragNormal;
 out vec4 fragPosition;
 
+#include "TextureArrayVertex"
+
 uniform mat4 modelMatrix;
-uniform mat4 viewMatrix;
-uniform mat4 projectionMatrix;
-uniform float time;
-uniform float value;
+
+#include "FrameUniforms"
+
+#include "InstancedVertex"
+
+#include "BatchedVertex"
 
 // Función para rotar alrededor del eje Y
 vec3 rotateY(vec3 p, float angle) {
@@ -204,6 +240,10 @@ vec3 rotateY(vec3 p, float angle) {
 
 void main()
 {
+#include "BatchedVertexMain"
+
+#include "InstancedVertexMain"
+
     vec3 pos = inPosition;
     
     // Centro del vórtice
@@ -222,7 +262,7 @@ void main()
     // 3. Tiempo (animación continua)
     float angle = distFromCenter * vortexStrength * 0.2;  // Reducido de 0.5 a 0.2
     angle += pos.y * vortexStrength * 0.15;  // Reducido de 0.3 a 0.15
-    angle += time * 1.0;  // Reducido de 2.0 a 1.0
+    angle += instanceTime * 1.0;  // Reducido de 2.0 a 1.0
     
     // Aplicar rotación alrededor del eje Y
     pos = rotateY(pos, angle);
@@ -234,14 +274,14 @@ void main()
     
     // La fuerza de succión disminuye con la distancia
     float pullFactor = pullStrength / (1.0 + distFromCenter * 2.0);
-    pos += pullDirection * pullFactor * sin(time * 1.5) * 0.3;  // Reducido de 0.5 a 0.3
+    pos += pullDirection * pullFactor * sin(instanceTime * 1.5) * 0.3;  // Reducido de 0.5 a 0.3
     
     // Efecto de espiral vertical REDUCIDO
-    float spiral = sin(angle * 2.0 - time * 3.0) * 0.08 * value;  // Reducido de 0.2 a 0.08
+    float spiral = sin(angle * 2.0 - instanceTime * 3.0) * 0.08 * value;  // Reducido de 0.2 a 0.08
     pos.y += spiral;
     
     // Efecto de pulsación radial REDUCIDO
-    float pulse = sin(time * 2.5 + distFromCenter * 3.0) * 0.04 * value;  // Reducido de 0.1 a 0.04
+    float pulse = sin(instanceTime * 2.5 + distFromCenter * 3.0) * 0.04 * value;  // Reducido de 0.1 a 0.04
     pos += normalize(toCenter) * pulse;
     
     fragPosition = modelMatrix * vec4(pos, 1.0);
@@ -256,6 +296,8 @@ void main()
     
     fragNormal = normalize(vec3(modelMatrix * vec4(rotatedNormal, 0.0)));
     fragTexCoords = inTexCoords;
+
+#include "TextureArrayVertexMain"
 }
 '''
 
@@ -274,17 +316,24 @@ out vec2 fragTexCoords;
 out vec3 fragNormal;
 out vec4 fragPosition;
 
+#include "TextureArrayVertex"
+
 uniform mat4 modelMatrix;
-uniform mat4 viewMatrix;
-uniform mat4 projectionMatrix;
 
-uniform float time;
-uniform float value;
+#include "FrameUniforms"
+
+#include "InstancedVertex"
+
+#include "BatchedVertex"
 
 
 void main()
 {
-    float displacement = sin(time + inPosition.x + inPosition.z) * value;
+#include "BatchedVertexMain"
+
+#include "InstancedVertexMain"
+
+    float displacement = sin(instanceTime + inPosition.x + inPosition.z) * value;
     fragPosition = modelMatrix * vec4(inPosition + vec3(0,displacement, 0)  , 1.0);
 
     gl_Position = projectionMatrix * viewMatrix * fragPosition;
@@ -292,6 +341,8 @@ void main()
     fragNormal = normalize( vec3(modelMatrix * vec4(inNormals, 0.0)));
 
     fragTexCoords = inTexCoords;
+
+#include "TextureArrayVertexMain"
 }
 
 '''